@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Reconstruction Cache
+Finished reconstructions are stored under a key derived from the video's
+SHA-256, the pipeline version and every stage's parameters. A repeat
+upload of the same video with the same settings restores the frames,
+database, sparse model and exports into the new job directory instead of
+running COLMAP again.
+
+- Entries: {root}/entries/{key[:2]}/{key}/ (artifacts + entry.json),
+  staged in {root}/tmp/ and renamed into place
+- Files are hardlinked both ways (reflink/copy across filesystems), except
+  COPIED_ARTIFACTS which are modified in place and must not share an inode
+- Size-bounded: least recently used entries are evicted past max_bytes
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_ROOT = Path(os.getenv("ARTIFACT_CACHE_DIR", "/workspace/cache"))
+CACHE_MAX_BYTES = int(float(os.getenv("ARTIFACT_CACHE_MAX_GB", "50")) * 1024 ** 3)  # 0 disables the cache
+
+ENTRY_FILE = "entry.json"
+JOB_PATH_TOKEN = "{job_path}"
+FICLONE = 0x40049409           # Linux ioctl: reflink (copy-on-write clone) a whole file
+
+# Job artifacts worth restoring, relative to the job directory
+CACHED_ARTIFACTS = ["images", "keyframes.json", "database.db", "sparse", "point_cloud.ply", "tiles"]
+# SQLite updates these in place (e.g. reset_matches), so never hardlink them
+COPIED_ARTIFACTS = {"database.db"}
+
+
+def cache_key(video_sha256: str, pipeline_version: int, params: Dict) -> str:
+    """Key for a video + pipeline version + stage parameters (canonical JSON, SHA-256)"""
+    payload = json.dumps(
+        {"video_sha256": video_sha256, "pipeline_version": pipeline_version, "params": params},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _copy(source: Path, target: Path):
+    """Reflink where the filesystem supports it (btrfs, XFS), plain copy otherwise"""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            shutil.copyfileobj(src, dst, length=8 * 1024 * 1024)
+    shutil.copystat(source, target)
+
+
+def _link(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except OSError:
+        _copy(source, target)
+
+
+def _clone_tree(source: Path, target: Path, copy: bool = False) -> int:
+    """Recreate a file or directory tree with links (or copies); returns the bytes it holds"""
+    clone = _copy if copy else _link
+    if source.is_file():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        clone(source, target)
+        return source.stat().st_size
+    total = 0
+    for directory, _, files in os.walk(source):
+        relative = Path(directory).relative_to(source)
+        (target / relative).mkdir(parents=True, exist_ok=True)
+        for name in files:
+            clone(Path(directory) / name, target / relative / name)
+            total += (Path(directory) / name).stat().st_size
+    return total
+
+
+def _remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class ArtifactCache:
+    """Size-bounded LRU store of finished reconstructions (see module docstring)"""
+
+    def __init__(self, root: Path = CACHE_ROOT, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / "entries" / key[:2] / key
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across worker processes (restore vs. store/evict)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def restore(self, key: str, job_path: Path) -> Optional[Dict]:
+        """
+        Link a cached entry's artifacts into job_path (replacing what is there)
+        Returns the per-stage results recorded with the entry, or None on a miss.
+        """
+        job_path = Path(job_path)
+        entry_path = self._entry_path(key)
+        with self._locked():
+            try:
+                with open(entry_path / ENTRY_FILE) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+
+            for artifact in entry["artifacts"]:
+                target = job_path / artifact
+                _remove(target)
+                _clone_tree(entry_path / artifact, target, copy=artifact in COPIED_ARTIFACTS)
+            os.utime(entry_path / ENTRY_FILE)  # Mark as recently used
+
+        logger.info(f"Restored reconstruction {key[:12]} from cache into {job_path}")
+        results = json.dumps(entry["results"]).replace(JOB_PATH_TOKEN, str(job_path))
+        return json.loads(results)
+
+    def store(self, key: str, job_path: Path, results: Dict, artifacts: List[str] = CACHED_ARTIFACTS) -> bool:
+        """Add a finished job's artifacts under key, then evict down to max_bytes"""
+        job_path = Path(job_path)
+        entry_path = self._entry_path(key)
+        # Staged outside entries/ so a half-built entry is never listed or evicted
+        tmp_path = self.root / "tmp" / f"{key}.{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        present = [artifact for artifact in artifacts if (job_path / artifact).exists()]
+        size = 0
+        for artifact in present:
+            size += _clone_tree(job_path / artifact, tmp_path / artifact, copy=artifact in COPIED_ARTIFACTS)
+        if size > self.max_bytes:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            logger.info(f"Reconstruction {key[:12]} ({size} bytes) exceeds the cache size, not cached")
+            return False
+
+        entry = {
+            "key": key,
+            "artifacts": present,
+            "size_bytes": size,
+            "created_at": time.time(),
+            "results": json.loads(json.dumps(results).replace(str(job_path), JOB_PATH_TOKEN)),
+        }
+        with open(tmp_path / ENTRY_FILE, "w") as f:
+            json.dump(entry, f)
+
+        with self._locked():
+            if entry_path.exists():
+                shutil.rmtree(entry_path)
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, entry_path)
+            self._evict()
+        logger.info(f"Cached reconstruction {key[:12]} ({size} bytes)")
+        return True
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        for entry_file in self.root.glob(f"entries/*/*/{ENTRY_FILE}"):
+            try:
+                with open(entry_file) as f:
+                    size = json.load(f)["size_bytes"]
+                entries.append({"path": entry_file.parent, "size": size, "last_used": entry_file.stat().st_mtime})
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def _evict(self):
+        """Drop least recently used entries until the total fits max_bytes (caller holds the lock)"""
+        entries = sorted(self._entries(), key=lambda e: e["last_used"])
+        total = sum(e["size"] for e in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry["path"], ignore_errors=True)
+            total -= entry["size"]
+            logger.info(f"Evicted cached reconstruction {entry['path'].name[:12]} ({entry['size']} bytes)")
+
+    def stats(self) -> Dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(e["size"] for e in entries),
+            "max_bytes": self.max_bytes,
+        }
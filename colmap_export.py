@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+In-process COLMAP Model Export
+Writes PLY / TXT / BIN exports straight from the NumPy model reader
+(colmap_model), without starting a `colmap model_converter` process.
+Reference: https://colmap.github.io/format.html
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from colmap_model import (
+    CAMERA_MODELS,
+    read_cameras_binary,
+    read_images_binary,
+    read_points3D_binary,
+)
+
+logger = logging.getLogger(__name__)
+
+TEXT_CHUNK_ROWS = 65536        # Rows formatted per write for TXT exports
+MODEL_FILES = ("cameras.bin", "images.bin", "points3D.bin")
+
+
+def _write_all(path: Path, buffers: List[bytes]):
+    """
+    Write buffers with a single writev where possible (large writes may be
+    partial) into a temp file that replaces path, so readers never see a
+    half-written export
+    """
+    tmp_path = Path(f"{path}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        views = [memoryview(b).cast("B") for b in buffers]
+        written = os.writev(fd, views)
+        for view in views:
+            if written >= len(view):
+                written -= len(view)
+                continue
+            remaining = view[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
+            written = 0
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+# NumPy dtype kind/size -> PLY property type
+_PLY_TYPES = {
+    ("f", 4): "float", ("f", 8): "double",
+    ("u", 1): "uchar", ("u", 2): "ushort", ("u", 4): "uint",
+    ("i", 1): "char", ("i", 2): "short", ("i", 4): "int",
+}
+
+
+def write_ply_vertices(output_file: Path, vertices: np.ndarray):
+    """
+    Write a structured vertex array as binary little-endian PLY
+    Property names and types come from the array's (little-endian) fields.
+    """
+    properties = []
+    for name in vertices.dtype.names:
+        field = vertices.dtype.fields[name][0]
+        properties.append(f"property {_PLY_TYPES[(field.kind, field.itemsize)]} {name}")
+
+    header = "\n".join(
+        ["ply", "format binary_little_endian 1.0", f"element vertex {len(vertices)}"]
+        + properties
+        + ["end_header", ""]
+    ).encode("ascii")
+
+    _write_all(output_file, [header, np.ascontiguousarray(vertices)])
+
+
+def write_ply(model_dir: Path, output_file: Path,
+              include_error: bool = False, include_track_length: bool = False) -> int:
+    """
+    Export 3D points as binary little-endian PLY (x, y, z, red, green, blue)
+
+    Optional per-vertex properties: reprojection error and track length.
+    Returns the number of points written.
+    """
+    parsed = read_points3D_binary(Path(model_dir) / "points3D.bin", include_tracks=False)
+    points = parsed["points"]
+
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+              ("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    if include_error:
+        fields.append(("error", "<f4"))
+    if include_track_length:
+        fields.append(("track_length", "<u4"))
+
+    vertices = np.empty(len(points), dtype=np.dtype(fields))
+    vertices["x"], vertices["y"], vertices["z"] = points["xyz"].T
+    vertices["red"], vertices["green"], vertices["blue"] = points["rgb"].T
+    if include_error:
+        vertices["error"] = points["error"]
+    if include_track_length:
+        vertices["track_length"] = np.diff(parsed["track_offsets"])
+
+    write_ply_vertices(output_file, vertices)
+    logger.info(f"Wrote {len(points)} points to {output_file}")
+    return len(points)
+
+
+def _format_points3D_rows(parsed: Dict, start: int, end: int) -> List[str]:
+    """
+    Format points3D.txt rows [start, end)
+
+    Rows are grouped by track length so each group is formatted with one
+    precomposed %-template per row instead of per-value formatting.
+    """
+    points = parsed["points"][start:end]
+    track_offsets = parsed["track_offsets"]
+    lengths = np.diff(track_offsets[start:end + 1])
+    rows: List[str] = [""] * (end - start)
+
+    for length in np.unique(lengths).tolist():
+        members = np.flatnonzero(lengths == length)
+        values = np.empty((len(members), 8 + 2 * length), dtype=np.float64)
+        selected = points[members]
+        values[:, 0] = selected["point3D_id"]
+        values[:, 1:4] = selected["xyz"]
+        values[:, 4:7] = selected["rgb"]
+        values[:, 7] = selected["error"]
+        if length:
+            elements = track_offsets[start + members][:, None] + np.arange(length)
+            values[:, 8::2] = parsed["track_image_ids"][elements]
+            values[:, 9::2] = parsed["track_point2D_idxs"][elements]
+
+        # COLMAP writes doubles with 17 significant digits
+        template = "%d %.17g %.17g %.17g %d %d %d %.17g" + " %d %d" * length + "\n"
+        for position, row in zip(members.tolist(), values.tolist()):
+            rows[position] = template % tuple(row)
+
+    return rows
+
+
+def write_text_model(model_dir: Path, output_dir: Path) -> Dict:
+    """
+    Export cameras.txt, images.txt and points3D.txt in COLMAP's text format
+    Rows are formatted and written TEXT_CHUNK_ROWS at a time.
+    """
+    model_dir = Path(model_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    cameras = read_cameras_binary(model_dir / "cameras.bin")
+    with open(output_dir / "cameras.txt", "w") as f:
+        f.write("# Camera list with one line of data per camera:\n"
+                "#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n"
+                f"# Number of cameras: {len(cameras)}\n")
+        for camera in cameras:
+            params = " ".join("%.17g" % p for p in camera["params"][:camera["num_params"]])
+            model_name = CAMERA_MODELS[int(camera["model_id"])][0]
+            f.write(f"{camera['camera_id']} {model_name} {camera['width']} {camera['height']} {params}\n")
+
+    images = read_images_binary(model_dir / "images.bin")
+    offsets = images["point2D_offsets"]
+    xy = images["point2D_xy"]
+    point3D_ids = images["point2D_point3D_ids"]
+    num_images = len(images["names"])
+    mean_observations = float((point3D_ids != -1).sum()) / num_images if num_images else 0.0
+    with open(output_dir / "images.txt", "w") as f:
+        f.write("# Image list with two lines of data per image:\n"
+                "#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME\n"
+                "#   POINTS2D[] as (X, Y, POINT3D_ID)\n"
+                f"# Number of images: {num_images}, mean observations per image: {mean_observations}\n")
+        rows = []
+        for i, (image, name) in enumerate(zip(images["images"], images["names"])):
+            pose = " ".join("%.17g" % v for v in (*image["qvec"], *image["tvec"]))
+            start, end = offsets[i], offsets[i + 1]
+            observations = " ".join(
+                "%.17g %.17g %d" % (x, y, pid) for (x, y), pid in zip(xy[start:end].tolist(), point3D_ids[start:end].tolist())
+            )
+            rows.append(f"{image['image_id']} {pose} {image['camera_id']} {name}\n{observations}\n")
+            if len(rows) >= TEXT_CHUNK_ROWS:
+                f.writelines(rows)
+                rows = []
+        f.writelines(rows)
+
+    parsed = read_points3D_binary(model_dir / "points3D.bin")
+    points = parsed["points"]
+    track_offsets = parsed["track_offsets"]
+    num_points = len(points)
+    mean_track = float(track_offsets[-1]) / num_points if num_points else 0.0
+    with open(output_dir / "points3D.txt", "w") as f:
+        f.write("# 3D point list with one line of data per point:\n"
+                "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
+                f"# Number of points: {num_points}, mean track length: {mean_track}\n")
+        for start in range(0, num_points, TEXT_CHUNK_ROWS):
+            end = min(start + TEXT_CHUNK_ROWS, num_points)
+            f.writelines(_format_points3D_rows(parsed, start, end))
+
+    logger.info(f"Wrote text model ({len(cameras)} cameras, {num_images} images, {num_points} points) to {output_dir}")
+    return {"num_cameras": len(cameras), "num_images": num_images, "num_points": num_points}
+
+
+def write_binary_model(model_dir: Path, output_dir: Path):
+    """
+    Export the native binary model: hardlink the files (copy across filesystems)
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name in MODEL_FILES:
+        source = Path(model_dir) / name
+        target = output_dir / name
+        target.unlink(missing_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+
+def is_up_to_date(output: Path, model_dir: Path) -> bool:
+    """True if an export exists and is newer than every file of its source model"""
+    output = Path(output)
+    if not output.exists():
+        return False
+    outputs = [p for p in output.iterdir() if p.is_file()] if output.is_dir() else [output]
+    if not outputs:
+        return False
+    oldest_output = min(p.stat().st_mtime_ns for p in outputs)
+    sources = [Path(model_dir) / name for name in MODEL_FILES if (Path(model_dir) / name).exists()]
+    return all(p.stat().st_mtime_ns <= oldest_output for p in sources)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+COLMAP Sparse Model Reader (cameras.bin / images.bin / points3D.bin)
+Memory-mapped NumPy parser for COLMAP's binary model format.
+Reference: https://colmap.github.io/format.html#binary-file-format
+
+Variable-length lists (2D points per image, track per 3D point) are returned
+in CSR form: an offsets array of length n+1 plus flat value arrays, so the
+entries of item i are values[offsets[i]:offsets[i + 1]].
+"""
+
+import logging
+import struct
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Camera model id -> (name, number of parameters)
+# Reference: https://colmap.github.io/cameras.html
+CAMERA_MODELS = {
+    0: ("SIMPLE_PINHOLE", 3),
+    1: ("PINHOLE", 4),
+    2: ("SIMPLE_RADIAL", 4),
+    3: ("RADIAL", 5),
+    4: ("OPENCV", 8),
+    5: ("OPENCV_FISHEYE", 8),
+    6: ("FULL_OPENCV", 12),
+    7: ("FOV", 5),
+    8: ("SIMPLE_RADIAL_FISHEYE", 4),
+    9: ("RADIAL_FISHEYE", 5),
+    10: ("THIN_PRISM_FISHEYE", 12),
+}
+MAX_CAMERA_PARAMS = 12
+
+CAMERA_DTYPE = np.dtype([
+    ("camera_id", "<u4"),
+    ("model_id", "<i4"),
+    ("width", "<u8"),
+    ("height", "<u8"),
+    ("num_params", "<u4"),
+    ("params", "<f8", (MAX_CAMERA_PARAMS,)),
+])
+
+IMAGE_DTYPE = np.dtype([
+    ("image_id", "<u4"),
+    ("qvec", "<f8", (4,)),
+    ("tvec", "<f8", (3,)),
+    ("camera_id", "<u4"),
+])
+
+# On-disk layouts (packed, little-endian)
+_IMAGE_HEADER = np.dtype([("image_id", "<u4"), ("qvec", "<f8", (4,)), ("tvec", "<f8", (3,)), ("camera_id", "<u4")])
+_POINT2D = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+_POINT3D_HEADER = np.dtype([
+    ("point3D_id", "<u8"),
+    ("xyz", "<f8", (3,)),
+    ("rgb", "u1", (3,)),
+    ("error", "<f8"),
+    ("track_length", "<u8"),
+])
+POINT3D_DTYPE = np.dtype([
+    ("point3D_id", "<u8"),
+    ("xyz", "<f8", (3,)),
+    ("rgb", "u1", (3,)),
+    ("error", "<f8"),
+])
+_TRACK_LENGTH_OFFSET = _POINT3D_HEADER.fields["track_length"][1]  # 43
+_UINT64 = struct.Struct("<Q")
+GATHER_CHUNK_RECORDS = 65536
+
+
+def _map(path: Path) -> np.ndarray:
+    """Read-only memory map of a file as bytes (empty array for empty files)"""
+    if Path(path).stat().st_size == 0:
+        return np.empty(0, dtype=np.uint8)
+    # Plain ndarray view of the map: avoids np.memmap's per-slice overhead
+    return np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)
+
+
+def _read_count(path: Path) -> int:
+    with open(path, "rb") as f:
+        header = f.read(8)
+    return _UINT64.unpack(header)[0] if len(header) == 8 else 0
+
+
+def count_points3D(path: Path) -> int:
+    """Exact number of 3D points, read from the points3D.bin header (O(1))"""
+    return _read_count(path)
+
+
+def count_images(path: Path) -> int:
+    """Exact number of registered images, read from the images.bin header (O(1))"""
+    return _read_count(path)
+
+
+def mean_track_length(path: Path) -> float:
+    """
+    Mean track length without parsing: every point has a fixed 51-byte
+    header and 8 bytes per track element, so the file size gives the total.
+    """
+    num_points = count_points3D(path)
+    if num_points == 0:
+        return 0.0
+    track_bytes = Path(path).stat().st_size - 8 - num_points * _POINT3D_HEADER.itemsize
+    return track_bytes / 8 / num_points
+
+
+def _gather_records(buffer: np.ndarray, offsets: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Copy fixed-size records found at arbitrary byte offsets into a structured array"""
+    records = np.empty(len(offsets), dtype=dtype)
+    raw = records.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+    columns = np.arange(dtype.itemsize)
+    # Chunked so the byte index matrix stays small for million-point models
+    for start in range(0, len(offsets), GATHER_CHUNK_RECORDS):
+        chunk = offsets[start:start + GATHER_CHUNK_RECORDS]
+        raw[start:start + len(chunk)] = buffer[chunk[:, None] + columns]
+    return records
+
+
+def read_cameras_binary(path: Path) -> np.ndarray:
+    """Parse cameras.bin into a CAMERA_DTYPE structured array (params zero-padded)"""
+    buffer = _map(path)
+    num_cameras = int(buffer[:8].view("<u8")[0]) if buffer.size else 0
+    cameras = np.zeros(num_cameras, dtype=CAMERA_DTYPE)
+
+    offset = 8
+    for i in range(num_cameras):
+        camera_id, model_id, width, height = struct.unpack_from("<iiQQ", buffer, offset)
+        offset += 24
+        if model_id not in CAMERA_MODELS:
+            raise ValueError(f"Unknown camera model id {model_id} in {path}")
+        num_params = CAMERA_MODELS[model_id][1]
+        cameras[i] = (camera_id, model_id, width, height, num_params, 0)
+        cameras[i]["params"][:num_params] = np.frombuffer(buffer, "<f8", num_params, offset)
+        offset += 8 * num_params
+
+    return cameras
+
+
+def read_images_binary(path: Path) -> Dict:
+    """
+    Parse images.bin
+
+    Returns:
+        images: IMAGE_DTYPE structured array (pose and camera per image)
+        names: list of image names
+        point2D_offsets: CSR offsets into the flat 2D point arrays
+        point2D_xy: float64 (M, 2) keypoint coordinates
+        point2D_point3D_ids: int64 (M,) observed 3D point id (-1 if none)
+    """
+    buffer = _map(path)
+    num_images = int(buffer[:8].view("<u8")[0]) if buffer.size else 0
+    header_size = _IMAGE_HEADER.itemsize
+
+    # Walk the variable-length records once (one iteration per image, not per point)
+    header_offsets = np.empty(num_images, dtype=np.int64)
+    points_offsets = np.empty(num_images, dtype=np.int64)
+    num_points2D = np.empty(num_images, dtype=np.int64)
+    names: List[str] = []
+    raw = memoryview(buffer)
+    offset = 8
+    for i in range(num_images):
+        header_offsets[i] = offset
+        name_start = offset + header_size
+        name_end = bytes(raw[name_start:name_start + 4096]).index(b"\0") + name_start
+        names.append(bytes(raw[name_start:name_end]).decode("utf-8"))
+        num_points2D[i] = _UINT64.unpack_from(raw, name_end + 1)[0]
+        points_offsets[i] = name_end + 9
+        offset = points_offsets[i] + num_points2D[i] * _POINT2D.itemsize
+
+    images = np.zeros(num_images, dtype=IMAGE_DTYPE)
+    if num_images:
+        headers = _gather_records(buffer, header_offsets, _IMAGE_HEADER)
+        for field in IMAGE_DTYPE.names:
+            images[field] = headers[field]
+
+    point2D_offsets = np.zeros(num_images + 1, dtype=np.int64)
+    np.cumsum(num_points2D, out=point2D_offsets[1:])
+    points2D = np.empty(int(point2D_offsets[-1]), dtype=_POINT2D)
+    for i in range(num_images):
+        points2D[point2D_offsets[i]:point2D_offsets[i + 1]] = np.frombuffer(
+            buffer, _POINT2D, int(num_points2D[i]), int(points_offsets[i])
+        )
+
+    return {
+        "images": images,
+        "names": names,
+        "point2D_offsets": point2D_offsets,
+        "point2D_xy": points2D["xy"],
+        "point2D_point3D_ids": points2D["point3D_id"],
+    }
+
+
+def _point3D_record_offsets(raw: memoryview, num_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Byte offset and track length of every point record (one sequential pass)"""
+    # Record i+1 starts where record i's track ends, so this pass is inherently
+    # sequential; it only touches 8 bytes per point and everything else is vectorized
+    unpack_from = _UINT64.unpack_from
+    header_size = _POINT3D_HEADER.itemsize
+    offset = 8 + _TRACK_LENGTH_OFFSET
+    lengths = []
+    append = lengths.append
+    for _ in range(num_points):
+        length = unpack_from(raw, offset)[0]
+        append(length)
+        offset += header_size + 8 * length
+    track_lengths = np.array(lengths, dtype=np.int64)
+    offsets = np.empty(num_points, dtype=np.int64)
+    if num_points:
+        offsets[0] = 8
+        np.cumsum(header_size + 8 * track_lengths[:-1], out=offsets[1:])
+        offsets[1:] += 8
+    return offsets, track_lengths
+
+
+def read_points3D_binary(path: Path, include_tracks: bool = True) -> Dict:
+    """
+    Parse points3D.bin
+
+    Returns:
+        points: POINT3D_DTYPE structured array (id, xyz, rgb, error)
+        track_offsets: CSR offsets into the flat track arrays
+        track_image_ids: int32 image id of each track element
+        track_point2D_idxs: int32 2D point index of each track element
+
+    With include_tracks=False the track elements are not gathered (only
+    track_offsets is returned), which is all a point cloud export needs.
+    """
+    buffer = _map(path)
+    num_points = int(buffer[:8].view("<u8")[0]) if buffer.size else 0
+    record_offsets, track_lengths = _point3D_record_offsets(memoryview(buffer), num_points)
+
+    points = np.empty(num_points, dtype=POINT3D_DTYPE)
+    if num_points:
+        headers = _gather_records(buffer, record_offsets, _POINT3D_HEADER)
+        for field in POINT3D_DTYPE.names:
+            points[field] = headers[field]
+
+    track_offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    num_elements = int(track_offsets[-1])
+    if not include_tracks:
+        return {"points": points, "track_offsets": track_offsets}
+
+    # Byte position of every track element: record start + header + 8 * position in track
+    element_starts = (
+        np.repeat(record_offsets + _POINT3D_HEADER.itemsize - 8 * track_offsets[:-1], track_lengths)
+        + 8 * np.arange(num_elements, dtype=np.int64)
+    )
+    # Records are not 4-byte aligned, so read int32 pairs through one view per alignment phase
+    track_image_ids = np.empty(num_elements, dtype=np.int32)
+    track_point2D_idxs = np.empty(num_elements, dtype=np.int32)
+    phases = element_starts % 4
+    for phase in range(4):
+        selected = phases == phase
+        if not selected.any():
+            continue
+        usable = (buffer.size - phase) // 4 * 4
+        words = buffer[phase:phase + usable].view("<i4")
+        word_index = (element_starts[selected] - phase) // 4
+        track_image_ids[selected] = words[word_index]
+        track_point2D_idxs[selected] = words[word_index + 1]
+
+    return {
+        "points": points,
+        "track_offsets": track_offsets,
+        "track_image_ids": track_image_ids,
+        "track_point2D_idxs": track_point2D_idxs,
+    }
+
+
+def read_model(model_dir: Path) -> Dict:
+    """Parse a complete sparse model directory (sparse/N)"""
+    model_dir = Path(model_dir)
+    return {
+        "cameras": read_cameras_binary(model_dir / "cameras.bin"),
+        **read_images_binary(model_dir / "images.bin"),
+        **read_points3D_binary(model_dir / "points3D.bin"),
+    }
+
+
+def model_stats(model_dir: Path) -> Dict:
+    """
+    Header-only statistics for a sparse model (no full parse)
+    """
+    model_dir = Path(model_dir)
+    points_file = model_dir / "points3D.bin"
+    images_file = model_dir / "images.bin"
+    cameras_file = model_dir / "cameras.bin"
+    return {
+        "num_cameras": _read_count(cameras_file) if cameras_file.exists() else 0,
+        "registered_images": count_images(images_file) if images_file.exists() else 0,
+        "points_3d": count_points3D(points_file) if points_file.exists() else 0,
+        "mean_track_length": round(mean_track_length(points_file), 3) if points_file.exists() else 0.0,
+    }
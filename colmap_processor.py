@@ -6,24 +6,93 @@ Based on: https://colmap.github.io/tutorial.html
 """
 
 import subprocess
+import hashlib
 import os
+import json
+import math
 import logging
+from fractions import Fraction
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from artifact_cache import ArtifactCache, cache_key
+from colmap_export import is_up_to_date, write_binary_model, write_ply, write_text_model
+from colmap_model import count_points3D, model_stats
+from colmap_runner import CommandResult, OutputParser, open_command_log, run_command
+from feature_cache import FeatureCache, hash_images, options_key
+from gpu_config import gpu_available
+from keyframes import (
+    FALLBACK_FRAME_INTERVAL,
+    plan_segments,
+    segment_args,
+    select_filter,
+    select_keyframes,
+    uniform_interval,
+)
+from map_partitions import CLUSTER_IMAGES, PARTITION_MIN_IMAGES, largest_model, temporal_clusters
+from match_shards import (
+    MIN_PAIRS_PER_SHARD,
+    create_shard_database,
+    feature_counts,
+    merge_shard_databases,
+    read_pair_list,
+    shard_pairs,
+)
+from pair_planning import write_match_list
+from pointcloud_tiles import TILE_MAX_POINTS, TILES_VERSION, build_tiles
+from resource_planner import thread_budget
+from stage_manifest import StageManifest
+from video_probe import probe_video
 
 logger = logging.getLogger(__name__)
 
+# Bump when stage behaviour changes so existing checkpoints and cached
+# reconstructions are invalidated
+# 2: spread frame sampling, CPU SIFT profile, retrieval/sharded matching,
+#    partitioned mapping
+PIPELINE_VERSION = 2
+
+# Parallel frame decoding: at most one segment per core, none shorter than this
+FRAME_SEGMENT_MIN_SECONDS = 30
+
+# Uniform samples at least this far apart (seconds) are extracted by seeking
+# to each one, so the video in between is never decoded
+SEEK_MIN_INTERVAL = 4.0
+
+# Rough CPU SIFT memory per thread: bytes per pixel of a max_image_size^2
+# image (float scale space and DoG pyramids, upsampled first octave)
+SIFT_CPU_BYTES_PER_PIXEL = 128
+
+# Pipeline stages and the overall progress (%) reached once each one finishes
+PIPELINE_STAGES = [
+    ("frame_extraction", 10),
+    ("feature_extraction", 35),
+    ("feature_matching", 60),
+    ("sparse_reconstruction", 90),
+    ("export", 95),
+    ("tiling", 100),
+]
+
 
 class COLMAPProcessor:
     """COLMAP 3D Reconstruction Processor"""
     
-    def __init__(self, job_path: str):
+    def __init__(self, job_path: str, progress_callback: Optional[Callable[[str, float, str], None]] = None):
         """
         Initialize COLMAP processor with standard workspace structure
         Reference: https://colmap.github.io/tutorial.html#data-structure
+        
+        progress_callback(stage, fraction, message) receives live progress
+        parsed from COLMAP/ffmpeg output while a stage runs.
         """
         self.job_path = Path(job_path)
+        self.progress_callback = progress_callback
+        self.log_path = self.job_path / "logs" / "colmap.log"  # Rotating subprocess output log
         
         # Standard COLMAP workspace structure
         # Reference: https://colmap.github.io/tutorial.html#data-structure
@@ -45,8 +114,169 @@ class COLMAPProcessor:
         self.dense_path.mkdir(parents=True, exist_ok=True)
         
         logger.info(f"Created COLMAP workspace at {self.job_path}")
-    
-    def extract_frames(self, video_path: str, max_frames: int = 50, frame_interval: int = 2, quality: str = "medium") -> int:
+
+    def _run(self, cmd: list, stage: str, total: Optional[int] = None, check: bool = True,
+             progress_span: Tuple[float, float] = (0.0, 1.0)) -> CommandResult:
+        """
+        Run a COLMAP/ffmpeg command without buffering its output
+        Output streams to logs/colmap.log; progress events are forwarded to
+        progress_callback whenever the stage's whole-percent progress changes.
+        progress_span maps the command's progress into part of the stage.
+        """
+        parser = OutputParser(stage, total)
+        log_handler = open_command_log(self.log_path)
+        last_percent = -1
+        span_start, span_end = progress_span
+        
+        def on_progress(fraction: float, line: str):
+            nonlocal last_percent
+            fraction = span_start + (span_end - span_start) * fraction
+            percent = int(fraction * 100)
+            if self.progress_callback and percent != last_percent:
+                last_percent = percent
+                self.progress_callback(stage, fraction, line)
+        
+        try:
+            return run_command(cmd, parser, log_handler, on_progress, check=check)
+        finally:
+            log_handler.close()
+
+    # Stage resets: clear a stage's stale outputs before it is re-run
+    def reset_frames(self):
+        """Remove previously extracted frames"""
+        for frame in self.images_path.glob("*.jpg"):
+            frame.unlink()
+
+    def reset_database(self):
+        """Remove the COLMAP database (features, matches, geometries)"""
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.database_path}{suffix}").unlink(missing_ok=True)
+
+    def reset_matches(self):
+        """Drop matches but keep features, so only matching is re-run"""
+        if not self.database_path.exists():
+            return
+        import sqlite3
+        conn = sqlite3.connect(self.database_path)
+        try:
+            conn.execute("DELETE FROM matches")
+            conn.execute("DELETE FROM two_view_geometries")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def feature_fingerprint(self) -> str:
+        """
+        Fingerprint of the extracted features in database.db (image rows,
+        keypoint and descriptor shapes), unaffected by matching
+        """
+        sha256 = hashlib.sha256()
+        if not self.database_path.exists():
+            return ""
+        conn = sqlite3.connect(self.database_path)
+        try:
+            for table, columns in (("images", "image_id, name, camera_id"),
+                                   ("keypoints", "image_id, rows, cols, length(data)"),
+                                   ("descriptors", "image_id, rows, cols, length(data)")):
+                for row in conn.execute(f"SELECT {columns} FROM {table} ORDER BY image_id"):
+                    sha256.update(f"{table}:{row}\n".encode())
+        except sqlite3.DatabaseError:
+            return ""
+        finally:
+            conn.close()
+        return sha256.hexdigest()
+
+    def reset_sparse(self):
+        """Remove previous sparse models"""
+        shutil.rmtree(self.sparse_path, ignore_errors=True)
+        self.sparse_path.mkdir(parents=True, exist_ok=True)
+
+    def _segment_count(self, seconds: float, segments: Optional[int]) -> int:
+        """Number of parallel decode segments: one per available core by default, each >= FRAME_SEGMENT_MIN_SECONDS"""
+        if segments is None:
+            segments = min(thread_budget(), int(seconds // FRAME_SEGMENT_MIN_SECONDS))
+        return max(1, segments)
+
+    def _run_parallel(self, commands: List[Tuple[list, int]], stage: str,
+                      progress_span: Tuple[float, float] = (0.0, 1.0), check: bool = True) -> List[CommandResult]:
+        """
+        Run (cmd, items) commands concurrently, up to one per available core
+        (resource_planner.thread_budget), sharing
+        the job log; stage progress is the item-weighted mean of their
+        progress. Results are returned in command order.
+        """
+        workers = min(len(commands), thread_budget())
+        total = sum(items for _, items in commands) or 1
+        done = [0.0] * len(commands)
+        lock = threading.Lock()
+        last_percent = -1
+        span_start, span_end = progress_span
+        log_handler = open_command_log(self.log_path)
+        
+        def run_one(i: int) -> CommandResult:
+            cmd, items = commands[i]
+            
+            def on_progress(fraction: float, line: str):
+                nonlocal last_percent
+                with lock:
+                    done[i] = fraction * items
+                    fraction = span_start + (span_end - span_start) * min(sum(done) / total, 1.0)
+                    percent = int(fraction * 100)
+                    if self.progress_callback and percent != last_percent:
+                        last_percent = percent
+                        self.progress_callback(stage, fraction, line)
+            
+            return run_command(cmd, OutputParser(stage, items), log_handler, on_progress, check=check)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(run_one, range(len(commands))))
+        finally:
+            log_handler.close()
+
+    def _extract_segments(self, video_path: str, jobs: List[Tuple[float, float, str, int]],
+                          progress_span: Tuple[float, float]) -> int:
+        """
+        Run one ffmpeg process per (start, length, video_filter, frames) job
+        (length None = until the frame limit) in parallel, each into its own
+        directory, then renumber the results into a single contiguous
+        frame_%06d.jpg sequence in job order
+        """
+        cpus = thread_budget()
+        workers = min(len(jobs), cpus)
+        threads = max(1, cpus // workers)  # Avoid oversubscribing the decoders
+        segment_dirs = [self.images_path / f".segment_{i:04d}" for i in range(len(jobs))]
+        commands = []
+        for segment_dir, (start, length, video_filter, frames) in zip(segment_dirs, jobs):
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            segment_dir.mkdir(parents=True)
+            commands.append(([
+                "ffmpeg", *segment_args(start, length), "-i", video_path,
+                "-threads", str(threads),
+                "-vf", video_filter,
+                "-vsync", "vfr",
+                "-frames:v", str(frames),
+                "-q:v", "2",
+                "-y",
+                str(segment_dir / "frame_%06d.jpg")
+            ], frames))
+        
+        try:
+            self._run_parallel(commands, "frame_extraction", progress_span)
+            
+            frame_count = 0
+            for segment_dir in segment_dirs:
+                for frame in sorted(segment_dir.glob("frame_*.jpg")):
+                    frame_count += 1
+                    os.replace(frame, self.images_path / f"frame_{frame_count:06d}.jpg")
+            return frame_count
+        finally:
+            for segment_dir in segment_dirs:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+
+    def extract_frames(self, video_path: str, max_frames: int = 50, frame_interval: Optional[float] = None,
+                       quality: str = "medium", selection: str = "uniform",
+                       segments: Optional[int] = None) -> int:
         """
         Extract frames from video using ffmpeg
         
@@ -58,8 +288,21 @@ class COLMAPProcessor:
         - Preserve folder structure for later processing
         - Consider down-sampling frame rate for video input
         - Different viewpoints (not just camera rotation)
+        
+        selection:
+        - "uniform": max_frames frames spread evenly over the whole clip
+          (or one every frame_interval seconds if given); sparse schedules
+          seek to each frame instead of decoding the whole video. Videos
+          without a probed duration or frame rate are sampled at a fixed
+          rate from the start instead
+        - "keyframes": sharp, non-duplicate frames spaced by camera motion
+          (see keyframes.py); the choice is recorded in keyframes.json
+        
+        segments: number of time segments decoded by parallel ffmpeg
+        processes (None = one per core for long videos, 1 = single process).
+        Frames are renumbered into one contiguous sequence either way.
         """
-        logger.info(f"Extracting frames from {video_path} (quality={quality})")
+        logger.info(f"Extracting frames from {video_path} (quality={quality}, selection={selection})")
         
         # Quality-based scaling
         scale_map = {
@@ -73,17 +316,77 @@ class COLMAPProcessor:
         # Format: %06d for frame numbering
         output_pattern = self.images_path / "frame_%06d.jpg"
         
-        cmd = [
-            "ffmpeg", "-i", video_path,
-            "-vf", f"fps=1/{frame_interval},scale={scale}",
-            "-frames:v", str(max_frames),
-            "-q:v", "2",  # High quality JPEG (1-31, lower = better)
-            "-y",  # Overwrite existing files
-            str(output_pattern)
-        ]
-        
         try:
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            info = probe_video(video_path)
+            jobs = []
+            if selection == "keyframes":
+                # Low-resolution analysis pass first, then write only the chosen frames
+                def on_analysis_progress(fraction: float):
+                    if self.progress_callback:
+                        self.progress_callback("frame_extraction", 0.6 * fraction, "Analysing frames")
+                
+                count = self._segment_count(info["duration"], segments)
+                keyframes = select_keyframes(video_path, max_frames, progress=on_analysis_progress,
+                                             segments=count, info=info)
+                # Replace rather than rewrite: the file may be hardlinked from the artifact cache
+                tmp_path = self.job_path / "keyframes.json.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(keyframes, f)
+                os.replace(tmp_path, self.job_path / "keyframes.json")
+                if not keyframes["selected"]:
+                    raise ValueError(f"No usable frames found in {video_path}")
+                
+                fps = keyframes["analysis_fps"]
+                selected = keyframes["selected"]
+                video_filter = f"{select_filter(fps, selected)},scale={scale}"
+                total = len(selected)
+                progress_span = (0.6, 1.0)
+                if count > 1:
+                    # Only decode up to the last keyframe; each segment selects its own frames
+                    for first, start, length in plan_segments((selected[-1] + 1) / fps, fps, count):
+                        end = first + round(length * fps)
+                        local = [n - first for n in selected if first <= n < end]
+                        if local:
+                            jobs.append((start, length, f"{select_filter(fps, local)},scale={scale}", len(local)))
+            elif selection == "uniform" and (info["duration"] <= 0 or info["fps"] <= 0):
+                # No usable duration or frame rate (e.g. browser-recorded WebM):
+                # fixed-rate sampling, stopping after max_frames frames
+                interval = frame_interval or FALLBACK_FRAME_INTERVAL
+                total = max_frames
+                rate = Fraction(1 / interval).limit_denominator(100000)
+                video_filter = f"fps={rate},scale={scale}"
+                progress_span = (0.0, 1.0)
+            elif selection == "uniform":
+                interval = frame_interval or uniform_interval(info["duration"], info["fps"], max_frames)
+                total = max(1, min(max_frames, math.ceil(info["duration"] / interval - 1e-9)))
+                rate = Fraction(1 / interval).limit_denominator(100000)
+                video_filter = f"fps={rate},scale={scale}"
+                progress_span = (0.0, 1.0)
+                if interval >= SEEK_MIN_INTERVAL and total > 1:
+                    # Sparse schedule: seek to every sample, skipped stretches are never decoded
+                    jobs = [(i * interval, None, f"scale={scale}", 1) for i in range(total)]
+                else:
+                    count = self._segment_count(total * interval, segments)
+                    if count > 1:
+                        for first, start, length in plan_segments(total * interval, 1 / interval, count):
+                            jobs.append((start, length, video_filter, round(length / interval)))
+            else:
+                raise ValueError(f"Unknown frame selection mode: {selection}")
+            
+            if len(jobs) > 1:
+                logger.info(f"Extracting frames with {len(jobs)} ffmpeg jobs in parallel")
+                self._extract_segments(video_path, jobs, progress_span)
+            else:
+                cmd = [
+                    "ffmpeg", "-i", video_path,
+                    "-vf", video_filter,
+                    "-vsync", "vfr",  # Write only the frames the filter keeps
+                    "-frames:v", str(total),
+                    "-q:v", "2",  # High quality JPEG (1-31, lower = better)
+                    "-y",  # Overwrite existing files
+                    str(output_pattern)
+                ]
+                self._run(cmd, "frame_extraction", total=total, progress_span=progress_span)
             
             # Count extracted frames
             frame_count = len(list(self.images_path.glob("*.jpg")))
@@ -98,8 +401,13 @@ class COLMAPProcessor:
         """
         Extract SIFT features from images
         Reference: https://colmap.github.io/tutorial.html#feature-detection-and-extraction
+        
+        Without a GPU the CPU profile applies: smaller images and feature
+        counts, no upsampled first octave, and no affine shape estimation or
+        domain size pooling (each multiplies CPU SIFT time); see
+        scripts/benchmark/sift_profiles.py for the speed/quality tradeoff.
         """
-        logger.info(f"Extracting features with quality={quality}")
+        logger.info(f"Extracting features with quality={quality} ({'GPU' if use_gpu else 'CPU'} profile)")
         
         # Quality-based parameters
         quality_params = {
@@ -116,8 +424,25 @@ class COLMAPProcessor:
                 "max_image_size": "8192"
             }
         }
+        cpu_quality_params = {
+            "low": {
+                "max_num_features": "4096",
+                "max_image_size": "1024"
+            },
+            "medium": {
+                "max_num_features": "8192",
+                "max_image_size": "1600"
+            },
+            "high": {
+                "max_num_features": "16384",
+                "max_image_size": "2048"
+            }
+        }
         
+        if not use_gpu:
+            quality_params = cpu_quality_params
         params = quality_params.get(quality, quality_params["medium"])
+        gpu_only = "1" if use_gpu else "0"  # Affordable on GPU, several times slower on CPU
         
         cmd = [
             "colmap", "feature_extractor",
@@ -127,8 +452,8 @@ class COLMAPProcessor:
             # SIFT Extraction Parameters
             # Reference: https://colmap.github.io/tutorial.html#feature-detection-and-extraction
             "--SiftExtraction.use_gpu", "1" if use_gpu else "0",
-            "--SiftExtraction.domain_size_pooling", "1",  # Better feature distribution
-            "--SiftExtraction.estimate_affine_shape", "1",  # Viewpoint invariance
+            "--SiftExtraction.domain_size_pooling", gpu_only,  # Better feature distribution
+            "--SiftExtraction.estimate_affine_shape", gpu_only,  # Viewpoint invariance
             "--SiftExtraction.max_num_features", params["max_num_features"],
             "--SiftExtraction.max_image_size", params["max_image_size"],
             
@@ -136,18 +461,86 @@ class COLMAPProcessor:
             "--ImageReader.single_camera", "1",  # All frames from same camera
             
             # Additional quality parameters
-            "--SiftExtraction.first_octave", "-1",  # Start at full resolution
+            "--SiftExtraction.first_octave", "-1" if use_gpu else "0",  # -1: upsample 2x for small features
             "--SiftExtraction.num_octaves", "4",    # Multi-scale pyramid
             "--SiftExtraction.octave_resolution", "3",  # Scales per octave
             "--SiftExtraction.peak_threshold", "0.0067",  # Feature threshold
             "--SiftExtraction.edge_threshold", "10.0",    # Edge filter
+            
+            # CPU extraction holds one image pyramid per thread: bound threads by memory too
+            "--SiftExtraction.num_threads", str(thread_budget(
+                0 if use_gpu else int(params["max_image_size"]) ** 2 * SIFT_CPU_BYTES_PER_PIXEL)),
         ]
         
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            cache = FeatureCache()
+            names = sorted(p.name for p in self.images_path.glob("*.jpg"))
+            if not cache.enabled or not names:
+                stats = self._parse_feature_stats(self._run(cmd, "feature_extraction").stats)
+                logger.info(f"Feature extraction complete: {stats}")
+                return stats
+            
+            # Cached per image content + SIFT options (database/image paths do not matter)
+            key = options_key({cmd[i]: cmd[i + 1] for i in range(2, len(cmd), 2)
+                               if cmd[i].startswith(("--SiftExtraction.", "--ImageReader."))
+                               and cmd[i] != "--SiftExtraction.num_threads"})
+            hashes = hash_images(self.images_path, names)
+            try:
+                hits = cache.cached(hashes.values(), key)
+            except sqlite3.Error as e:
+                logger.warning(f"Feature cache unavailable: {e}")
+                hits = set()
+            missing = [name for name in names if hashes[name] not in hits]
+            cached = {name: hashes[name] for name in names if hashes[name] in hits}
+            logger.info(f"Feature cache: {len(cached)} of {len(names)} images cached")
+            
+            output_stats = {"saw_database": True}
+            if missing:
+                # Extract first, so cached images join the camera the extractor creates
+                extract_cmd = cmd
+                if cached:
+                    image_list = self.job_path / "feature_extraction_images.txt"
+                    image_list.write_text("\n".join(missing) + "\n")
+                    extract_cmd = cmd + ["--image_list_path", str(image_list)]
+                output_stats = self._run(extract_cmd, "feature_extraction").stats
+            else:
+                self._run(["colmap", "database_creator", "--database_path", str(self.database_path)],
+                          "feature_extraction")
+            
+            if cached:
+                try:
+                    copied = cache.copy_to_database(self.database_path, cached, key)
+                except sqlite3.Error as e:
+                    # Fall back to a full extraction without the cache
+                    logger.warning(f"Could not copy cached features, extracting all images: {e}")
+                    self.reset_database()
+                    output_stats = self._run(cmd, "feature_extraction").stats
+                    missing, cached = names, {}
+                else:
+                    if copied < len(cached):
+                        # Another job's cache pruning evicted some images since the lookup
+                        conn = sqlite3.connect(self.database_path)
+                        try:
+                            present = {row[0] for row in conn.execute("SELECT name FROM images")}
+                        finally:
+                            conn.close()
+                        evicted = sorted(name for name in cached if name not in present)
+                        logger.warning(f"{len(evicted)} cached images were evicted before the copy, extracting them")
+                        image_list = self.job_path / "feature_extraction_images.txt"
+                        image_list.write_text("\n".join(evicted) + "\n")
+                        self._run(cmd + ["--image_list_path", str(image_list)], "feature_extraction")
+                        missing = sorted(missing + evicted)
+                        cached = {name: image_hash for name, image_hash in cached.items() if name in present}
+            if missing:
+                try:
+                    cache.add_from_database(self.database_path, {name: hashes[name] for name in missing}, key)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not update feature cache: {e}")
             
             # Parse statistics
-            stats = self._parse_feature_stats(result.stdout)
+            stats = self._parse_feature_stats(output_stats)
+            stats["cached_images"] = len(cached)
+            stats["extracted_images"] = len(missing)
             logger.info(f"Feature extraction complete: {stats}")
             return stats
             
@@ -155,7 +548,8 @@ class COLMAPProcessor:
             logger.error(f"Feature extraction failed: {e.stderr}")
             raise
     
-    def match_features(self, matching_type: str = "sequential", use_gpu: bool = True, quality: str = "medium") -> Dict:
+    def match_features(self, matching_type: str = "sequential", use_gpu: bool = True, quality: str = "medium",
+                       shards: Optional[int] = None) -> Dict:
         """
         Match features between images with geometric verification
         
@@ -165,6 +559,11 @@ class COLMAPProcessor:
         - sequential_matcher: Best for video sequences (ordered frames)
         - exhaustive_matcher: Best for unordered images (all pairs)
         - spatial_matcher: Best for geotagged images
+        - "retrieval": temporal window + most similar frames (pair_planning.py),
+          matched with matches_importer; O(n*k) pairs, keeps loop closures
+        
+        shards: retrieval pairs are split over this many parallel CPU
+        matchers (match_shards.py); None = one per core when use_gpu is off.
         
         Geometric verification is automatic via RANSAC and stored in two_view_geometries table.
         """
@@ -178,6 +577,24 @@ class COLMAPProcessor:
         }
         match_params = quality_params.get(quality, quality_params["medium"])
         
+        # SIFT matching + geometric verification, shared by all matchers
+        sift_matching = [
+            "--SiftMatching.use_gpu", "1" if use_gpu else "0",
+            "--SiftMatching.guided_matching", "1",  # Use epipolar geometry
+            "--SiftMatching.cross_check", "1",  # Bidirectional matching
+            "--SiftMatching.max_num_matches", match_params["max_num_matches"],
+            
+            # Geometric Verification (automatic)
+            "--SiftMatching.max_ratio", "0.8",  # Lowe's ratio test
+            "--SiftMatching.max_distance", "0.7",  # Descriptor distance
+            "--SiftMatching.max_error", "4.0",  # RANSAC threshold (pixels)
+            "--SiftMatching.confidence", "0.999",  # RANSAC confidence
+            "--SiftMatching.min_num_inliers", "15",  # Min matches per pair
+            "--SiftMatching.min_inlier_ratio", "0.25",  # Quality threshold
+        ]
+        plan_stats = {}
+        started = time.monotonic()
+        
         if matching_type == "sequential":
             # Best for video sequences (frames in order)
             # Reference: https://colmap.github.io/tutorial.html#feature-matching-and-geometric-verification
@@ -188,20 +605,24 @@ class COLMAPProcessor:
                 # Sequential-specific parameters
                 "--SequentialMatching.overlap", "10",  # Match 10 adjacent frames
                 "--SequentialMatching.quadratic_overlap", "0",  # Linear overlap
-                
-                # SIFT Matching Parameters
-                "--SiftMatching.use_gpu", "1" if use_gpu else "0",
-                "--SiftMatching.guided_matching", "1",  # Use epipolar geometry
-                "--SiftMatching.cross_check", "1",  # Bidirectional matching
-                "--SiftMatching.max_num_matches", match_params["max_num_matches"],
-                
-                # Geometric Verification (automatic)
-                "--SiftMatching.max_ratio", "0.8",  # Lowe's ratio test
-                "--SiftMatching.max_distance", "0.7",  # Descriptor distance
-                "--SiftMatching.max_error", "4.0",  # RANSAC threshold (pixels)
-                "--SiftMatching.confidence", "0.999",  # RANSAC confidence
-                "--SiftMatching.min_num_inliers", "15",  # Min matches per pair
-                "--SiftMatching.min_inlier_ratio", "0.25",  # Quality threshold
+                *sift_matching
+            ]
+        elif matching_type == "retrieval":
+            # Planned pairs: temporal neighbours + global-descriptor retrieval
+            # Reference: https://colmap.github.io/faq.html#custom-matching
+            match_list = self.job_path / "match_pairs.txt"
+            plan_stats = write_match_list(self.database_path, match_list)
+            if shards is None:
+                shards = 1 if use_gpu else thread_budget()
+            shards = min(shards, plan_stats["planned_pairs"] // MIN_PAIRS_PER_SHARD)
+            if shards > 1:
+                return self._match_sharded(match_list, sift_matching, shards, plan_stats, started)
+            cmd = [
+                "colmap", "matches_importer",
+                "--database_path", str(self.database_path),
+                "--match_list_path", str(match_list),
+                "--match_type", "pairs",
+                *sift_matching
             ]
         else:  # exhaustive_matcher
             # Best for unordered image collections
@@ -209,27 +630,16 @@ class COLMAPProcessor:
             cmd = [
                 "colmap", "exhaustive_matcher",
                 "--database_path", str(self.database_path),
-                
-                # SIFT Matching Parameters
-                "--SiftMatching.use_gpu", "1" if use_gpu else "0",
-                "--SiftMatching.guided_matching", "1",  # Use epipolar geometry
-                "--SiftMatching.cross_check", "1",  # Bidirectional matching
-                "--SiftMatching.max_num_matches", match_params["max_num_matches"],
-                
-                # Geometric Verification (automatic)
-                "--SiftMatching.max_ratio", "0.8",  # Lowe's ratio test
-                "--SiftMatching.max_distance", "0.7",  # Descriptor distance
-                "--SiftMatching.max_error", "4.0",  # RANSAC threshold (pixels)
-                "--SiftMatching.confidence", "0.999",  # RANSAC confidence
-                "--SiftMatching.min_num_inliers", "15",  # Min matches per pair
-                "--SiftMatching.min_inlier_ratio", "0.25",  # Quality threshold
+                *sift_matching
             ]
         
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            result = self._run(cmd + ["--SiftMatching.num_threads", str(thread_budget())], "feature_matching")
             
             # Parse match statistics
-            stats = self._parse_match_stats(result.stdout)
+            stats = self._parse_match_stats(result.stats)
+            stats.update(plan_stats)
+            self._add_match_throughput(stats, started)
             logger.info(f"Feature matching complete: {stats}")
             return stats
             
@@ -237,7 +647,63 @@ class COLMAPProcessor:
             logger.error(f"Feature matching failed: {e.stderr}")
             raise
     
-    def sparse_reconstruction(self, quality: str = "medium") -> Dict:
+    def _match_sharded(self, match_list: Path, sift_matching: list, shards: int,
+                       plan_stats: Dict, started: float) -> Dict:
+        """
+        Match a pair list as cost-balanced shards in parallel matches_importer
+        processes, each on a slim copy of the database, then merge the
+        shards' matches and two_view_geometries back in shard order
+        """
+        pairs = read_pair_list(match_list)
+        partition = shard_pairs(pairs, feature_counts(self.database_path), shards)
+        threads = max(1, thread_budget() // len(partition))
+        shard_root = self.job_path / "match_shards"
+        shutil.rmtree(shard_root, ignore_errors=True)
+        
+        commands = []
+        shard_databases = []
+        for i, shard in enumerate(partition):
+            shard_dir = shard_root / f"{i:03d}"
+            shard_dir.mkdir(parents=True)
+            shard_database = shard_dir / "database.db"
+            create_shard_database(self.database_path, shard_database, sorted({name for pair in shard for name in pair}))
+            with open(shard_dir / "match_pairs.txt", "w") as f:
+                f.writelines(f"{a} {b}\n" for a, b in shard)
+            shard_databases.append(shard_database)
+            commands.append(([
+                "colmap", "matches_importer",
+                "--database_path", str(shard_database),
+                "--match_list_path", str(shard_dir / "match_pairs.txt"),
+                "--match_type", "pairs",
+                *sift_matching,
+                "--SiftMatching.num_threads", str(threads),
+            ], len(shard)))
+        
+        logger.info(f"Matching {len(pairs)} pairs in {len(partition)} shards")
+        try:
+            self._run_parallel(commands, "feature_matching")
+            merge_shard_databases(self.database_path, shard_databases)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Feature matching failed: {e.stderr}")
+            raise
+        finally:
+            shutil.rmtree(shard_root, ignore_errors=True)
+        
+        stats = self._parse_match_stats({"saw_database": True})
+        stats.update(plan_stats)
+        stats["match_shards"] = len(partition)
+        self._add_match_throughput(stats, started)
+        logger.info(f"Feature matching complete: {stats}")
+        return stats
+    
+    def _add_match_throughput(self, stats: Dict, started: float):
+        """Matched pairs per second over the whole stage (pair planning included)"""
+        elapsed = time.monotonic() - started
+        pairs = stats.get("planned_pairs") or stats.get("matched_pairs") or stats.get("verified_pairs") or 0
+        stats["matching_seconds"] = round(elapsed, 2)
+        stats["pairs_per_second"] = round(pairs / elapsed, 1) if elapsed > 0 else 0.0
+    
+    def sparse_reconstruction(self, quality: str = "medium", partitioned: Optional[bool] = None) -> Dict:
         """
         Incremental Structure-from-Motion reconstruction
         
@@ -250,6 +716,9 @@ class COLMAPProcessor:
         4. Triangulate new 3D points
         5. Creates multiple models if not all images register into same model
         
+        Long sequences (PARTITION_MIN_IMAGES+ frames, or partitioned=True) are
+        mapped divide-and-conquer instead, see _map_partitioned.
+        
         Output: Binary files in sparse/N/ directory:
         - cameras.bin: Camera intrinsics
         - images.bin: Camera poses (extrinsics)
@@ -277,15 +746,7 @@ class COLMAPProcessor:
         }
         mapper_params = quality_params.get(quality, quality_params["medium"])
         
-        cmd = [
-            "colmap", "mapper",
-            "--database_path", str(self.database_path),
-            "--image_path", str(self.images_path),
-            "--output_path", str(self.sparse_path),
-            
-            # Thread Configuration
-            "--Mapper.num_threads", "8",
-            
+        mapper_options = [
             # Initialization
             "--Mapper.init_min_num_inliers", mapper_params["init_min_num_inliers"],
             "--Mapper.init_max_forward_motion", "0.95",
@@ -320,14 +781,35 @@ class COLMAPProcessor:
             "--Mapper.extract_colors", "1",  # RGB colors for points
         ]
         
+        # Progress is registered images out of the extracted frames
+        names = sorted(frame.name for frame in self.images_path.glob("*.jpg"))
+        if partitioned is None:
+            partitioned = len(names) >= PARTITION_MIN_IMAGES
+        
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            
-            # Parse reconstruction statistics
-            stats = self._parse_reconstruction_stats(result.stdout)
+            if partitioned and len(names) > CLUSTER_IMAGES:
+                partition_stats = self._map_partitioned(names, mapper_options, mapper_params)
+                stats = {}
+            else:
+                cmd = [
+                    "colmap", "mapper",
+                    "--database_path", str(self.database_path),
+                    "--image_path", str(self.images_path),
+                    "--output_path", str(self.sparse_path),
+                    
+                    # Thread Configuration
+                    "--Mapper.num_threads", str(thread_budget()),
+                    *mapper_options,
+                ]
+                result = self._run(cmd, "sparse_reconstruction", total=len(names) or None)
+                
+                # Parse reconstruction statistics
+                stats = self._parse_reconstruction_stats(result.stats)
+                partition_stats = {"partitions": 1}
             
             # Find best model (most 3D points)
             best_model, model_stats = self._find_best_model()
+            stats = {**stats, **partition_stats}
             logger.info(f"Sparse reconstruction complete: {stats}")
             
             return {
@@ -341,6 +823,103 @@ class COLMAPProcessor:
             logger.error(f"Sparse reconstruction failed: {e.stderr}")
             raise
     
+    def _map_partitioned(self, names: List[str], mapper_options: list, mapper_params: Dict) -> Dict:
+        """
+        Divide-and-conquer mapping (see map_partitions.py):
+        1. Split the frames into overlapping temporal clusters
+        2. Map every cluster in its own `colmap mapper` process, in parallel
+        3. Chain the cluster models together with `colmap model_merger`
+           (aligned on the frames consecutive clusters share)
+        4. Global bundle adjustment of the merged chain into sparse/0
+        
+        A cluster that cannot be merged (too few shared registered frames)
+        ends the current chain and starts a new one, so the clusters after
+        it still merge with their neighbours. Every chain is bundle-adjusted
+        into its own model sparse/0, sparse/1, ...
+        """
+        clusters = temporal_clusters(names)
+        cpus = thread_budget()
+        threads = max(1, cpus // min(len(clusters), cpus))
+        parts_root = self.job_path / "sparse_parts"
+        shutil.rmtree(parts_root, ignore_errors=True)
+        
+        commands = []
+        for i, cluster in enumerate(clusters):
+            part_dir = parts_root / f"{i:03d}"
+            (part_dir / "model").mkdir(parents=True)
+            with open(part_dir / "image_list.txt", "w") as f:
+                f.writelines(f"{name}\n" for name in cluster)
+            commands.append(([
+                "colmap", "mapper",
+                "--database_path", str(self.database_path),
+                "--image_path", str(self.images_path),
+                "--image_list_path", str(part_dir / "image_list.txt"),
+                "--output_path", str(part_dir / "model"),
+                "--Mapper.num_threads", str(threads),
+                *mapper_options,
+            ], len(cluster)))
+        
+        logger.info(f"Mapping {len(names)} images in {len(clusters)} overlapping clusters")
+        try:
+            self._run_parallel(commands, "sparse_reconstruction", progress_span=(0.0, 0.8), check=False)
+            
+            # Largest model of each cluster, in temporal order
+            parts = [largest_model(parts_root / f"{i:03d}" / "model") for i in range(len(clusters))]
+            parts = [part for part in parts if part is not None]
+            if not parts:
+                raise RuntimeError("Sparse reconstruction failed: no cluster could be mapped")
+            
+            if self.progress_callback:
+                self.progress_callback("sparse_reconstruction", 0.8, f"Merging {len(parts)} cluster models")
+            # Each chain is a list of merged models, the last one holds the whole chain
+            chains = [[parts[0]]]
+            for i, part in enumerate(parts[1:], start=1):
+                output_dir = parts_root / f"merged_{i:03d}"
+                output_dir.mkdir()
+                result = self._run([
+                    "colmap", "model_merger",
+                    "--input_path1", str(chains[-1][-1]),
+                    "--input_path2", str(part),
+                    "--output_path", str(output_dir),
+                    "--max_reproj_error", mapper_params["filter_max_reproj_error"],
+                ], "sparse_reconstruction", check=False,
+                    progress_span=(0.8 + 0.1 * (i - 1) / len(parts), 0.8 + 0.1 * i / len(parts)))
+                if result.returncode == 0 and (output_dir / "points3D.bin").exists():
+                    chains[-1].append(output_dir)
+                else:
+                    logger.warning(f"Cluster model {part.parent.parent.name} could not be merged, starting a new chain")
+                    chains.append([part])
+            
+            if self.progress_callback:
+                self.progress_callback("sparse_reconstruction", 0.9, "Global bundle adjustment")
+            self.reset_sparse()
+            for i, chain in enumerate(chains):
+                model_dir = self.sparse_path / str(i)
+                if len(chain) == 1:
+                    # A single cluster model was already bundle-adjusted by its mapper
+                    shutil.copytree(chain[0], model_dir)
+                    continue
+                model_dir.mkdir()
+                self._run([
+                    "colmap", "bundle_adjuster",
+                    "--input_path", str(chain[-1]),
+                    "--output_path", str(model_dir),
+                    "--BundleAdjustment.refine_focal_length", "1",
+                    "--BundleAdjustment.refine_principal_point", "0",
+                    "--BundleAdjustment.refine_extra_params", "1",
+                    "--BundleAdjustment.max_num_iterations", "100",
+                ], "sparse_reconstruction",
+                    progress_span=(0.9 + 0.1 * i / len(chains), 0.9 + 0.1 * (i + 1) / len(chains)))
+        finally:
+            shutil.rmtree(parts_root, ignore_errors=True)
+        
+        return {
+            "partitions": len(clusters),
+            "mapped_partitions": len(parts),
+            "merged_partitions": max(len(chain) for chain in chains),
+            "models": len(chains),
+        }
+    
     def export_model(self, output_format: str = "PLY", model_dir: Optional[Path] = None) -> str:
         """
         Export reconstruction to various formats
@@ -367,62 +946,48 @@ class COLMAPProcessor:
         
         logger.info(f"Exporting model {model_dir} to {output_format} format")
         
-        # Handle different output formats
-        if output_format == "PLY":
-            # Point cloud export
-            output_file = self.job_path / "point_cloud.ply"
-            
-            cmd = [
-                "colmap", "model_converter",
-                "--input_path", str(model_dir),
-                "--output_path", str(output_file),
-                "--output_type", "PLY",
-            ]
-        elif output_format == "TXT":
-            # Text format export (cameras.txt, images.txt, points3D.txt)
-            output_dir = self.job_path / "model_text"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            cmd = [
-                "colmap", "model_converter",
-                "--input_path", str(model_dir),
-                "--output_path", str(output_dir),
-                "--output_type", "TXT",
-            ]
-            output_file = output_dir  # Directory for text format
-        elif output_format == "BIN":
-            # Binary format export
-            output_dir = self.job_path / "model_binary"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            cmd = [
-                "colmap", "model_converter",
-                "--input_path", str(model_dir),
-                "--output_path", str(output_dir),
-                "--output_type", "BIN",
-            ]
-            output_file = output_dir  # Directory for binary format
-        elif output_format == "NVM":
-            # VisualSFM NVM format
-            output_file = self.job_path / "model.nvm"
-            
-            cmd = [
-                "colmap", "model_converter",
-                "--input_path", str(model_dir),
-                "--output_path", str(output_file),
-                "--output_type", "NVM",
-            ]
-        else:
-            raise ValueError(f"Unsupported export format: {output_format}")
-        
+        # PLY / TXT / BIN are written in-process from the memory-mapped model;
+        # only NVM still goes through colmap model_converter
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            if output_format == "PLY":
+                # Point cloud export
+                output_file = self.job_path / "point_cloud.ply"
+                if is_up_to_date(output_file, model_dir):
+                    logger.info(f"PLY export {output_file} is up to date")
+                else:
+                    write_ply(model_dir, output_file)
+            elif output_format == "TXT":
+                # Text format export (cameras.txt, images.txt, points3D.txt)
+                output_file = self.job_path / "model_text"  # Directory for text format
+                if is_up_to_date(output_file, model_dir):
+                    logger.info(f"TXT export {output_file} is up to date")
+                else:
+                    write_text_model(model_dir, output_file)
+            elif output_format == "BIN":
+                # Binary format export (hardlinks share the source mtimes, so always relink)
+                output_file = self.job_path / "model_binary"  # Directory for binary format
+                write_binary_model(model_dir, output_file)
+            elif output_format == "NVM":
+                # VisualSFM NVM format
+                output_file = self.job_path / "model.nvm"
+                self._run([
+                    "colmap", "model_converter",
+                    "--input_path", str(model_dir),
+                    "--output_path", str(output_file),
+                    "--output_type", "NVM",
+                ], "export")
+            else:
+                raise ValueError(f"Unsupported export format: {output_format}")
+
             logger.info(f"Exported model to {output_file} ({output_format} format)")
             return str(output_file)
-            
+
         except subprocess.CalledProcessError as e:
             logger.error(f"Export failed: {e.stderr}")
             raise
+        except (OSError, ValueError) as e:
+            logger.error(f"Export failed: {e}")
+            raise
     
     def export_point_cloud(self, output_format: str = "PLY") -> str:
         """
@@ -468,7 +1033,7 @@ class COLMAPProcessor:
         ]
         
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            self._run(cmd, "import")
             logger.info(f"Imported model to {import_dir}")
             return import_dir
             
@@ -497,44 +1062,31 @@ class COLMAPProcessor:
         for sparse_dir in sparse_dirs:
             points3d_file = sparse_dir / "points3D.bin"
             if points3d_file.exists():
-                # Count points (approximate by file size)
-                # Each point in binary format: id (uint64) + xyz (3x float32) + rgb (uint8x3) + error (float32) + 2x track (int64)
-                # Total: 8 + 12 + 3 + 4 + 16 = ~43 bytes + alignment ≈ 48 bytes
-                point_count = points3d_file.stat().st_size // 48
+                # Exact point count from the points3D.bin header
+                point_count = count_points3D(points3d_file)
                 if point_count > best_points:
                     best_points = point_count
                     best_model = sparse_dir
         
         stats = {
             "num_models": len(sparse_dirs),
-            "points_3d": best_points,
+            **model_stats(best_model),
             "model_id": best_model.name
         }
         
         logger.info(f"Found {len(sparse_dirs)} models, best is {best_model.name} with {best_points} points")
         return best_model, stats
     
-    def _parse_feature_stats(self, output: str) -> Dict:
+    def _parse_feature_stats(self, output_stats: Dict) -> Dict:
         """
-        Parse feature extraction statistics from COLMAP output
+        Build feature extraction statistics from parsed COLMAP output
         Extracts: num_images, total_features, avg_features_per_image
         """
         stats = {
-            "status": "success" if "Database" in output else "unknown"
+            "status": "success" if output_stats.get("saw_database") else "unknown"
         }
-        
-        # Try to extract statistics from output
-        lines = output.split('\n')
-        for i, line in enumerate(lines):
-            # Look for database stats
-            if "Database:" in line and i + 1 < len(lines):
-                # Next line often has image count
-                try:
-                    num_images = len(list(self.images_path.glob("*.jpg")))
-                    stats["num_images"] = num_images
-                except:
-                    pass
-                break
+        if "progress_items" in output_stats:
+            stats["num_images"] = output_stats["progress_items"]
         
         # Count features in database
         try:
@@ -561,28 +1113,16 @@ class COLMAPProcessor:
         
         return stats
     
-    def _parse_match_stats(self, output: str) -> Dict:
+    def _parse_match_stats(self, output_stats: Dict) -> Dict:
         """
-        Parse feature matching statistics from COLMAP output
+        Build feature matching statistics from parsed COLMAP output
         Extracts: matched_pairs, verification_rate
         """
         stats = {
-            "status": "success" if "Database" in output else "unknown"
+            "status": "success" if output_stats.get("saw_database") else "unknown"
         }
-        
-        # Try to extract statistics from output
-        lines = output.split('\n')
-        for line in lines:
-            # Look for match count
-            if "Matched" in line and "pairs" in line:
-                try:
-                    # Extract number from "Matched X image pairs"
-                    import re
-                    match = re.search(r'(\d+)', line)
-                    if match:
-                        stats["matched_pairs"] = int(match.group(1))
-                except:
-                    pass
+        if "matched_pairs" in output_stats:
+            stats["matched_pairs"] = output_stats["matched_pairs"]
         
         # Count matches in database
         try:
@@ -602,36 +1142,16 @@ class COLMAPProcessor:
         
         return stats
     
-    def _parse_reconstruction_stats(self, output: str) -> Dict:
+    def _parse_reconstruction_stats(self, output_stats: Dict) -> Dict:
         """
-        Parse sparse reconstruction statistics from COLMAP output
+        Build sparse reconstruction statistics from parsed COLMAP output
         """
         stats = {
-            "status": "success" if "Database" in output else "unknown"
+            "status": "success" if output_stats.get("saw_database") else "unknown"
         }
-        
-        # Try to extract statistics from output
-        lines = output.split('\n')
-        for line in lines:
-            # Look for registered images
-            if "Registered" in line and "images" in line:
-                try:
-                    import re
-                    match = re.search(r'(\d+)', line)
-                    if match:
-                        stats["registered_images"] = int(match.group(1))
-                except:
-                    pass
-            
-            # Look for reconstructed points
-            if "Reconstructed" in line and "points" in line:
-                try:
-                    import re
-                    match = re.search(r'(\d+)', line)
-                    if match:
-                        stats["reconstructed_points"] = int(match.group(1))
-                except:
-                    pass
+        for key in ("registered_images", "reconstructed_points"):
+            if key in output_stats:
+                stats[key] = output_stats[key]
         
         return stats
     
@@ -786,12 +1306,7 @@ class COLMAPProcessor:
                 "--database_path", str(self.database_path),
             ]
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False  # Don't fail if database is already clean
-            )
+            result = self._run(cmd, "database_cleaner", check=False)  # Don't fail if database is already clean
             
             if result.returncode == 0:
                 logger.info("Database cleaned successfully")
@@ -801,13 +1316,13 @@ class COLMAPProcessor:
                     "backup_path": str(backup_path)
                 }
             else:
-                logger.warning(f"Database cleaner returned {result.returncode}: {result.stderr}")
+                logger.warning(f"Database cleaner returned {result.returncode}: {result.tail}")
                 # Restore backup
                 shutil.copy2(backup_path, self.database_path)
                 return {
                     "status": "warning",
                     "message": "Database may not need cleaning",
-                    "output": result.stdout
+                    "output": result.tail
                 }
                 
         except Exception as e:
@@ -907,35 +1422,160 @@ def process_video_to_pointcloud(
     job_id: str,
     video_path: str,
     quality: str = "medium",
-    max_frames: int = 50
+    max_frames: int = 50,
+    progress_callback: Optional[Callable[[str, int, str], None]] = None,
+    frame_selection: str = "keyframes",
+    video_sha256: Optional[str] = None
 ) -> Dict:
     """
     Complete pipeline: Video -> 3D Point Cloud
+    
+    Each stage is checkpointed in the job's stages.json (see StageManifest).
+    Re-running a job skips every stage whose parameters and upstream
+    artifacts are unchanged, and restarts from the first stage that is
+    missing, failed or out of date.
+    
+    progress_callback(stage, progress, message) is called when each stage
+    starts and finishes (stage names from PIPELINE_STAGES).
+    
+    frame_selection: "keyframes" (sharpness/motion-aware, default) or
+    "uniform" (max_frames spread evenly over the clip), see extract_frames.
+    
+    video_sha256 enables the artifact cache (see artifact_cache.py): a video
+    already reconstructed with the same parameters is restored into this
+    job instead of being processed again, and new results are cached.
     """
     job_path = f"/workspace/{job_id}"
-    processor = COLMAPProcessor(job_path)
     
-    # Step 1: Extract frames
-    frame_count = processor.extract_frames(video_path, max_frames=max_frames)
+    # Overall progress range (start %, end %) covered by each stage
+    stage_ranges = {}
+    previous = 0
+    for stage, end_progress in PIPELINE_STAGES:
+        stage_ranges[stage] = (previous, end_progress)
+        previous = end_progress
     
-    # Step 2: Extract features
-    feature_stats = processor.extract_features(quality=quality, use_gpu=True)
+    def on_stage_progress(stage: str, fraction: float, message: str):
+        # Live progress parsed from COLMAP/ffmpeg output while a stage runs
+        if progress_callback and stage in stage_ranges:
+            start, end = stage_ranges[stage]
+            progress_callback(stage, start + int((end - start) * fraction), message)
     
-    # Step 3: Match features
-    match_stats = processor.match_features(matching_type="sequential", use_gpu=True)
+    processor = COLMAPProcessor(job_path, progress_callback=on_stage_progress)
+    manifest = StageManifest(job_path)
+    video_stat = Path(video_path).stat()
+    use_gpu = gpu_available()  # CPU-only nodes get the CPU SIFT profile
     
-    # Step 4: Sparse reconstruction
-    recon_result = processor.sparse_reconstruction()
+    # Stage definitions, in PIPELINE_STAGES order
+    stages = {
+        "frame_extraction": {
+            "params": {
+                "video": Path(video_path).name,
+                "video_size": video_stat.st_size,
+                "video_mtime_ns": video_stat.st_mtime_ns,
+                "max_frames": max_frames,
+                "frame_selection": frame_selection
+            },
+            "outputs": ["images"],
+            "run": lambda: {"frame_count": processor.extract_frames(video_path, max_frames=max_frames, selection=frame_selection)},
+            "reset": processor.reset_frames
+        },
+        "feature_extraction": {
+            "params": {"quality": quality, "use_gpu": use_gpu},
+            "outputs": ["database.db"],
+            "run": lambda: processor.extract_features(quality=quality, use_gpu=use_gpu),
+            "reset": processor.reset_database,
+            # feature_matching writes to the same database.db
+            "fingerprint": processor.feature_fingerprint
+        },
+        "feature_matching": {
+            "params": {"matching_type": "retrieval", "use_gpu": use_gpu},
+            "outputs": ["database.db"],
+            "run": lambda: processor.match_features(matching_type="retrieval", use_gpu=use_gpu),
+            "reset": processor.reset_matches
+        },
+        "sparse_reconstruction": {
+            "params": {},
+            "outputs": ["sparse"],
+            "run": processor.sparse_reconstruction,
+            "reset": processor.reset_sparse
+        },
+        "export": {
+            "params": {"format": "PLY"},
+            "outputs": ["point_cloud.ply"],
+            "run": lambda: {"output_file": processor.export_point_cloud(output_format="PLY")},
+            "reset": None
+        },
+        "tiling": {
+            "params": {"max_points_per_tile": TILE_MAX_POINTS, "tiles_version": TILES_VERSION},
+            "outputs": ["tiles"],
+            "run": lambda: build_tiles(processor.job_path / "point_cloud.ply", processor.job_path / "tiles"),
+            "reset": None
+        }
+    }
     
-    # Step 5: Export point cloud
-    ply_file = processor.export_point_cloud(output_format="PLY")
+    # Content-addressed cache: the video's own name/size/mtime do not matter, its hash does
+    cache = ArtifactCache()
+    key = None
+    cached_results = None
+    if video_sha256 and cache.enabled:
+        params = {stage: dict(definition["params"]) for stage, definition in stages.items()}
+        for name in ("video", "video_size", "video_mtime_ns"):
+            params["frame_extraction"].pop(name)
+        key = cache_key(video_sha256, PIPELINE_VERSION, params)
+        try:
+            cached_results = cache.restore(key, processor.job_path)
+        except OSError as e:
+            logger.warning(f"Could not restore cached reconstruction {key[:12]}: {e}")
+    
+    results = {}
+    upstream = None
+    for stage, _ in PIPELINE_STAGES:
+        start_progress, end_progress = stage_ranges[stage]
+        definition = stages[stage]
+        input_hash = manifest.input_hash({"pipeline_version": PIPELINE_VERSION, **definition["params"]}, upstream)
+        
+        fingerprint = definition.get("fingerprint")
+        if manifest.is_valid(stage, input_hash, fingerprint):
+            logger.info(f"Stage {stage} is up to date, reusing checkpoint")
+            results[stage] = manifest.result(stage)
+            if progress_callback:
+                progress_callback(stage, end_progress, "Reused checkpoint")
+        elif cached_results and stage in cached_results:
+            # Outputs were linked in from the artifact cache: checkpoint them as completed
+            manifest.mark_started(stage, input_hash)
+            results[stage] = cached_results[stage]
+            manifest.mark_completed(stage, input_hash, definition["outputs"], results[stage], fingerprint)
+            if progress_callback:
+                progress_callback(stage, end_progress, "Restored from cache")
+        else:
+            if progress_callback:
+                progress_callback(stage, start_progress, f"Running {stage}")
+            if definition["reset"]:
+                definition["reset"]()
+            manifest.mark_started(stage, input_hash)
+            try:
+                results[stage] = definition["run"]()
+            except Exception as e:
+                manifest.mark_failed(stage, input_hash, str(e))
+                raise
+            manifest.mark_completed(stage, input_hash, definition["outputs"], results[stage], fingerprint)
+            if progress_callback:
+                progress_callback(stage, end_progress, f"Completed {stage}")
+        
+        upstream = stage
+    
+    if key and not cached_results:
+        try:
+            cache.store(key, processor.job_path, results)
+        except OSError as e:
+            logger.warning(f"Could not cache reconstruction {key[:12]}: {e}")
     
     return {
         "job_id": job_id,
-        "frame_count": frame_count,
-        "feature_stats": feature_stats,
-        "match_stats": match_stats,
-        "reconstruction": recon_result,
-        "output_file": ply_file
+        "frame_count": results["frame_extraction"]["frame_count"],
+        "feature_stats": results["feature_extraction"],
+        "match_stats": results["feature_matching"],
+        "reconstruction": results["sparse_reconstruction"],
+        "output_file": results["export"]["output_file"],
+        "tiles": results["tiling"]
     }
-
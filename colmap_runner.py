@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Streaming Subprocess Runner for COLMAP / ffmpeg
+Runs a command under asyncio, writes its output line by line to a rotating
+per-job log and parses progress events as they arrive. Memory use is bounded:
+only the current line and a short tail (for error messages) are kept.
+"""
+
+import asyncio
+import logging
+import re
+import subprocess
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024     # Longer lines are split rather than buffered
+TAIL_LINES = 50                # Kept for error messages
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Progress events per stage: group 1 = items done, group 2 = total (if printed)
+PROGRESS_PATTERNS = {
+    "frame_extraction": re.compile(r"frame=\s*(\d+)"),
+    "feature_extraction": re.compile(r"Processed file \[(\d+)/(\d+)\]"),
+    "feature_matching": re.compile(r"Matching (?:block|image) \[(\d+)/(\d+)"),
+    "sparse_reconstruction": re.compile(r"Registering image #\d+ \((\d+)\)"),
+}
+
+_FIRST_NUMBER = re.compile(r"(\d+)")
+_GLOG_PREFIX = re.compile(r"^[IWEF]\d{4} [\d:.]+\s+\d+ \S+\] ")  # e.g. "I1016 12:00:00.123 42 mapper.cc:88] "
+
+
+class CommandResult(NamedTuple):
+    returncode: int
+    stats: Dict   # Statistics parsed from the output while it streamed
+    tail: str     # Last TAIL_LINES lines of output
+
+
+class OutputParser:
+    """
+    Incremental parser for one command's output
+
+    feed() is called once per line; it updates self.stats and returns the
+    stage progress as a fraction (0..1) when a progress event is seen.
+    """
+
+    def __init__(self, stage: str, total: Optional[int] = None):
+        self.stage = stage
+        self.total = total
+        self.pattern = PROGRESS_PATTERNS.get(stage)
+        self.stats: Dict = {"saw_database": False}
+
+    def feed(self, line: str) -> Optional[float]:
+        if "Database" in line:
+            self.stats["saw_database"] = True
+        if "Matched" in line and "pairs" in line:
+            self._record_number("matched_pairs", line)
+        if "Registered" in line and "images" in line:
+            self._record_number("registered_images", line)
+        if "Reconstructed" in line and "points" in line:
+            self._record_number("reconstructed_points", line)
+
+        if not self.pattern:
+            return None
+        match = self.pattern.search(line)
+        if not match:
+            return None
+
+        done = int(match.group(1))
+        total = int(match.group(2)) if match.lastindex and match.lastindex >= 2 else self.total
+        self.stats["progress_items"] = done
+        if total:
+            self.stats["progress_total"] = total
+            return min(done / total, 1.0)
+        return None
+
+    def _record_number(self, key: str, line: str):
+        match = _FIRST_NUMBER.search(_GLOG_PREFIX.sub("", line))
+        if match:
+            self.stats[key] = int(match.group(1))
+
+
+def open_command_log(log_path: Path) -> RotatingFileHandler:
+    """Rotating log handler for a job's subprocess output"""
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(stage)s] %(message)s"))
+    return handler
+
+
+async def run_command_async(
+    cmd: List[str],
+    parser: OutputParser,
+    log_handler: Optional[logging.Handler] = None,
+    progress_callback: Optional[Callable[[float, str], None]] = None
+) -> CommandResult:
+    """
+    Run cmd, streaming stdout+stderr (merged) through parser and into the log.
+    progress_callback(fraction, line) fires on every parsed progress event.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        stdin=asyncio.subprocess.DEVNULL
+    )
+    tail = deque(maxlen=TAIL_LINES)
+
+    def handle_line(raw: bytes):
+        line = raw.decode("utf-8", errors="replace").rstrip()
+        if not line:
+            return
+        tail.append(line)
+        if log_handler:
+            log_handler.handle(logging.makeLogRecord({
+                "msg": line, "levelno": logging.INFO, "levelname": "INFO", "stage": parser.stage
+            }))
+        fraction = parser.feed(line)
+        if fraction is not None and progress_callback:
+            progress_callback(fraction, line)
+
+    # COLMAP ends lines with \n, ffmpeg progress with \r
+    pending = b""
+    while True:
+        chunk = await process.stdout.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        lines = re.split(rb"[\r\n]", pending + chunk)
+        pending = lines.pop()
+        if len(pending) > MAX_LINE_BYTES:
+            lines.append(pending)
+            pending = b""
+        for raw in lines:
+            handle_line(raw)
+    handle_line(pending)
+
+    returncode = await process.wait()
+    return CommandResult(returncode, parser.stats, "\n".join(tail))
+
+
+def run_command(
+    cmd: List[str],
+    parser: OutputParser,
+    log_handler: Optional[logging.Handler] = None,
+    progress_callback: Optional[Callable[[float, str], None]] = None,
+    check: bool = True
+) -> CommandResult:
+    """
+    Synchronous entry point used by COLMAPProcessor
+
+    Raises subprocess.CalledProcessError (with the output tail as stdout and
+    stderr) when check is set and the command fails, like subprocess.run.
+    """
+    coroutine_args = (cmd, parser, log_handler, progress_callback)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        result = asyncio.run(run_command_async(*coroutine_args))
+    else:
+        # Called from inside an event loop (e.g. a FastAPI handler): use a helper thread
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = asyncio.run(run_command_async(*coroutine_args))
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, name="command-runner")
+        thread.start()
+        thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        result = outcome["result"]
+
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, output=result.tail, stderr=result.tail)
+    return result
@@ -12,8 +12,15 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 import uuid
 
+from migrations import migrate, schema_columns
+from pagination import clamp_limit, page_query, page_result, projection
+from sqlite_pool import connect
+
 logger = logging.getLogger(__name__)
 
+# Database files whose schema this process has already brought up to date
+_schema_checked = set()
+
 class Database:
     """Simple SQLite database for storing COLMAP app data"""
     
@@ -27,103 +34,22 @@ class Database:
         self.init_database()
     
     def get_connection(self):
-        """Get database connection with row factory"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
-        return conn
+        """Borrow a pooled WAL connection (rows as sqlite3.Row); close() returns it to the pool"""
+        return connect(self.db_path)
     
     def init_database(self):
-        """Initialize database tables"""
+        """Create or upgrade the schema (see migrations.py), once per database file and process"""
+        key = str(Path(self.db_path).resolve())
+        if key in _schema_checked:
+            return
         conn = self.get_connection()
         try:
-            # Users table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    email TEXT UNIQUE NOT NULL,
-                    name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Projects table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS projects (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    location TEXT,
-                    space_type TEXT,
-                    project_type TEXT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Scans table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS scans (
-                    id TEXT PRIMARY KEY,
-                    project_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    video_filename TEXT,
-                    video_size INTEGER,
-                    video_duration REAL,
-                    processing_quality TEXT DEFAULT 'medium',
-                    thumbnail_path TEXT,
-                    ply_file TEXT,
-                    glb_file TEXT,
-                    thumbnail TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (project_id) REFERENCES projects (id)
-                )
-            ''')
-            
-            # Technical details table (stores COLMAP processing results)
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS scan_technical_details (
-                    scan_id TEXT PRIMARY KEY,
-                    point_count INTEGER,
-                    camera_count INTEGER,
-                    feature_count INTEGER,
-                    processing_time_seconds REAL,
-                    resolution TEXT,
-                    file_size_bytes INTEGER,
-                    reconstruction_error REAL,
-                    coverage_percentage REAL,
-                    processing_stages TEXT, -- JSON array of processing stages
-                    results TEXT, -- JSON object with file URLs
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (scan_id) REFERENCES scans (id)
-                )
-            ''')
-            
-            # Processing jobs table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS processing_jobs (
-                    job_id TEXT PRIMARY KEY,
-                    scan_id TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    progress INTEGER DEFAULT 0,
-                    current_stage TEXT,
-                    message TEXT,
-                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    FOREIGN KEY (scan_id) REFERENCES scans (id)
-                )
-            ''')
-            
-            conn.commit()
-            logger.info("Database initialized successfully")
-            
+            result = migrate(conn)
+            _schema_checked.add(key)
+            if result["applied"]:
+                logger.info(f"Database migrated to schema version {result['version']}")
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
-            conn.rollback()
             raise
         finally:
             conn.close()
@@ -178,14 +104,10 @@ class Database:
         """Get all projects for a user"""
         conn = self.get_connection()
         try:
-            rows = conn.execute('''
-                SELECT p.*, COUNT(s.id) as scan_count
-                FROM projects p
-                LEFT JOIN scans s ON p.id = s.project_id
-                WHERE p.user_id = ?
-                GROUP BY p.id
-                ORDER BY p.updated_at DESC
-            ''', (user_id,)).fetchall()
+            rows = conn.execute(
+                'SELECT * FROM projects WHERE user_id = ? ORDER BY updated_at DESC, id DESC',
+                (user_id,)
+            ).fetchall()
             return [dict(row) for row in rows]
         finally:
             conn.close()
@@ -424,19 +346,202 @@ class Database:
             conn.commit()
         finally:
             conn.close()
-    
-    def get_all_projects(self) -> List[Dict]:
-        """Get all projects"""
+
+    # Job queue methods (processing_jobs doubles as the persistent reconstruction queue)
+    def enqueue_job(self, job_id: str, scan_id: str, video_path: str,
+                    quality: str = "medium", max_frames: int = 50,
+                    video_sha256: Optional[str] = None):
+        """Add a reconstruction job to the queue"""
         conn = self.get_connection()
         try:
-            rows = conn.execute('''
-                SELECT p.*, COUNT(s.id) as scan_count
-                FROM projects p
-                LEFT JOIN scans s ON p.id = s.project_id
-                GROUP BY p.id
-                ORDER BY p.updated_at DESC
-            ''').fetchall()
-            return [dict(row) for row in rows]
+            conn.execute('''
+                INSERT INTO processing_jobs
+                (job_id, scan_id, status, progress, current_stage, message,
+                 video_path, video_sha256, quality, max_frames, started_at)
+                VALUES (?, ?, 'queued', 0, 'queued', 'Waiting for a worker', ?, ?, ?, ?, NULL)
+            ''', (job_id, scan_id, video_path, video_sha256, quality, max_frames))
+            conn.commit()
+            logger.info(f"Queued job: {job_id}")
+        finally:
+            conn.close()
+
+    def claim_next_job(self, worker_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Atomically move the oldest queued job to 'running' and return it.
+        BEGIN IMMEDIATE takes the write lock up front, so two dispatchers
+        (e.g. several uvicorn workers) can never claim the same job. The
+        claim is a lease held by worker_id: the owner keeps heartbeat_at
+        fresh (heartbeat_jobs) while the job runs.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT * FROM processing_jobs
+                WHERE status = 'queued'
+                ORDER BY rowid
+                LIMIT 1
+            ''').fetchone()
+            if not row:
+                conn.rollback()
+                return None
+
+            conn.execute('''
+                UPDATE processing_jobs
+                SET status = 'running', current_stage = 'starting', message = '',
+                    attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+                    worker_id = ?, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            ''', (worker_id, row['job_id']))
+            conn.execute("UPDATE scans SET status = 'processing' WHERE id = ?", (row['scan_id'],))
+            conn.commit()
+            return dict(row)
+        finally:
+            conn.close()
+
+    def update_job_progress(self, job_id: str, worker_id: str, progress: int,
+                            current_stage: str, message: str = "") -> bool:
+        """
+        Record per-stage progress for a running job; False (nothing written)
+        when worker_id no longer holds the job's lease
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE processing_jobs
+                SET progress = ?, current_stage = ?, message = ?
+                WHERE job_id = ? AND worker_id = ? AND status = 'running'
+            ''', (progress, current_stage, message, job_id, worker_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def finish_job(self, job_id: str, worker_id: str, status: str, message: str = "") -> bool:
+        """
+        Mark a job (and its scan) as completed or failed. Only the lease
+        holder may finish it: a worker whose job was requeued and claimed
+        again elsewhere gets False and leaves the new run's status alone.
+        """
+        conn = self.get_connection()
+        try:
+            if status == 'completed':
+                cursor = conn.execute('''
+                    UPDATE processing_jobs
+                    SET status = ?, progress = 100, current_stage = 'completed',
+                        message = ?, completed_at = CURRENT_TIMESTAMP
+                    WHERE job_id = ? AND worker_id = ? AND status = 'running'
+                ''', (status, message, job_id, worker_id))
+            else:
+                cursor = conn.execute('''
+                    UPDATE processing_jobs
+                    SET status = ?, message = ?, completed_at = CURRENT_TIMESTAMP
+                    WHERE job_id = ? AND worker_id = ? AND status = 'running'
+                ''', (status, message, job_id, worker_id))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+            conn.execute('''
+                UPDATE scans SET status = ?
+                WHERE id = (SELECT scan_id FROM processing_jobs WHERE job_id = ?)
+            ''', (status, job_id))
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+
+    def release_job(self, job_id: str, worker_id: str) -> bool:
+        """Put a job worker_id claimed but never started back on the queue, without waiting for its lease"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE processing_jobs
+                SET status = 'queued', current_stage = 'queued', message = 'Waiting for a worker',
+                    attempts = attempts - 1, worker_id = NULL, heartbeat_at = NULL
+                WHERE job_id = ? AND worker_id = ? AND status = 'running'
+            ''', (job_id, worker_id))
+            if cursor.rowcount:
+                conn.execute('''
+                    UPDATE scans SET status = 'queued'
+                    WHERE id = (SELECT scan_id FROM processing_jobs WHERE job_id = ?)
+                ''', (job_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def requeue_job(self, job_id: str) -> bool:
+        """Put a finished or failed job back on the queue (it resumes from its checkpoints)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE processing_jobs
+                SET status = 'queued', current_stage = 'queued', message = 'Retry requested',
+                    completed_at = NULL
+                WHERE job_id = ? AND status IN ('failed', 'completed')
+            ''', (job_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def heartbeat_jobs(self, worker_id: str) -> int:
+        """Renew the lease of every job worker_id is running"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE processing_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND worker_id = ?
+            ''', (worker_id,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def requeue_interrupted_jobs(self, lease_seconds: int) -> int:
+        """
+        Put jobs left 'running' by a crashed or restarted server back on the queue
+        Only jobs whose lease expired (no heartbeat for lease_seconds) are
+        requeued; jobs another live worker is running keep their owner.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE processing_jobs
+                SET status = 'queued', current_stage = 'queued', message = 'Requeued after restart',
+                    worker_id = NULL
+                WHERE status = 'running'
+                  AND (heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))
+            ''', (f"-{int(lease_seconds)} seconds",))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a processing job by ID"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT * FROM processing_jobs WHERE job_id = ?', (job_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def get_all_projects(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                         fields: Optional[str] = None) -> Dict:
+        """
+        Projects, most recently updated first (see pagination.py): all of
+        them, or one page when limit or cursor is given. Returns
+        {"projects": [...], "next_cursor": str or None}; raises
+        ValueError for a malformed cursor or unknown fields.
+        """
+        limit = clamp_limit(limit, cursor)
+        columns = projection(fields, schema_columns("projects"))
+        sql, params = page_query("projects", columns, {}, cursor, limit)
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+            return page_result([dict(row) for row in rows], limit, "projects")
         finally:
             conn.close()
     
@@ -444,13 +549,7 @@ class Database:
         """Get a project by ID with scan count"""
         conn = self.get_connection()
         try:
-            row = conn.execute('''
-                SELECT p.*, COUNT(s.id) as scan_count
-                FROM projects p
-                LEFT JOIN scans s ON p.id = s.project_id
-                WHERE p.id = ?
-                GROUP BY p.id
-            ''', (project_id,)).fetchone()
+            row = conn.execute('SELECT * FROM projects WHERE id = ?', (project_id,)).fetchone()
             return dict(row) if row else None
         finally:
             conn.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Per-image SIFT Feature Cache
+Keypoints and descriptors are cached per (image content SHA-256, SIFT
+options) in one SQLite file shared by all jobs. extract_features copies
+cached features straight into the job's COLMAP database.db and runs
+`colmap feature_extractor` only on the images that are missing.
+
+Blobs move between the two databases with ATTACH + INSERT ... SELECT, so
+they are never decoded or round-tripped through Python.
+Reference: https://colmap.github.io/database.html
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_PATH = Path(os.getenv("FEATURE_CACHE_PATH", "/workspace/cache/features.db"))
+FEATURE_CACHE_MAX_BYTES = int(float(os.getenv("FEATURE_CACHE_MAX_GB", "20")) * 1024 ** 3)  # 0 disables the cache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    image_hash TEXT NOT NULL,
+    options_key TEXT NOT NULL,
+    camera_model INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    camera_params BLOB,
+    prior_focal_length INTEGER NOT NULL,
+    keypoint_rows INTEGER NOT NULL,
+    keypoint_cols INTEGER NOT NULL,
+    keypoints BLOB,
+    descriptor_rows INTEGER NOT NULL,
+    descriptor_cols INTEGER NOT NULL,
+    descriptors BLOB,
+    size_bytes INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (image_hash, options_key)
+);
+CREATE INDEX IF NOT EXISTS idx_features_last_used ON features(last_used);
+"""
+
+
+def options_key(options: Dict) -> str:
+    """Key for a set of SIFT extraction options (canonical JSON, SHA-256)"""
+    payload = json.dumps(options, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hash_images(image_dir: Path, names: Iterable[str]) -> Dict[str, str]:
+    """SHA-256 of each image's bytes, by name"""
+    hashes = {}
+    for name in names:
+        with open(Path(image_dir) / name, "rb") as f:
+            hashes[name] = hashlib.file_digest(f, "sha256").hexdigest()
+    return hashes
+
+
+class FeatureCache:
+    """Features keyed by (image_hash, options_key); see module docstring"""
+
+    def __init__(self, path: Path = FEATURE_CACHE_PATH, max_bytes: int = FEATURE_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self, database_path: Path) -> sqlite3.Connection:
+        """Connection to a COLMAP database with the cache attached as `cache`"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(database_path, timeout=60)
+        conn.execute("ATTACH DATABASE ? AS cache", (str(self.path),))
+        conn.execute("PRAGMA cache.journal_mode=WAL")
+        conn.executescript(SCHEMA.replace("EXISTS features", "EXISTS cache.features")
+                           .replace("EXISTS idx_", "EXISTS cache.idx_"))
+        return conn
+
+    def _stage_wanted(self, conn: sqlite3.Connection, images: Dict[str, str]):
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (name TEXT PRIMARY KEY, image_hash TEXT NOT NULL)")
+        conn.execute("DELETE FROM temp.wanted")
+        conn.executemany("INSERT INTO temp.wanted VALUES (?, ?)", images.items())
+
+    def cached(self, image_hashes: Iterable[str], key: str) -> Set[str]:
+        """Which of these image hashes have features cached for options key"""
+        if not self.path.exists():
+            return set()
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.execute(SCHEMA.split(";")[0])
+            conn.execute("CREATE TEMP TABLE lookup (image_hash TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO temp.lookup VALUES (?)", ((h,) for h in image_hashes))
+            rows = conn.execute(
+                "SELECT f.image_hash FROM features f JOIN temp.lookup USING (image_hash) WHERE f.options_key = ?",
+                (key,)
+            ).fetchall()
+            return {row[0] for row in rows}
+        finally:
+            conn.close()
+
+    def copy_to_database(self, database_path: Path, images: Dict[str, str], key: str) -> int:
+        """
+        Insert cached images (name -> image_hash) into a COLMAP database:
+        image rows on the database's camera (created from the cache if there
+        is none yet, as with --ImageReader.single_camera), keypoints and
+        descriptors. Images evicted since they were looked up are skipped;
+        returns the number of images actually added.
+        """
+        conn = self._connect(database_path)
+        try:
+            with conn:
+                self._stage_wanted(conn, images)
+                row = conn.execute("SELECT camera_id FROM cameras ORDER BY camera_id LIMIT 1").fetchone()
+                if row:
+                    camera_id = row[0]
+                else:
+                    camera_id = conn.execute(
+                        """INSERT INTO cameras (model, width, height, params, prior_focal_length)
+                           SELECT f.camera_model, f.width, f.height, f.camera_params, f.prior_focal_length
+                           FROM temp.wanted w JOIN cache.features f
+                             ON f.image_hash = w.image_hash AND f.options_key = ?
+                           LIMIT 1""", (key,)
+                    ).lastrowid
+                added = conn.execute(
+                    """INSERT INTO images (name, camera_id)
+                       SELECT w.name, ? FROM temp.wanted w
+                       JOIN cache.features f ON f.image_hash = w.image_hash AND f.options_key = ?
+                       ORDER BY w.name""", (camera_id, key)
+                ).rowcount
+                conn.execute(
+                    """INSERT INTO keypoints (image_id, rows, cols, data)
+                       SELECT i.image_id, f.keypoint_rows, f.keypoint_cols, f.keypoints
+                       FROM temp.wanted w
+                       JOIN images i ON i.name = w.name
+                       JOIN cache.features f ON f.image_hash = w.image_hash AND f.options_key = ?""", (key,)
+                )
+                conn.execute(
+                    """INSERT INTO descriptors (image_id, rows, cols, data)
+                       SELECT i.image_id, f.descriptor_rows, f.descriptor_cols, f.descriptors
+                       FROM temp.wanted w
+                       JOIN images i ON i.name = w.name
+                       JOIN cache.features f ON f.image_hash = w.image_hash AND f.options_key = ?""", (key,)
+                )
+                conn.execute(
+                    """UPDATE cache.features SET last_used = ?
+                       WHERE options_key = ? AND image_hash IN (SELECT image_hash FROM temp.wanted)""",
+                    (time.time(), key)
+                )
+            return added
+        finally:
+            conn.close()
+
+    def add_from_database(self, database_path: Path, images: Dict[str, str], key: str) -> int:
+        """Cache the features of these images (name -> image_hash) from a COLMAP database"""
+        conn = self._connect(database_path)
+        try:
+            with conn:
+                self._stage_wanted(conn, images)
+                added = conn.execute(
+                    """INSERT OR REPLACE INTO cache.features
+                       SELECT w.image_hash, ?, c.model, c.width, c.height, c.params, c.prior_focal_length,
+                              k.rows, k.cols, k.data, d.rows, d.cols, d.data,
+                              length(k.data) + length(d.data), ?
+                       FROM temp.wanted w
+                       JOIN images i ON i.name = w.name
+                       JOIN cameras c ON c.camera_id = i.camera_id
+                       JOIN keypoints k ON k.image_id = i.image_id
+                       JOIN descriptors d ON d.image_id = i.image_id""",
+                    (key, time.time())
+                ).rowcount
+                self._prune(conn)
+            return added
+        finally:
+            conn.close()
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Delete least recently used features until the cache fits max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM cache.features").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Oldest rows first, until the freed bytes cover the excess
+        removed = conn.execute(
+            """DELETE FROM cache.features WHERE rowid IN (
+                   SELECT rowid FROM (
+                       SELECT rowid, SUM(size_bytes) OVER (ORDER BY last_used, rowid ROWS UNBOUNDED PRECEDING)
+                                     - size_bytes AS freed_before
+                       FROM cache.features)
+                   WHERE freed_before < ?)""", (total - self.max_bytes,)
+        ).rowcount
+        logger.info(f"Feature cache over {self.max_bytes} bytes, evicted {removed} images")
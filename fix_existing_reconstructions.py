@@ -9,6 +9,8 @@ import sys
 from pathlib import Path
 import zipfile
 
+from colmap_model import count_points3D
+
 def find_best_sparse_model(sparse_zip_path):
     """Find the sparse model directory with the most points"""
     if not sparse_zip_path.exists():
@@ -31,16 +33,17 @@ def find_best_sparse_model(sparse_zip_path):
         if d.is_dir():
             points_file = d / "points3D.bin"
             if points_file.exists():
-                size = points_file.stat().st_size
-                models.append((d, size))
-                print(f"  Found model {d.name}: {size} bytes")
+                # Exact count from the header (file size is skewed by track lengths)
+                num_points = count_points3D(points_file)
+                models.append((d, num_points))
+                print(f"  Found model {d.name}: {num_points} points")
     
     if not models:
         return None
     
     # Return path to best model
     best_model = max(models, key=lambda x: x[1])
-    print(f"  ✓ Best model: {best_model[0].name} ({best_model[1]} bytes)")
+    print(f"  ✓ Best model: {best_model[0].name} ({best_model[1]} points)")
     return best_model[0]
 
 def export_to_ply(model_dir, output_path):
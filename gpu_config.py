@@ -0,0 +1,87 @@
+"""
+Deployment configuration loader
+Reads config/gpu.json (hardware, COLMAP and performance settings)
+"""
+
+import json
+import logging
+import os
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = Path(os.getenv("GPU_CONFIG_PATH", Path(__file__).parent / "config" / "gpu.json"))
+
+
+@lru_cache(maxsize=1)
+def load_gpu_config() -> Dict:
+    """Load config/gpu.json once per process (empty dict if missing or invalid)"""
+    try:
+        with open(CONFIG_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load {CONFIG_PATH}: {e}")
+        return {}
+
+
+def get_max_concurrent_jobs() -> int:
+    """
+    Number of reconstructions allowed to run at once
+    MAX_CONCURRENT_JOBS overrides performance.max_concurrent_jobs
+    """
+    value = os.getenv("MAX_CONCURRENT_JOBS")
+    if value is None:
+        value = load_gpu_config().get("performance", {}).get("max_concurrent_jobs", 1)
+    return max(1, int(value))
+
+
+def get_num_threads() -> int:
+    """
+    Upper bound on the threads one COLMAP pipeline may use
+    COLMAP_NUM_THREADS overrides colmap.num_threads (0: no bound)
+    """
+    value = os.getenv("COLMAP_NUM_THREADS")
+    if value is None:
+        value = load_gpu_config().get("colmap", {}).get("num_threads", 0)
+    return max(0, int(value))
+
+
+def get_max_memory_bytes() -> int:
+    """
+    Memory the pipelines of one node may use together
+    MAX_MEMORY_GB overrides performance.max_memory_gb (0: no bound)
+    """
+    value = os.getenv("MAX_MEMORY_GB")
+    if value is None:
+        value = load_gpu_config().get("performance", {}).get("max_memory_gb", 0)
+    return max(0, int(float(value) * 1024 ** 3))
+
+
+@lru_cache(maxsize=1)
+def gpu_available() -> bool:
+    """
+    Whether COLMAP can run SIFT on a CUDA GPU on this node
+    Needs colmap.gpu_enabled (COLMAP_GPU_ENABLED=0 turns it off), a device
+    listed by nvidia-smi and a COLMAP build "with CUDA".
+    """
+    enabled = os.getenv("COLMAP_GPU_ENABLED")
+    if enabled is None:
+        enabled = load_gpu_config().get("colmap", {}).get("gpu_enabled", True)
+    if str(enabled).lower() in ("0", "false", "no"):
+        return False
+    try:
+        devices = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10)
+        if devices.returncode != 0 or "GPU" not in devices.stdout:
+            logger.info("No NVIDIA GPU found, using the CPU profile")
+            return False
+        build = subprocess.run(["colmap", "help"], capture_output=True, text=True, timeout=10)
+        if "without CUDA" in build.stdout + build.stderr:
+            logger.info("COLMAP was built without CUDA, using the CPU profile")
+            return False
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.info(f"GPU detection failed ({e}), using the CPU profile")
+        return False
+    return True
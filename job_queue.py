@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Background Reconstruction Job Queue
+Persistent queue backed by the processing_jobs table, drained by a bounded
+pool of worker processes (one COLMAP pipeline per worker).
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from database import Database
+from gpu_config import get_max_concurrent_jobs
+from resource_planner import job_slot, plan
+
+logger = logging.getLogger(__name__)
+
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))  # Lease renewal interval
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))           # Running jobs without a heartbeat this long are requeued
+PARENT_CHECK_SECONDS = 2.0                                                 # How often workers check the API process is alive
+
+
+def _init_worker(parent_pid: int):
+    """
+    Worker process initializer: once the API process is gone its jobs are
+    requeued and rerun elsewhere, so the worker and the COLMAP/ffmpeg
+    processes it started (its own process group) are killed instead of
+    running on as orphans in the same job directory
+    """
+    os.setpgrp()
+
+    def watch_parent():
+        while os.getppid() == parent_pid:
+            time.sleep(PARENT_CHECK_SECONDS)
+        logger.error("API process exited, stopping worker")
+        os.killpg(0, signal.SIGKILL)
+
+    threading.Thread(target=watch_parent, name="parent-watch", daemon=True).start()
+
+
+def _run_job(db_path: str, job: Dict, worker_id: str) -> Dict:
+    """
+    Worker process entry point: run the full pipeline for one claimed job
+    and record per-stage progress in processing_jobs as it goes. Writes are
+    conditional on worker_id still holding the job's lease.
+    """
+    from colmap_processor import process_video_to_pointcloud
+
+    logging.basicConfig(level=logging.INFO)
+    database = Database(db_path)
+    job_id = job["job_id"]
+
+    def report_progress(stage: str, progress: int, message: str = ""):
+        if not database.update_job_progress(job_id, worker_id, progress, stage, message):
+            logger.warning(f"Job {job_id} is no longer leased to {worker_id}, progress not recorded")
+
+    try:
+        # Holding a slot makes concurrent pipelines on this node split the cores
+        with job_slot(job_id):
+            logger.info(f"Job {job_id} resources: {plan()}")
+            result = process_video_to_pointcloud(
+                job_id,
+                job["video_path"],
+                quality=job.get("quality") or "medium",
+                max_frames=job.get("max_frames") or 50,
+                progress_callback=report_progress,
+                video_sha256=job.get("video_sha256")
+            )
+        database.finish_job(job_id, worker_id, "completed", f"Point cloud exported to {result['output_file']}")
+        return result
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        database.finish_job(job_id, worker_id, "failed", str(e))
+        raise
+
+
+class JobQueue:
+    """
+    Dispatches queued reconstruction jobs to a pool of worker processes
+
+    - Jobs are persisted in processing_jobs, so a restart loses nothing:
+      a running job is leased to this queue's worker_id and the lease is
+      renewed every JOB_HEARTBEAT_SECONDS; any queue (this one after a
+      restart, or another uvicorn worker) requeues jobs whose lease
+      expired, never jobs a live worker is still running
+    - At most max_workers pipelines run at once (performance.max_concurrent_jobs)
+    - The dispatcher is a plain thread, so the event loop is never blocked
+    """
+
+    def __init__(self, db_path: str, max_workers: Optional[int] = None, poll_interval: float = 2.0):
+        self.db = Database(db_path)
+        self.max_workers = max_workers or get_max_concurrent_jobs()
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._next_heartbeat = 0.0
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._slots = threading.Semaphore(self.max_workers)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._running: Dict[str, Future] = {}
+
+    def start(self):
+        """Recover interrupted jobs and start dispatching"""
+        requeued = self.db.requeue_interrupted_jobs(JOB_LEASE_SECONDS)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs")
+        self._next_heartbeat = time.monotonic() + JOB_HEARTBEAT_SECONDS
+
+        self._executor = self._create_executor()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+        logger.info(f"Job queue started with {self.max_workers} worker processes")
+
+    def stop(self, wait: bool = False):
+        """
+        Stop dispatching; running jobs are requeued once their lease expires
+        (workers kill themselves when this process exits, see _init_worker)
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._executor:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info("Job queue stopped")
+
+    def enqueue(self, job_id: str, scan_id: str, video_path: str,
+                quality: str = "medium", max_frames: int = 50,
+                video_sha256: Optional[str] = None):
+        """Persist a job and wake the dispatcher"""
+        self.db.enqueue_job(job_id, scan_id, video_path, quality, max_frames, video_sha256)
+        self._wakeup.set()
+
+    def retry(self, job_id: str) -> bool:
+        """Requeue a failed/completed job; unchanged stages are skipped on rerun"""
+        requeued = self.db.requeue_job(job_id)
+        if requeued:
+            self._wakeup.set()
+        return requeued
+
+    def active_jobs(self) -> int:
+        """Number of jobs currently running in this process's pool"""
+        with self._lock:
+            return len(self._running)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the API process is multi-threaded
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(os.getpid(),)
+        )
+
+    def _heartbeat(self):
+        """Renew this queue's leases and recover jobs whose owner is gone"""
+        if time.monotonic() < self._next_heartbeat:
+            return
+        self._next_heartbeat = time.monotonic() + JOB_HEARTBEAT_SECONDS
+        try:
+            if self.active_jobs():
+                self.db.heartbeat_jobs(self.worker_id)
+            requeued = self.db.requeue_interrupted_jobs(JOB_LEASE_SECONDS)
+            if requeued:
+                logger.info(f"Requeued {requeued} jobs with expired leases")
+                self._wakeup.set()
+        except Exception as e:
+            logger.error(f"Job heartbeat failed: {e}")
+
+    def _dispatch_loop(self):
+        while not self._stopping.is_set():
+            self._heartbeat()
+            if not self._slots.acquire(timeout=self.poll_interval):
+                continue
+
+            try:
+                job = self.db.claim_next_job(self.worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                self._slots.release()
+                # Woken early by enqueue(); the timeout picks up jobs queued by other processes
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._submit(job)
+
+    def _submit(self, job: Dict):
+        job_id = job["job_id"]
+        try:
+            try:
+                future = self._executor.submit(_run_job, self.db.db_path, job, self.worker_id)
+            except BrokenProcessPool:
+                logger.warning("Worker pool broken, recreating")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+                future = self._executor.submit(_run_job, self.db.db_path, job, self.worker_id)
+        except Exception as e:
+            # Executor shut down or unusable: hand the claimed job back right away
+            logger.error(f"Could not dispatch job {job_id}: {e}")
+            self._slots.release()
+            self._release(job_id)
+            return
+
+        with self._lock:
+            self._running[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_job_done(job_id, f))
+        logger.info(f"Dispatched job {job_id}")
+
+    def _release(self, job_id: str):
+        """Put a claimed job that never started back on the queue"""
+        try:
+            if self.db.release_job(job_id, self.worker_id):
+                self._wakeup.set()
+        except Exception as e:
+            logger.error(f"Failed to release job {job_id}, it is requeued when its lease expires: {e}")
+
+    def _on_job_done(self, job_id: str, future: Future):
+        with self._lock:
+            self._running.pop(job_id, None)
+        self._slots.release()
+        self._wakeup.set()
+
+        if future.cancelled():
+            # Cancelled by stop() before a worker picked it up
+            self._release(job_id)
+            return
+        error = future.exception()
+        if error is None:
+            logger.info(f"Job {job_id} completed")
+        elif isinstance(error, BrokenProcessPool):
+            # The worker died before it could record the failure itself
+            logger.error(f"Job {job_id} worker crashed")
+            self.db.finish_job(job_id, self.worker_id, "failed", "Worker process crashed")
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Keyframe Selection for Video Input
+Picks fewer, better frames for SfM instead of one frame every N seconds:
+
+1. Decode the video once at low resolution (ffmpeg rawvideo pipe, grayscale)
+2. Score every frame: sharpness (variance of the Laplacian), motion since
+   the previous frame (median sparse optical flow), perceptual hash
+3. Walk the accumulated motion in equal steps and keep the sharpest frame
+   of each step; drop blurry frames and near-duplicates (dHash)
+
+Static shots collapse to a few frames, fast pans keep denser coverage.
+The selected frame numbers refer to the video sampled at analysis_fps, so
+the full-resolution frames are written with the same fps filter + select.
+
+Long videos are decoded as parallel time segments (plan_segments): each
+segment starts on a frame boundary of the sampling rate, so frame numbers
+stay global and the segments can be stitched back together exactly.
+"""
+
+import logging
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from video_probe import probe_video
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WIDTH = 320           # Frames are analysed at this width
+ANALYSIS_FPS = 4.0             # Candidate frames per second of video
+MAX_ANALYZED_FRAMES = 2400     # Long videos are analysed at a lower rate
+MOTION_STEP = 0.08             # Min. motion between keyframes (fraction of frame width)
+MIN_KEYFRAMES = 8              # Relax MOTION_STEP if the video yields fewer
+BLUR_RATIO = 0.35              # Drop frames below this fraction of the median sharpness
+DUPLICATE_HASH_DISTANCE = 4    # dHash Hamming distance treated as the same view
+FALLBACK_FRAME_INTERVAL = 2.0  # Uniform sampling interval (seconds) when the duration is unknown
+
+
+def analysis_fps(duration: float) -> float:
+    """Candidate frame rate: ANALYSIS_FPS, lowered so at most MAX_ANALYZED_FRAMES are decoded"""
+    if duration <= 0:
+        return ANALYSIS_FPS
+    return round(min(ANALYSIS_FPS, MAX_ANALYZED_FRAMES / duration), 4)
+
+
+def uniform_interval(duration: float, fps: float, max_frames: int) -> float:
+    """
+    Spacing (seconds) that spreads max_frames samples evenly over the whole
+    clip; never shorter than one source frame, FALLBACK_FRAME_INTERVAL
+    when the duration is unknown
+    """
+    if duration <= 0:
+        return FALLBACK_FRAME_INTERVAL
+    interval = duration / max(max_frames, 1)
+    return max(interval, 1.0 / fps) if fps > 0 else interval
+
+
+def plan_segments(duration: float, fps: float, count: int) -> List[Tuple[int, float, float]]:
+    """
+    Split [0, duration) into count time segments for parallel decoding
+
+    Boundaries fall on multiples of 1/fps, so frame k of a segment sampled
+    at fps is global frame first_frame + k. Returns (first_frame, start
+    seconds, length seconds) per segment; fewer than count for short videos.
+    """
+    total = max(int(np.ceil(duration * fps - 1e-9)), 1)
+    bounds = sorted({round(i * total / max(count, 1)) for i in range(max(count, 1) + 1)})
+    return [(first, first / fps, (end - first) / fps) for first, end in zip(bounds[:-1], bounds[1:])]
+
+
+def segment_args(start: float, length: Optional[float]) -> List[str]:
+    """ffmpeg input options that limit decoding to [start, start + length)"""
+    args = ["-ss", f"{start:.6f}"] if start > 0 else []
+    if length is not None:
+        args += ["-t", f"{length:.6f}"]
+    return args
+
+
+def decode_gray_frames(video_path: str, fps: float, width: int, height: int,
+                       start: float = 0.0, length: Optional[float] = None) -> Iterator[np.ndarray]:
+    """Yield (height, width) uint8 grayscale frames from an ffmpeg rawvideo pipe"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-v", "error", *segment_args(start, length), "-i", video_path,
+         "-vf", f"fps={fps},scale={width}:{height}",
+         "-f", "rawvideo", "-pix_fmt", "gray", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL
+    )
+    frame_bytes = width * height
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width)
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="replace")
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, "ffmpeg", stderr=stderr)
+
+
+def sharpness(frame: np.ndarray) -> float:
+    """Variance of the Laplacian (higher = sharper)"""
+    return float(cv2.Laplacian(frame, cv2.CV_64F).var())
+
+
+def dhash(frame: np.ndarray) -> int:
+    """64-bit difference hash (perceptual: robust to blur, noise and exposure)"""
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def estimate_motion(previous: np.ndarray, frame: np.ndarray) -> float:
+    """
+    Image motion between two frames as a fraction of the frame width:
+    median sparse optical flow (Lucas-Kanade), phase correlation if too
+    few corners can be tracked
+    """
+    corners = cv2.goodFeaturesToTrack(previous, maxCorners=200, qualityLevel=0.01, minDistance=7)
+    if corners is not None and len(corners) >= 10:
+        tracked, status, _ = cv2.calcOpticalFlowPyrLK(previous, frame, corners, None)
+        ok = status.ravel() == 1
+        if ok.sum() >= 10:
+            displacement = np.linalg.norm((tracked - corners).reshape(-1, 2)[ok], axis=1)
+            return float(np.median(displacement)) / frame.shape[1]
+    (dx, dy), _ = cv2.phaseCorrelate(previous.astype(np.float32), frame.astype(np.float32))
+    return float(np.hypot(dx, dy)) / frame.shape[1]
+
+
+def score_frames(frames: Iterable[np.ndarray], progress: Optional[Callable[[int], None]] = None,
+                 first_number: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Per-frame sharpness, motion from the previous frame and dHash
+    Frames are numbered from first_number; first_frame / last_frame are
+    kept so segments can be joined (join_scores).
+    """
+    scores, motion, hashes = [], [], []
+    first = previous = None
+    for index, frame in enumerate(frames):
+        if first is None:
+            first = frame
+        scores.append(sharpness(frame))
+        motion.append(estimate_motion(previous, frame) if previous is not None else 0.0)
+        hashes.append(dhash(frame))
+        previous = frame
+        if progress:
+            progress(index + 1)
+    return {
+        "sharpness": np.array(scores, dtype=np.float64),
+        "motion": np.array(motion, dtype=np.float64),
+        "hashes": np.array(hashes, dtype=np.uint64),
+        "frame_numbers": np.arange(first_number, first_number + len(scores), dtype=np.int64),
+        "first_frame": first,
+        "last_frame": previous,
+    }
+
+
+def join_scores(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Concatenate per-segment scores, measuring the motion across each segment boundary"""
+    parts = [part for part in parts if len(part["sharpness"])]
+    if not parts:
+        return score_frames([])
+    motion = [part["motion"].copy() for part in parts]
+    for i in range(1, len(parts)):
+        motion[i][0] = estimate_motion(parts[i - 1]["last_frame"], parts[i]["first_frame"])
+    return {
+        "sharpness": np.concatenate([part["sharpness"] for part in parts]),
+        "motion": np.concatenate(motion),
+        "hashes": np.concatenate([part["hashes"] for part in parts]),
+        "frame_numbers": np.concatenate([part["frame_numbers"] for part in parts]),
+        "first_frame": parts[0]["first_frame"],
+        "last_frame": parts[-1]["last_frame"],
+    }
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(int(a) ^ int(b)).count("1")
+
+
+def choose_keyframes(scores: Dict[str, np.ndarray], max_frames: int) -> List[int]:
+    """
+    Indices of the selected frames
+
+    The accumulated motion is cut into equal steps (at least MOTION_STEP,
+    larger if that would exceed max_frames); each step keeps its sharpest
+    frame unless it is blurry or a near-duplicate of the previous keyframe.
+    """
+    sharp = scores["sharpness"]
+    count = len(sharp)
+    if count == 0:
+        return []
+    travelled = np.cumsum(scores["motion"])
+    total = float(travelled[-1])
+
+    step = max(MOTION_STEP, total / max(max_frames - 1, 1))
+    if total / step + 1 < min(MIN_KEYFRAMES, max_frames):
+        step = total / max(min(MIN_KEYFRAMES, max_frames) - 1, 1) or 1.0
+    bins = np.floor(travelled / step).astype(np.int64)
+
+    # Blur threshold relative to the video's own sharpness distribution
+    blur_threshold = BLUR_RATIO * float(np.median(sharp))
+    usable = sharp >= blur_threshold
+
+    selected: List[int] = []
+    for bin_id in np.unique(bins):
+        members = np.flatnonzero(bins == bin_id)
+        candidates = members[usable[members]]
+        if len(candidates) == 0:
+            continue
+        best = int(candidates[np.argmax(sharp[candidates])])
+        if selected and _hamming(scores["hashes"][best], scores["hashes"][selected[-1]]) <= DUPLICATE_HASH_DISTANCE:
+            # Same view as the previous keyframe: keep whichever is sharper
+            if sharp[best] > sharp[selected[-1]]:
+                selected[-1] = best
+            continue
+        selected.append(best)
+
+    return selected[:max_frames]
+
+
+def select_keyframes(video_path: str, max_frames: int,
+                     progress: Optional[Callable[[float], None]] = None,
+                     segments: int = 1, info: Optional[Dict] = None) -> Dict:
+    """
+    Analyse a video and choose its keyframes
+
+    segments > 1 decodes and scores that many time segments in parallel
+    (one ffmpeg process each). info is a probe_video result to reuse.
+    Returns analysis_fps, frame size, the selected frame numbers (at
+    analysis_fps, 0-based) and summary statistics.
+    """
+    info = info or probe_video(video_path)
+    fps = analysis_fps(info["duration"])
+    width = ANALYSIS_WIDTH
+    height = max(2, int(round(info["height"] * width / info["width"] / 2)) * 2)
+    expected = max(int(info["duration"] * fps), 1)
+
+    done = 0
+    lock = threading.Lock()
+
+    def on_frame(_count: int):
+        nonlocal done
+        with lock:
+            done += 1
+            if progress:
+                progress(min(done / expected, 1.0))
+
+    plan = plan_segments(info["duration"], fps, segments) if segments > 1 else []
+    if len(plan) > 1:
+        def score_segment(segment: Tuple[int, float, float]) -> Dict[str, np.ndarray]:
+            first_frame, start, length = segment
+            frames = decode_gray_frames(video_path, fps, width, height, start=start, length=length)
+            try:
+                # Boundaries are frame-exact; cap in case the demuxer overshoots
+                capped = (frame for _, frame in zip(range(round(length * fps)), frames))
+                return score_frames(capped, progress=on_frame, first_number=first_frame)
+            finally:
+                frames.close()
+
+        with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            scores = join_scores(list(executor.map(score_segment, plan)))
+    else:
+        scores = score_frames(decode_gray_frames(video_path, fps, width, height), progress=on_frame)
+    selected = [int(scores["frame_numbers"][i]) for i in choose_keyframes(scores, max_frames)]
+
+    analyzed = len(scores["sharpness"])
+    logger.info(f"Selected {len(selected)} keyframes from {analyzed} candidates "
+                f"({fps} fps, total motion {scores['motion'].sum():.2f} frame widths)")
+    return {
+        "analysis_fps": fps,
+        "video_width": info["width"],
+        "video_height": info["height"],
+        "duration": info["duration"],
+        "frames_analyzed": analyzed,
+        "selected": selected,
+        "median_sharpness": round(float(np.median(scores["sharpness"])), 2) if analyzed else 0.0,
+        "total_motion": round(float(scores["motion"].sum()), 4),
+    }
+
+
+def select_filter(fps: float, frames: List[int]) -> str:
+    """ffmpeg filter that reproduces the analysis sampling and keeps only these frames"""
+    expression = "+".join(f"eq(n\\,{n})" for n in frames)
+    return f"fps={fps},select='{expression}'"
@@ -4,19 +4,34 @@ ULTRA SIMPLE COLMAP Backend - ABSOLUTELY MINIMAL
 Just FastAPI + basic endpoints - NO COMPLEX DEPENDENCIES
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import time
+
+BOOT_STARTED = time.perf_counter()  # Boot metrics are measured from here (see startup_event)
+
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+import asyncio
+import hashlib
 import logging
 import os
-import sqlite3
 import json
 from datetime import datetime
 import uuid
 import subprocess
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from colmap_processor import COLMAPProcessor, process_video_to_pointcloud
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from database import Database
+from job_queue import JobQueue
+from migrations import schema_columns
+from pagination import clamp_limit, page_query, page_result, projection
+from resource_planner import plan as resource_plan
+from response_cache import ResponseCache, etag_matches
+from sqlite_pool import AsyncConnectionPool, connect
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,8 +40,9 @@ logger = logging.getLogger(__name__)
 # Create FastAPI app
 app = FastAPI(title="COLMAP Backend", version="1.0.0")
 
-# Mount static files for demo resources
-app.mount("/demo-resources", StaticFiles(directory="demo-resources"), name="demo-resources")
+# Mount static files for demo resources (the directory is only checked on the first request)
+DEMO_RESOURCES_DIR = os.getenv("DEMO_RESOURCES_DIR", str(Path(__file__).parent / "demo-resources"))
+app.mount("/demo-resources", StaticFiles(directory=DEMO_RESOURCES_DIR, check_dir=False), name="demo-resources")
 
 # CORS middleware
 app.add_middleware(
@@ -40,182 +56,136 @@ app.add_middleware(
 # Database path - RunPod volume mount (50GB volume at /workspace)
 DATABASE_PATH = os.getenv("DATABASE_PATH", "/workspace/database.db")
 
+# Demo data is only seeded when asked for (here or POST /database/setup-demo)
+SEED_DEMO_DATA = os.getenv("SEED_DEMO_DATA", "0").lower() in ("1", "true", "yes")
+
+# Import/startup timings in ms, filled by startup_event and reported by /health
+boot_metrics: Dict[str, float] = {}
+
+# Background reconstruction queue (started in startup_event)
+job_queue: JobQueue = None
+
+# Async connections for request handlers (opened in startup_event)
+app_db: AsyncConnectionPool = None
+
+# Rendered /api/status and listing responses, keyed by data version (see response_cache.py)
+response_cache = ResponseCache()
+STATUS_MAX_AGE = float(os.getenv("STATUS_CACHE_SECONDS", "2"))  # /api/status also reports live resource usage
+
+# Blocking work (COLMAP subprocesses, exports, tile builds, sync DB calls) runs
+# here, never on the event loop; bounded so it cannot starve the machine
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "4"))
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """Run a blocking call on the bounded executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+# LOD tiles for scans without a reconstruction job (e.g. demo PLYs)
+TILES_ROOT = Path(os.getenv("TILES_ROOT", "/workspace/tiles"))
+tile_build_locks: Dict[str, asyncio.Lock] = {}
+
+def get_processor(job_path: Path):
+    """COLMAPProcessor for a job directory; colmap_processor (cv2, numpy) is imported on first use"""
+    from colmap_processor import COLMAPProcessor
+    return COLMAPProcessor(str(job_path))
+
 def get_db_connection():
-    """Get database connection"""
-    # Ensure /workspace directory exists (50GB persistent volume)
-    os.makedirs("/workspace", exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrow a pooled connection to the app database (see sqlite_pool.py); close() returns it"""
+    return connect(DATABASE_PATH)
 
 def init_database():
-    """Initialize database tables"""
-    conn = get_db_connection()
+    """Create or upgrade the app schema (defined once, in database.Database)"""
     try:
-        # Users table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Projects table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                location TEXT,
-                space_type TEXT,
-                project_type TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Scans table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS scans (
-                id TEXT PRIMARY KEY,
-                project_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                video_filename TEXT,
-                video_size INTEGER,
-                processing_quality TEXT,
-                status TEXT DEFAULT 'pending',
-                ply_file TEXT,
-                glb_file TEXT,
-                thumbnail TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        ''')
-        
-        # Add new columns to existing scans table if they don't exist
-        try:
-            conn.execute('ALTER TABLE scans ADD COLUMN ply_file TEXT')
-            logger.info("✅ Added ply_file column")
-        except:
-            pass  # Column already exists
-        
-        try:
-            conn.execute('ALTER TABLE scans ADD COLUMN glb_file TEXT')
-            logger.info("✅ Added glb_file column")
-        except:
-            pass  # Column already exists
-            
-        try:
-            conn.execute('ALTER TABLE scans ADD COLUMN thumbnail TEXT')
-            logger.info("✅ Added thumbnail column")
-        except:
-            pass  # Column already exists
-        
-        conn.commit()
+        Database(DATABASE_PATH)
         logger.info("✅ Database initialized")
     except Exception as e:
         logger.error(f"❌ Database init failed: {e}")
-    finally:
-        conn.close()
+
+# Demo project (served from demo-resources); seeded only on request, see create_demo_data
+DEMO_USER_EMAIL = "demo@colmap.app"
+DEMO_PROJECT_NAME = "Reconstruction Test Project 1"
+DEMO_SCANS = [
+    {
+        "name": "demoscan-dollhouse",
+        "video_filename": "demoscan-dollhouse.mp4",
+        "video_size": 18432000,
+        "processing_quality": "high",
+        "status": "completed",
+        "ply_file": "demoscan-dollhouse/fvtc_firstfloor_processed.ply",
+        "glb_file": "demoscan-dollhouse/single_family_home_-_first_floor.glb",
+        "thumbnail": "thumbnails/demoscan-dollhouse-thumb.jpg"
+    },
+    {
+        "name": "demoscan-fachada",
+        "video_filename": "demoscan-fachada.mp4",
+        "video_size": 24576000,
+        "processing_quality": "high",
+        "status": "completed",
+        "ply_file": "demoscan-fachada/1mill.ply",
+        "glb_file": "demoscan-fachada/aleppo_destroyed_building_front.glb",
+        "thumbnail": "thumbnails/demoscan-fachada-thumb.jpg"
+    }
+]
 
 def create_demo_data():
-    """Create demo data - ALWAYS ensure demo data exists"""
+    """
+    Ensure the demo user, project and scans exist - idempotent, never deletes
+    Runs in one BEGIN IMMEDIATE transaction: concurrent workers/restarts
+    take turns and later ones find everything in place. Only missing rows
+    are inserted; other users' data is never touched.
+    """
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
-        
-        # Check if demo data already exists
-        demo_projects = conn.execute(
-            "SELECT id FROM projects WHERE name = 'Reconstruction Test Project 1'"
-        ).fetchall()
-        
-        if len(demo_projects) > 0:
-            demo_project_id = demo_projects[0][0]
-            # Check if it has the 2 required scans
-            scan_count = conn.execute(
-                "SELECT COUNT(*) FROM scans WHERE project_id = ?", (demo_project_id,)
-            ).fetchone()[0]
-            
-            if scan_count == 2:
-                # Demo data exists and is complete
-                logger.info("✅ Demo data already exists and is complete")
-                scan_ids = [row[0] for row in conn.execute(
-                    "SELECT id FROM scans WHERE project_id = ?", (demo_project_id,)
-                ).fetchall()]
-                return {
-                    "status": "success",
-                    "project_id": demo_project_id,
-                    "scan_ids": scan_ids
-                }
-            else:
-                logger.warning(f"⚠️  Demo project exists but has {scan_count} scans (expected 2), recreating...")
-                # Delete incomplete demo data and recreate
-        
-        # CLEAN SLATE: Delete all existing data
-        conn.execute("DELETE FROM scans")
-        conn.execute("DELETE FROM projects")
-        conn.execute("DELETE FROM users")
-        conn.commit()
-        logger.info("🗑️  Cleared all existing data")
-        
-        # Create demo user
-        demo_user_id = str(uuid.uuid4())
-        
-        conn.execute('''
-            INSERT INTO users (id, email, name) 
-            VALUES (?, ?, ?)
-        ''', (demo_user_id, "demo@colmap.app", "Demo User"))
-        
-        # Create demo project
-        demo_project_id = str(uuid.uuid4())
-        conn.execute('''
-            INSERT INTO projects (id, user_id, name, description, location, space_type, project_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (demo_project_id, demo_user_id, "Reconstruction Test Project 1", 
-              "Demo COLMAP 3D reconstructions from demo-resources",
-              "Demo Location", "indoor", "architecture"))
-        
-        # Create demo scans using actual files from demo-resources
-        demo_scans = [
-            {
-                "id": str(uuid.uuid4()),
-                "name": "demoscan-dollhouse",
-                "video_filename": "demoscan-dollhouse.mp4",
-                "video_size": 18432000,
-                "processing_quality": "high",
-                "status": "completed",
-                "ply_file": "demoscan-dollhouse/fvtc_firstfloor_processed.ply",
-                "glb_file": "demoscan-dollhouse/single_family_home_-_first_floor.glb",
-                "thumbnail": "thumbnails/demoscan-dollhouse-thumb.jpg"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "demoscan-fachada", 
-                "video_filename": "demoscan-fachada.mp4",
-                "video_size": 24576000,
-                "processing_quality": "high",
-                "status": "completed",
-                "ply_file": "demoscan-fachada/1mill.ply",
-                "glb_file": "demoscan-fachada/aleppo_destroyed_building_front.glb",
-                "thumbnail": "thumbnails/demoscan-fachada-thumb.jpg"
-            }
-        ]
-        
-        for scan in demo_scans:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR IGNORE INTO users (id, email, name) VALUES (?, ?, ?)",
+            (str(uuid.uuid4()), DEMO_USER_EMAIL, "Demo User")
+        )
+        demo_user_id = conn.execute("SELECT id FROM users WHERE email = ?", (DEMO_USER_EMAIL,)).fetchone()[0]
+        
+        project = conn.execute(
+            "SELECT id FROM projects WHERE name = ? AND user_id = ? ORDER BY created_at LIMIT 1",
+            (DEMO_PROJECT_NAME, demo_user_id)
+        ).fetchone()
+        if project:
+            demo_project_id = project[0]
+        else:
+            demo_project_id = str(uuid.uuid4())
+            conn.execute('''
+                INSERT INTO projects (id, user_id, name, description, location, space_type, project_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (demo_project_id, demo_user_id, DEMO_PROJECT_NAME,
+                  "Demo COLMAP 3D reconstructions from demo-resources",
+                  "Demo Location", "indoor", "architecture"))
+        
+        scan_ids = {row[1]: row[0] for row in conn.execute(
+            "SELECT id, name FROM scans WHERE project_id = ?", (demo_project_id,)
+        )}
+        created = []
+        for scan in DEMO_SCANS:
+            if scan["name"] in scan_ids:
+                continue
+            scan_ids[scan["name"]] = str(uuid.uuid4())
             conn.execute('''
                 INSERT INTO scans (id, project_id, name, video_filename, video_size, processing_quality, status, ply_file, glb_file, thumbnail)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (scan["id"], demo_project_id, scan["name"], scan["video_filename"], 
+            ''', (scan_ids[scan["name"]], demo_project_id, scan["name"], scan["video_filename"],
                   scan["video_size"], scan["processing_quality"], scan["status"],
                   scan["ply_file"], scan["glb_file"], scan["thumbnail"]))
+            created.append(scan["name"])
         
         conn.commit()
-        logger.info("✅ Demo data created successfully")
-        return {"status": "success", "project_id": demo_project_id, "scan_ids": [s["id"] for s in demo_scans]}
+        if created:
+            logger.info(f"✅ Demo data created: {created}")
+        else:
+            logger.info("✅ Demo data already exists and is complete")
+        return {"status": "success", "project_id": demo_project_id,
+                "scan_ids": [scan_ids[scan["name"]] for scan in DEMO_SCANS], "created": created}
         
     except Exception as e:
+        conn.rollback()
         logger.error(f"❌ Demo data creation failed: {e}")
         return {"status": "error", "error": str(e)}
     finally:
@@ -227,48 +197,73 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "message": "Backend is running", "database_path": DATABASE_PATH}
+    return {"status": "healthy", "message": "Backend is running", "database_path": DATABASE_PATH,
+            "response_cache": response_cache.stats(), "boot": boot_metrics}
+
+async def cached_json(request: Request, build: Callable[[], Awaitable[Any]],
+                      max_age: Optional[float] = None) -> Response:
+    """
+    JSON response from response_cache while the data version is unchanged
+    The version is read before building, so a write racing the build only
+    costs one extra rebuild. 304 when If-None-Match carries the ETag.
+    """
+    version = (await app_db.fetch_one("SELECT version FROM data_version WHERE id = 1"))["version"]
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key, version)
+    if entry is None:
+        entry = response_cache.put(key, version, JSONResponse(content=await build()).body, max_age)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+async def build_status() -> Dict:
+    # Counts, projects and the resource plan are fetched concurrently
+    counts, projects_list, resources = await asyncio.gather(
+        app_db.fetch_one(
+            "SELECT (SELECT COUNT(*) FROM projects) AS projects_count, (SELECT COUNT(*) FROM scans) AS scans_count"
+        ),
+        app_db.fetch_all("SELECT id, name FROM projects"),
+        run_blocking(resource_plan)
+    )
+    
+    return {
+        "backend": "running",
+        "database_path": DATABASE_PATH,
+        "projects_count": counts["projects_count"],
+        "scans_count": counts["scans_count"],
+        "projects": projects_list,
+        "resources": resources
+    }
 
 @app.get("/api/status")
-async def get_status():
+async def get_status(request: Request):
     """Get current backend status and demo data info"""
     try:
-        conn = get_db_connection()
-        
-        # Get projects count
-        projects_count = conn.execute("SELECT COUNT(*) as count FROM projects").fetchone()["count"]
-        
-        # Get projects
-        projects = conn.execute("SELECT id, name FROM projects").fetchall()
-        projects_list = [{"id": p["id"], "name": p["name"]} for p in projects]
-        
-        # Get scans count
-        scans_count = conn.execute("SELECT COUNT(*) as count FROM scans").fetchone()["count"]
-        
-        status = {
-            "backend": "running",
-            "database_path": DATABASE_PATH,
-            "projects_count": projects_count,
-            "scans_count": scans_count,
-            "projects": projects_list
-        }
-        
-        conn.close()
-        return status
-        
+        return await cached_json(request, build_status, max_age=STATUS_MAX_AGE)
     except Exception as e:
         logger.error(f"Status check failed: {e}")
         return {"backend": "error", "error": str(e)}
 
+async def fetch_page(table: str, key: str, filters: Dict, limit: Optional[int],
+                     cursor: Optional[str], fields: Optional[str]) -> Dict:
+    """One keyset page of a listing (see pagination.py); 400 for a bad cursor or fields="""
+    limit = clamp_limit(limit, cursor)
+    try:
+        columns = projection(fields, schema_columns(table))
+        sql, params = page_query(table, columns, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_result(await app_db.fetch_all(sql, params), limit, key)
+
 @app.get("/api/projects")
-async def get_projects():
-    """Get all projects"""
+async def get_projects(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                       fields: Optional[str] = None):
+    """Projects, most recently updated first; with limit/cursor one page (pass next_cursor back as cursor)"""
     try:
-        conn = get_db_connection()
-        projects = conn.execute("SELECT * FROM projects").fetchall()
-        projects_list = [dict(p) for p in projects]
-        conn.close()
-        return {"projects": projects_list}
+        return await cached_json(request, partial(fetch_page, "projects", "projects", {}, limit, cursor, fields))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting projects: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -278,12 +273,10 @@ async def get_projects():
 async def get_project(project_id: str):
     """Get a single project by ID"""
     try:
-        conn = get_db_connection()
-        row = conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
-        conn.close()
+        row = await app_db.fetch_one("SELECT * FROM projects WHERE id = ?", (project_id,))
         if not row:
             raise HTTPException(status_code=404, detail="Project not found")
-        return dict(row)
+        return row
     except HTTPException:
         raise
     except Exception as e:
@@ -291,14 +284,15 @@ async def get_project(project_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/projects/{project_id}/scans")
-async def get_scans(project_id: str):
-    """Get scans for a project"""
+async def get_scans(request: Request, project_id: str, limit: Optional[int] = None,
+                    cursor: Optional[str] = None, fields: Optional[str] = None):
+    """A project's scans, most recently updated first (paged like /api/projects)"""
     try:
-        conn = get_db_connection()
-        scans = conn.execute("SELECT * FROM scans WHERE project_id = ?", (project_id,)).fetchall()
-        scans_list = [dict(s) for s in scans]
-        conn.close()
-        return {"scans": scans_list}
+        return await cached_json(
+            request, partial(fetch_page, "scans", "scans", {"project_id": project_id}, limit, cursor, fields)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting scans: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -307,25 +301,23 @@ async def get_scans(project_id: str):
 async def create_project(user_email: str, name: str, description: str = "", location: str = "", space_type: str = "", project_type: str = ""):
     """Create a new project"""
     try:
-        conn = get_db_connection()
-        
-        # Get or create user
-        user_row = conn.execute("SELECT id FROM users WHERE email = ?", (user_email,)).fetchone()
-        if not user_row:
-            user_id = str(uuid.uuid4())
-            conn.execute("INSERT INTO users (id, email) VALUES (?, ?)", (user_id, user_email))
-            conn.commit()
-        else:
-            user_id = user_row["id"]
-        
-        # Create project
-        project_id = str(uuid.uuid4())
-        conn.execute(
-            "INSERT INTO projects (id, user_id, name, description, location, space_type, project_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (project_id, user_id, name, description, location, space_type, project_type)
-        )
-        conn.commit()
-        conn.close()
+        async with app_db.connection() as conn:
+            # Get or create user
+            async with conn.execute("SELECT id FROM users WHERE email = ?", (user_email,)) as cursor:
+                user_row = await cursor.fetchone()
+            if not user_row:
+                user_id = str(uuid.uuid4())
+                await conn.execute("INSERT INTO users (id, email) VALUES (?, ?)", (user_id, user_email))
+            else:
+                user_id = user_row["id"]
+            
+            # Create project
+            project_id = str(uuid.uuid4())
+            await conn.execute(
+                "INSERT INTO projects (id, user_id, name, description, location, space_type, project_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (project_id, user_id, name, description, location, space_type, project_type)
+            )
+            await conn.commit()
         
         logger.info(f"Created project: {name} (ID: {project_id})")
         return {"status": "success", "project_id": project_id}
@@ -338,13 +330,11 @@ async def setup_demo_data():
     """FORCE setup demo data - ALWAYS WORKS"""
     try:
         logger.info("🔄 FORCING demo data creation...")
-        result = create_demo_data()
+        result = await run_blocking(create_demo_data)
         
         # Verify demo data was created
-        conn = get_db_connection()
-        projects_count = conn.execute("SELECT COUNT(*) as count FROM projects").fetchone()["count"]
-        scans_count = conn.execute("SELECT COUNT(*) as count FROM scans").fetchone()["count"]
-        conn.close()
+        projects_count = (await app_db.fetch_one("SELECT COUNT(*) as count FROM projects"))["count"]
+        scans_count = (await app_db.fetch_one("SELECT COUNT(*) as count FROM scans"))["count"]
         
         logger.info(f"📊 Demo data created: {projects_count} projects, {scans_count} scans")
         
@@ -360,6 +350,47 @@ async def setup_demo_data():
         logger.error(f"Demo data setup failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Upload limits (videos are streamed to disk, never held in memory)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 ** 3)))  # 10GB
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024  # 8MB
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+def stream_upload_to_disk(source, destination: Path, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[int, str]:
+    """
+    Copy an uploaded file to disk one chunk at a time
+    
+    Size and SHA-256 are computed on the fly, so peak memory is one chunk per
+    upload regardless of video size. Data goes to a .part file that is fsynced
+    once and renamed into place, so a crash never leaves a truncated video.
+    
+    Returns (size_bytes, sha256_hex)
+    """
+    partial_path = destination.with_name(destination.name + ".part")
+    sha256 = hashlib.sha256()
+    size = 0
+    
+    try:
+        with open(partial_path, "wb") as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds maximum size of {max_bytes} bytes")
+                sha256.update(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial_path, destination)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    
+    return size, sha256.hexdigest()
+
 @app.post("/api/reconstruction/upload")
 async def upload_video_for_reconstruction(
     project_id: str = Form(...),
@@ -377,53 +408,95 @@ async def upload_video_for_reconstruction(
         # Generate job ID
         job_id = str(uuid.uuid4())
         
+        # Reject oversized uploads early when the client declared a size
+        if video.size is not None and video.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Video exceeds maximum size of {MAX_UPLOAD_BYTES} bytes")
+        
         # Create job directory
         job_path = Path(f"/workspace/{job_id}")
-        job_path.mkdir(parents=True, exist_ok=True)
+        await run_blocking(job_path.mkdir, parents=True, exist_ok=True)
         
-        # Save uploaded video
-        video_path = job_path / video.filename
-        with open(video_path, "wb") as f:
-            content = await video.read()
-            f.write(content)
-        
-        logger.info(f"💾 Saved video to {video_path} ({len(content)} bytes)")
+        # Stream uploaded video to disk (on the blocking executor, off the event loop)
+        video_filename = Path(video.filename).name
+        video_path = job_path / video_filename
+        try:
+            video_size, video_sha256 = await run_blocking(stream_upload_to_disk, video.file, video_path)
+        except UploadTooLarge as e:
+            await run_blocking(shutil.rmtree, job_path, ignore_errors=True)
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        logger.info(f"💾 Saved video to {video_path} ({video_size} bytes, sha256 {video_sha256[:12]})")
+        
+        # Create the scan and queue the reconstruction; a worker process picks it up
+        scan_id = str(uuid.uuid4())
+        await app_db.execute(
+            "INSERT INTO scans (id, project_id, name, video_filename, video_size, processing_quality, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (scan_id, project_id, scan_name, video_filename, video_size, quality, "queued")
+        )
         
-        # Start reconstruction in background (async)
-        # For now, just return job ID
-        # TODO: Implement async processing
+        await run_blocking(job_queue.enqueue, job_id, scan_id, str(video_path), quality=quality, video_sha256=video_sha256)
         
         return {
             "status": "accepted",
             "job_id": job_id,
+            "scan_id": scan_id,
+            "video_size": video_size,
+            "video_sha256": video_sha256,
             "message": "Video uploaded, reconstruction queued"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Video upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/reconstruction/{job_id}/status")
 async def get_reconstruction_status(job_id: str):
-    """Get status of reconstruction job"""
+    """Get status of reconstruction job (per-stage progress from the job queue)"""
+    job = await app_db.fetch_one("SELECT * FROM processing_jobs WHERE job_id = ?", (job_id,))
     job_path = Path(f"/workspace/{job_id}")
     
-    if not job_path.exists():
+    if not job and not job_path.exists():
         raise HTTPException(status_code=404, detail="Job not found")
     
     # Check for outputs
-    ply_file = job_path / "exports" / "point_cloud.ply"
-    status = "processing"
+    ply_file = job_path / "point_cloud.ply"
     
-    if ply_file.exists():
-        status = "completed"
+    if job:
+        return {
+            "job_id": job_id,
+            "scan_id": job["scan_id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "current_stage": job["current_stage"],
+            "message": job["message"],
+            "output_file": str(ply_file) if ply_file.exists() else None
+        }
     
+    # Jobs from before the queue existed: infer status from outputs
+    status = "completed" if ply_file.exists() else "processing"
     return {
         "job_id": job_id,
         "status": status,
         "output_file": str(ply_file) if ply_file.exists() else None
     }
 
+@app.post("/api/reconstruction/{job_id}/retry")
+async def retry_reconstruction(job_id: str):
+    """
+    Requeue a failed or completed reconstruction
+    Stages whose checkpoints are still valid (stages.json) are skipped
+    """
+    job = await app_db.fetch_one("SELECT * FROM processing_jobs WHERE job_id = ?", (job_id,))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if not await run_blocking(job_queue.retry, job_id):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, only failed or completed jobs can be retried")
+    
+    return {"status": "accepted", "job_id": job_id, "message": "Reconstruction requeued"}
+
 @app.post("/api/reconstruction/{job_id}/export")
 async def export_reconstruction(job_id: str, format: str = "PLY"):
     """
@@ -439,10 +512,10 @@ async def export_reconstruction(job_id: str, format: str = "PLY"):
             raise HTTPException(status_code=404, detail="Job not found")
         
         # Initialize processor
-        processor = COLMAPProcessor(str(job_path))
+        processor = get_processor(job_path)
         
-        # Export model
-        output_path = processor.export_model(output_format=format.upper())
+        # Export model (writes files / runs model_converter: off the event loop)
+        output_path = await run_blocking(processor.export_model, output_format=format.upper())
         
         logger.info(f"Exported reconstruction {job_id} to {format}: {output_path}")
         
@@ -497,6 +570,87 @@ async def download_export(job_id: str, filename: str):
         logger.error(f"Download failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def ensure_tiles(ply_path: Path, tiles_dir: Path) -> Dict:
+    """
+    Hierarchy of a PLY's LOD tiles, building them first if they are missing
+    or older than the PLY (reconstructions from before the tiling stage)
+    """
+    from pointcloud_tiles import build_tiles, is_up_to_date, load_hierarchy
+    
+    lock = tile_build_locks.setdefault(str(tiles_dir), asyncio.Lock())
+    async with lock:
+        if not await run_blocking(is_up_to_date, tiles_dir, ply_path):
+            logger.info(f"Building LOD tiles for {ply_path}")
+            await run_blocking(build_tiles, ply_path, tiles_dir)
+    return await run_blocking(load_hierarchy, tiles_dir)
+
+def tile_response(tiles_dir: Path, node_id: str) -> FileResponse:
+    """FileResponse for one tile (binary PLY), 400/404 for bad or unknown nodes"""
+    from pointcloud_tiles import tile_path
+    
+    try:
+        path = tile_path(tiles_dir, node_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"Tile {node_id} not found")
+    return FileResponse(path, media_type="application/octet-stream")
+
+async def scan_tile_source(scan_id: str) -> Tuple[Path, Path]:
+    """(PLY, tiles directory) of a scan: its reconstruction job or its demo PLY"""
+    scan = await app_db.fetch_one("SELECT ply_file FROM scans WHERE id = ?", (scan_id,))
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    job = await app_db.fetch_one(
+        "SELECT job_id FROM processing_jobs WHERE scan_id = ? ORDER BY rowid DESC LIMIT 1", (scan_id,)
+    )
+    
+    if job:
+        job_path = Path(f"/workspace/{job['job_id']}")
+        return job_path / "point_cloud.ply", job_path / "tiles"
+    if scan["ply_file"]:
+        return Path(DEMO_RESOURCES_DIR) / scan["ply_file"], TILES_ROOT / scan_id
+    raise HTTPException(status_code=404, detail="Scan has no point cloud")
+
+@app.get("/api/reconstruction/{job_id}/tiles")
+async def get_reconstruction_tiles(job_id: str):
+    """
+    Octree LOD hierarchy of a reconstruction's point cloud
+    Nodes are fetched with /api/reconstruction/{job_id}/tiles/{node_id}
+    """
+    job_path = Path(f"/workspace/{job_id}")
+    ply_file = job_path / "point_cloud.ply"
+    if not ply_file.exists():
+        raise HTTPException(status_code=404, detail="Point cloud not found")
+    
+    try:
+        return await ensure_tiles(ply_file, job_path / "tiles")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/api/reconstruction/{job_id}/tiles/{node_id}")
+async def get_reconstruction_tile(job_id: str, node_id: str):
+    """One LOD tile (binary PLY: x, y, z, red, green, blue)"""
+    return tile_response(Path(f"/workspace/{job_id}") / "tiles", node_id)
+
+@app.get("/api/scans/{scan_id}/tiles")
+async def get_scan_tiles(scan_id: str):
+    """Octree LOD hierarchy of a scan's point cloud (reconstructed or demo)"""
+    ply_file, tiles_dir = await scan_tile_source(scan_id)
+    if not ply_file.exists():
+        raise HTTPException(status_code=404, detail="Point cloud not found")
+    
+    try:
+        return await ensure_tiles(ply_file, tiles_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/api/scans/{scan_id}/tiles/{node_id}")
+async def get_scan_tile(scan_id: str, node_id: str):
+    """One LOD tile of a scan's point cloud"""
+    _, tiles_dir = await scan_tile_source(scan_id)
+    return tile_response(tiles_dir, node_id)
+
 @app.get("/api/reconstruction/{job_id}/database/inspect")
 async def inspect_database(job_id: str):
     """
@@ -511,8 +665,8 @@ async def inspect_database(job_id: str):
         if not job_path.exists():
             raise HTTPException(status_code=404, detail="Job not found")
         
-        processor = COLMAPProcessor(str(job_path))
-        result = processor.inspect_database()
+        processor = get_processor(job_path)
+        result = await run_blocking(processor.inspect_database)
         
         return result
         
@@ -534,8 +688,8 @@ async def clean_database(job_id: str):
         if not job_path.exists():
             raise HTTPException(status_code=404, detail="Job not found")
         
-        processor = COLMAPProcessor(str(job_path))
-        result = processor.clean_database()
+        processor = get_processor(job_path)
+        result = await run_blocking(processor.clean_database)
         
         return result
         
@@ -545,36 +699,42 @@ async def clean_database(job_id: str):
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and demo data on startup"""
+    """Check the schema, start the job queue, seed demo data only when SEED_DEMO_DATA is set"""
+    started = time.perf_counter()
+    boot_metrics["import_ms"] = round((started - BOOT_STARTED) * 1000, 1)
     try:
-        logger.info("🚀 Starting up COLMAP Backend...")
-        
-        # Initialize database
-        init_database()
-        
-        # FORCE DEMO DATA INITIALIZATION
-        logger.info("🔄 FORCING demo data initialization...")
-        result = create_demo_data()
-        
-        if result.get("status") == "success":
-            logger.info("✅ Demo data initialized successfully")
-            logger.info(f"   Project ID: {result.get('project_id')}")
-            logger.info(f"   Scan IDs: {result.get('scan_ids')}")
-        else:
-            logger.error(f"❌ Demo data initialization failed: {result.get('error')}")
-        
-        # VERIFY DEMO DATA EXISTS
-        conn = get_db_connection()
-        projects_count = conn.execute("SELECT COUNT(*) as count FROM projects").fetchone()["count"]
-        scans_count = conn.execute("SELECT COUNT(*) as count FROM scans").fetchone()["count"]
-        conn.close()
-        
-        logger.info(f"🎯 FINAL VERIFICATION: {projects_count} projects, {scans_count} scans")
-        logger.info("🎯 COLMAP Backend ready!")
+        # Initialize database (a single schema_version read when already current)
+        global app_db
+        await run_blocking(init_database)
+        app_db = AsyncConnectionPool(DATABASE_PATH)
+        boot_metrics["schema_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        # Start background reconstruction workers (processes spawn on the first job)
+        global job_queue
+        job_queue = JobQueue(DATABASE_PATH)
+        job_queue.start()
+        
+        if SEED_DEMO_DATA:
+            result = await run_blocking(create_demo_data)
+            if result.get("status") != "success":
+                logger.error(f"❌ Demo data initialization failed: {result.get('error')}")
+        
+        boot_metrics["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        boot_metrics["ready_ms"] = round((time.perf_counter() - BOOT_STARTED) * 1000, 1)
+        logger.info(f"🎯 COLMAP Backend ready: {boot_metrics}")
         
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop dispatching jobs; interrupted jobs are requeued on next startup"""
+    if job_queue:
+        job_queue.stop()
+    if app_db:
+        await app_db.close_all()
+    blocking_executor.shutdown(wait=False, cancel_futures=True)
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Partitioned (Divide-and-Conquer) Mapping Helpers
+Incremental SfM grows super-linearly with the number of images, so long
+video captures are split into overlapping clusters of consecutive frames.
+Each cluster is mapped by its own `colmap mapper` process; consecutive
+cluster models share OVERLAP_IMAGES frames, which is what
+`colmap model_merger` needs to align them before the final global
+bundle adjustment.
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from colmap_model import count_points3D
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MIN_IMAGES = 300     # Fewer frames are mapped in one piece
+CLUSTER_IMAGES = 150           # Frames per cluster (including the overlap)
+OVERLAP_IMAGES = 40            # Frames shared by consecutive clusters
+
+
+def temporal_clusters(names: Sequence[str], size: int = CLUSTER_IMAGES,
+                      overlap: int = OVERLAP_IMAGES) -> List[List[str]]:
+    """
+    Split frames (in video order) into windows of about `size` frames,
+    each sharing `overlap` frames with the next; the last window absorbs
+    a short remainder instead of becoming a tiny cluster
+    """
+    names = list(names)
+    step = max(size - overlap, 1)
+    if len(names) <= size:
+        return [names]
+    starts = list(range(0, len(names) - overlap, step))
+    if len(names) - starts[-1] < size // 2 and len(starts) > 1:
+        starts.pop()
+    clusters = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] + overlap if i + 1 < len(starts) else len(names)
+        clusters.append(names[start:end])
+    return clusters
+
+
+def largest_model(output_dir: Path) -> Optional[Path]:
+    """Model directory (0/, 1/, ...) with the most 3D points, None if the mapper produced nothing"""
+    best, best_points = None, -1
+    for model_dir in sorted(Path(output_dir).glob("[0-9]*")):
+        points_file = model_dir / "points3D.bin"
+        if points_file.exists():
+            points = count_points3D(points_file)
+            if points > best_points:
+                best, best_points = model_dir, points
+    return best
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Sharded Feature Matching
+Splits a match pair list into cost-balanced shards that separate COLMAP
+processes can match concurrently, each against its own slim copy of the
+database, and merges their results back deterministically.
+
+- Shard databases keep COLMAP's schema (copied from sqlite_master) and
+  image ids, with only the images their pairs need, so pair_ids agree
+- Merging inserts each shard's matches and two_view_geometries in shard
+  order, sorted by pair_id; pairs are disjoint, so the merged database
+  does not depend on which shard finished first
+"""
+
+import heapq
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIN_PAIRS_PER_SHARD = 200      # Smaller lists are not worth a database copy
+RESULT_TABLES = ("matches", "two_view_geometries")
+IMAGE_TABLES = ("keypoints", "descriptors")
+
+
+def read_pair_list(path: Path) -> List[Tuple[str, str]]:
+    """Pairs from a matches_importer pair list ("name1 name2" per line)"""
+    with open(path) as f:
+        return [tuple(line.split()[:2]) for line in f if line.strip()]
+
+
+def feature_counts(database_path: Path) -> Dict[str, int]:
+    """Number of descriptors per image name"""
+    conn = sqlite3.connect(database_path)
+    try:
+        return dict(conn.execute(
+            "SELECT i.name, COALESCE(d.rows, 0) FROM images i LEFT JOIN descriptors d ON d.image_id = i.image_id"
+        ).fetchall())
+    finally:
+        conn.close()
+
+
+def shard_pairs(pairs: Sequence[Tuple[str, str]], counts: Dict[str, int], shards: int) -> List[List[Tuple[str, str]]]:
+    """
+    Split pairs into shards of similar matching cost (features_a * features_b),
+    longest-processing-time first; deterministic for the same input
+    """
+    shards = max(1, min(shards, len(pairs)))
+    costs = sorted(((max(counts.get(a, 0), 1) * max(counts.get(b, 0), 1), a, b) for a, b in pairs),
+                   key=lambda item: (-item[0], item[1], item[2]))
+    loads = [(0, index) for index in range(shards)]
+    result: List[List[Tuple[str, str]]] = [[] for _ in range(shards)]
+    for cost, a, b in costs:
+        load, index = heapq.heappop(loads)
+        result[index].append((a, b))
+        heapq.heappush(loads, (load + cost, index))
+    return [sorted(shard) for shard in result if shard]
+
+
+def create_shard_database(source: Path, target: Path, names: Sequence[str]):
+    """Copy the schema, all cameras and only these images' rows into a new database"""
+    Path(target).unlink(missing_ok=True)
+    conn = sqlite3.connect(target)
+    try:
+        conn.execute("ATTACH DATABASE ? AS source", (str(source),))
+        schema = conn.execute(
+            "SELECT sql FROM source.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY type = 'table' DESC, name"
+        ).fetchall()
+        with conn:
+            for (sql,) in schema:
+                conn.execute(sql)
+            conn.execute("CREATE TEMP TABLE wanted (name TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO temp.wanted VALUES (?)", ((name,) for name in names))
+            conn.execute("INSERT INTO main.cameras SELECT * FROM source.cameras")
+            conn.execute("INSERT INTO main.images SELECT * FROM source.images WHERE name IN (SELECT name FROM temp.wanted)")
+            for table in IMAGE_TABLES:
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM source.{table} "
+                             f"WHERE image_id IN (SELECT image_id FROM main.images)")
+        conn.execute("DETACH DATABASE source")
+    finally:
+        conn.close()
+
+
+def merge_shard_databases(database_path: Path, shard_databases: Sequence[Path]) -> Dict[str, int]:
+    """
+    Copy matches and two_view_geometries from every shard, in shard order,
+    in one transaction. Shards are read over their own connections rather
+    than ATTACHed (DETACH cannot run inside a transaction, and SQLite
+    attaches at most 10 databases by default).
+    """
+    conn = sqlite3.connect(database_path, timeout=60)
+    merged = {table: 0 for table in RESULT_TABLES}
+    try:
+        with conn:
+            for shard_database in shard_databases:
+                shard = sqlite3.connect(shard_database)
+                try:
+                    for table in RESULT_TABLES:
+                        rows = shard.execute(f"SELECT * FROM {table} ORDER BY pair_id")
+                        placeholders = ", ".join("?" * len(rows.description))
+                        merged[table] += conn.executemany(
+                            f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows
+                        ).rowcount
+                finally:
+                    shard.close()
+    finally:
+        conn.close()
+    logger.info(f"Merged {len(shard_databases)} match shards: {merged}")
+    return merged
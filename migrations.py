@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Versioned Schema Migrations for the Application Database
+The one definition of the app schema (users, projects, scans,
+scan_technical_details, processing_jobs). Each migration runs once, in
+order, in its own write transaction, and is recorded in schema_version;
+a database that is already current costs a single SELECT.
+
+- 1: unified tables. Databases created by older code (main.py's own
+  schema, pre-queue processing_jobs) have their tables rebuilt with the
+  missing columns and defaults, keeping every row
+- 2: secondary indexes for the listing, job queue and tile lookups
+- 3: projects.scan_count kept by triggers on scans (no COUNT/GROUP BY
+  per listing) and (updated_at, id) indexes for keyset pagination
+- 4: data_version, a single row bumped by triggers on every write to
+  the tables the API serves (response cache invalidation, see
+  response_cache.py)
+- 5: processing_jobs.worker_id / heartbeat_at, the lease of a running
+  job: only jobs whose owner stopped heartbeating are requeued
+"""
+
+import logging
+import sqlite3
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TABLES = {
+    "users": '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    "projects": '''
+        CREATE TABLE IF NOT EXISTS projects (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            location TEXT,
+            space_type TEXT,
+            project_type TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+    "scans": '''
+        CREATE TABLE IF NOT EXISTS scans (
+            id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            video_filename TEXT,
+            video_size INTEGER,
+            video_duration REAL,
+            processing_quality TEXT DEFAULT 'medium',
+            thumbnail_path TEXT,
+            ply_file TEXT,
+            glb_file TEXT,
+            thumbnail TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )''',
+    # Technical details (stores COLMAP processing results)
+    "scan_technical_details": '''
+        CREATE TABLE IF NOT EXISTS scan_technical_details (
+            scan_id TEXT PRIMARY KEY,
+            point_count INTEGER,
+            camera_count INTEGER,
+            feature_count INTEGER,
+            processing_time_seconds REAL,
+            resolution TEXT,
+            file_size_bytes INTEGER,
+            reconstruction_error REAL,
+            coverage_percentage REAL,
+            processing_stages TEXT, -- JSON array of processing stages
+            results TEXT, -- JSON object with file URLs
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (scan_id) REFERENCES scans (id)
+        )''',
+    # Processing jobs (doubles as the persistent reconstruction queue)
+    "processing_jobs": '''
+        CREATE TABLE IF NOT EXISTS processing_jobs (
+            job_id TEXT PRIMARY KEY,
+            scan_id TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            progress INTEGER DEFAULT 0,
+            current_stage TEXT,
+            message TEXT,
+            video_path TEXT,
+            video_sha256 TEXT,
+            quality TEXT DEFAULT 'medium',
+            max_frames INTEGER DEFAULT 50,
+            attempts INTEGER DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (scan_id) REFERENCES scans (id)
+        )''',
+}
+
+# Columns a rebuilt table fills from another column when the old table lacks them
+REBUILD_DEFAULTS = {"updated_at": "created_at"}
+
+
+def _columns(conn: sqlite3.Connection, table: str, schema: str = "main") -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _rebuild_table(conn: sqlite3.Connection, table: str):
+    """
+    Recreate a table from TABLES, copying the rows over (SQLite cannot ALTER
+    in a column with a non-constant default). New table first, then drop
+    and rename, so other tables' foreign keys keep naming the table.
+    """
+    old_columns = _columns(conn, table)
+    conn.execute(TABLES[table].replace(f"IF NOT EXISTS {table} (", f"{table}_new ("))
+    new_columns = _columns(conn, f"{table}_new")
+    sources = []
+    targets = []
+    for column in new_columns:
+        if column in old_columns:
+            targets.append(column)
+            sources.append(column)
+        elif REBUILD_DEFAULTS.get(column) in old_columns:
+            targets.append(column)
+            sources.append(REBUILD_DEFAULTS[column])
+    conn.execute(f"INSERT INTO {table}_new ({', '.join(targets)}) SELECT {', '.join(sources)} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    logger.info(f"Rebuilt table {table} with columns {sorted(set(new_columns) - set(old_columns))}")
+
+
+def _unified_tables(conn: sqlite3.Connection):
+    for table, create_sql in TABLES.items():
+        existing = _columns(conn, table)
+        if not existing:
+            conn.execute(create_sql)
+            continue
+        # Columns the current definition has: create it as a temp table and look
+        conn.execute(create_sql.replace("IF NOT EXISTS ", "IF NOT EXISTS temp."))
+        wanted = _columns(conn, table, schema="temp")
+        conn.execute(f"DROP TABLE temp.{table}")
+        if set(wanted) - set(existing):
+            _rebuild_table(conn, table)
+
+
+INDEXES = [
+    # get_project_scans / GET /api/projects/{id}/scans: filter + newest first, id covers COUNT(s.id)
+    "CREATE INDEX IF NOT EXISTS idx_scans_project_created ON scans(project_id, created_at DESC, id)",
+    # get_user_projects: a user's projects, most recently updated first
+    "CREATE INDEX IF NOT EXISTS idx_projects_user_updated ON projects(user_id, updated_at DESC)",
+    # get_all_projects: all projects, most recently updated first
+    "CREATE INDEX IF NOT EXISTS idx_projects_updated ON projects(updated_at DESC)",
+    # scan_tile_source / delete_scan: a scan's jobs (rowid order comes with the index)
+    "CREATE INDEX IF NOT EXISTS idx_jobs_scan ON processing_jobs(scan_id)",
+    # claim_next_job / requeue_interrupted_jobs: queued or running jobs in rowid order
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON processing_jobs(status)",
+    # get_all_jobs: newest first
+    "CREATE INDEX IF NOT EXISTS idx_jobs_started ON processing_jobs(started_at DESC)",
+]
+
+
+def _secondary_indexes(conn: sqlite3.Connection):
+    for sql in INDEXES:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+
+
+SCAN_COUNT_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_scans_count_insert AFTER INSERT ON scans
+       BEGIN
+           UPDATE projects SET scan_count = scan_count + 1 WHERE id = NEW.project_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_scans_count_delete AFTER DELETE ON scans
+       BEGIN
+           UPDATE projects SET scan_count = scan_count - 1 WHERE id = OLD.project_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_scans_count_move AFTER UPDATE OF project_id ON scans
+       WHEN OLD.project_id IS NOT NEW.project_id
+       BEGIN
+           UPDATE projects SET scan_count = scan_count - 1 WHERE id = OLD.project_id;
+           UPDATE projects SET scan_count = scan_count + 1 WHERE id = NEW.project_id;
+       END""",
+]
+
+KEYSET_INDEXES = [
+    # Supersede the updated_at-only indexes: id is the tie-breaker of the page cursor
+    "DROP INDEX IF EXISTS idx_projects_updated",
+    "DROP INDEX IF EXISTS idx_projects_user_updated",
+    "CREATE INDEX IF NOT EXISTS idx_projects_updated_id ON projects(updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_projects_user_updated_id ON projects(user_id, updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_scans_project_updated_id ON scans(project_id, updated_at, id)",
+]
+
+
+def _scan_counters(conn: sqlite3.Connection):
+    if "scan_count" not in _columns(conn, "projects"):
+        conn.execute("ALTER TABLE projects ADD COLUMN scan_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE projects SET scan_count = (SELECT COUNT(*) FROM scans WHERE scans.project_id = projects.id)")
+    for sql in SCAN_COUNT_TRIGGERS + KEYSET_INDEXES:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+
+
+# Tables whose writes invalidate cached API responses (processing_jobs progress does not)
+VERSIONED_TABLES = ["users", "projects", "scans", "scan_technical_details"]
+
+
+def _data_version(conn: sqlite3.Connection):
+    conn.execute("CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    for table in VERSIONED_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table} "
+                f"BEGIN UPDATE data_version SET version = version + 1 WHERE id = 1; END"
+            )
+
+
+def _job_leases(conn: sqlite3.Connection):
+    columns = _columns(conn, "processing_jobs")
+    if "worker_id" not in columns:
+        conn.execute("ALTER TABLE processing_jobs ADD COLUMN worker_id TEXT")
+    if "heartbeat_at" not in columns:
+        conn.execute("ALTER TABLE processing_jobs ADD COLUMN heartbeat_at TIMESTAMP")
+
+
+# (version, name, apply); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "unified tables", _unified_tables),
+    (2, "secondary indexes", _secondary_indexes),
+    (3, "scan counters and keyset indexes", _scan_counters),
+    (4, "data version", _data_version),
+    (5, "job leases", _job_leases),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0  # No schema_version table yet
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> Dict:
+    """
+    Apply pending migrations up to target (default: latest)
+    BEGIN IMMEDIATE makes concurrent starters (several workers) take turns;
+    each re-reads the version inside its transaction, so none runs twice.
+    """
+    target = LATEST_VERSION if target is None else target
+    start_version = current_version(conn)
+    applied = []
+    if start_version >= target:
+        return {"version": start_version, "applied": applied}
+
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+    for version, name, apply in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            started = time.perf_counter()
+            apply(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+        logger.info(f"Applied migration {version} ({name}) in {time.perf_counter() - started:.2f}s")
+    return {"version": current_version(conn), "applied": applied}
+
+
+@lru_cache(maxsize=None)
+def schema_columns(table: str) -> Tuple[str, ...]:
+    """Columns of a table at the latest version (an in-memory database, migrated once)"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        migrate(conn)
+        return tuple(_columns(conn, table))
+    finally:
+        conn.close()
@@ -1,13 +1,177 @@
 # Minimal open3d_utils.py - just to prevent import errors
+# Operations that have a NumPy implementation work without Open3D installed.
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from colmap_export import write_ply_vertices
+from pointcloud_tiles import open_ply_vertices, select_vertices, to_uint8_colors, vertex_colors
+from spatial_index import load_or_build_index, query_all
+
+logger = logging.getLogger(__name__)
+
+CHUNK_POINTS = 2_000_000       # Points read from the PLY per chunk
+
+
+def _xyz_chunk(fields, start: int, end: int) -> np.ndarray:
+    return np.stack([np.asarray(fields[axis][start:end], dtype=np.float64) for axis in "xyz"], axis=1)
+
+
+def _merge_voxels(keys: np.ndarray, counts: np.ndarray, sums: np.ndarray):
+    """Combine rows that share a voxel key (counts and per-column sums add up)"""
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    merged_counts = np.bincount(inverse, weights=counts, minlength=len(unique_keys))
+    merged_sums = np.empty((len(unique_keys), sums.shape[1]), dtype=np.float64)
+    for column in range(sums.shape[1]):
+        merged_sums[:, column] = np.bincount(inverse, weights=sums[:, column], minlength=len(unique_keys))
+    return unique_keys, merged_counts, merged_sums
+
+
+def voxel_downsample(input_path: Path, output_path: Path, voxel_size: float) -> Dict:
+    """
+    Voxel-grid downsampling: one point per occupied voxel, at the mean
+    position (and mean color) of the points inside it
+
+    The PLY is streamed in CHUNK_POINTS chunks: each chunk is reduced to
+    per-voxel counts and sums, which are merged into the running totals,
+    so memory grows with the number of voxels, not the number of points.
+    """
+    if voxel_size <= 0:
+        raise ValueError("voxel_size must be positive")
+    fields, kinds, count = open_ply_vertices(input_path)
+    if not all(axis in kinds for axis in "xyz"):
+        raise ValueError(f"{input_path}: vertex element has no x/y/z properties")
+    color_names = vertex_colors(kinds)
+    num_columns = 6 if color_names else 3
+
+    # Pass 1: bounds, so voxel coordinates can be packed into one int64 key
+    lower = np.full(3, np.inf)
+    upper = np.full(3, -np.inf)
+    for start in range(0, count, CHUNK_POINTS):
+        xyz = _xyz_chunk(fields, start, start + CHUNK_POINTS)
+        lower = np.minimum(lower, xyz.min(axis=0))
+        upper = np.maximum(upper, xyz.max(axis=0))
+    dims = (np.floor((upper - lower) / voxel_size).astype(np.int64) + 1) if count else np.ones(3, dtype=np.int64)
+    if float(dims[0]) * float(dims[1]) * float(dims[2]) >= 2 ** 63:
+        raise ValueError(f"voxel_size {voxel_size} is too small for a cloud of extent {(upper - lower).tolist()}")
+
+    # Pass 2: per-voxel counts and sums
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.float64)
+    sums = np.empty((0, num_columns), dtype=np.float64)
+    for start in range(0, count, CHUNK_POINTS):
+        end = min(start + CHUNK_POINTS, count)
+        values = np.empty((end - start, num_columns), dtype=np.float64)
+        values[:, :3] = _xyz_chunk(fields, start, end)
+        if color_names:
+            for i, name in enumerate(color_names):
+                values[:, 3 + i] = to_uint8_colors(np.asarray(fields[name][start:end]), kinds[name])
+
+        voxels = np.floor((values[:, :3] - lower) / voxel_size).astype(np.int64)
+        np.minimum(voxels, dims - 1, out=voxels)
+        chunk_keys = (voxels[:, 0] * dims[1] + voxels[:, 1]) * dims[2] + voxels[:, 2]
+        keys, counts, sums = _merge_voxels(
+            np.concatenate([keys, chunk_keys]),
+            np.concatenate([counts, np.ones(end - start)]),
+            np.concatenate([sums, values])
+        )
+
+    means = sums / counts[:, None] if len(counts) else sums
+    fields_out = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if color_names:
+        fields_out += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    vertices = np.empty(len(means), dtype=np.dtype(fields_out))
+    vertices["x"], vertices["y"], vertices["z"] = means[:, :3].T
+    if color_names:
+        rgb = np.clip(np.rint(means[:, 3:6]), 0, 255).astype(np.uint8)
+        vertices["red"], vertices["green"], vertices["blue"] = rgb.T
+    write_ply_vertices(output_path, vertices)
+
+    logger.info(f"Voxel downsampling ({voxel_size}): {count} -> {len(vertices)} points, wrote {output_path}")
+    return {"input_points": count, "output_points": len(vertices), "voxel_size": voxel_size, "output_file": str(output_path)}
+
+
+def remove_outliers(input_path: Path, output_path: Path, mode: str = "statistical",
+                    nb_neighbors: int = 20, std_ratio: float = 2.0,
+                    radius: Optional[float] = None, min_neighbors: int = 16,
+                    max_workers: Optional[int] = None) -> Dict:
+    """
+    Remove outlier points (same semantics as Open3D's filters)
+
+    - statistical: drop points whose mean distance to their nb_neighbors
+      nearest neighbours exceeds mean + std_ratio * std over the cloud
+    - radius: drop points with fewer than min_neighbors others within radius
+
+    Neighbours come from the cloud's cached grid index ({name}.gridindex)
+    and are queried in batches across a process pool.
+    Returns counts, the output file and inlier_mask (bool, input order).
+    """
+    input_path = Path(input_path)
+    fields, kinds, count = open_ply_vertices(input_path)
+    if not all(axis in kinds for axis in "xyz"):
+        raise ValueError(f"{input_path}: vertex element has no x/y/z properties")
+    if mode not in ("statistical", "radius"):
+        raise ValueError(f"Unknown outlier removal mode: {mode}")
+    if mode == "radius" and not radius:
+        raise ValueError("radius mode needs a positive radius")
+    if count == 0:
+        raise ValueError(f"{input_path} has no points")
+
+    xyz = np.stack([np.asarray(fields[axis], dtype=np.float64) for axis in "xyz"], axis=1)
+    index, index_dir = load_or_build_index(input_path, xyz)
+    del xyz
+
+    # Queries run in index (cell) order; scatter the answers back to input order
+    values = np.empty(count)
+    if mode == "statistical":
+        values[index.order] = query_all(index_dir, count, "knn", nb_neighbors, max_workers)
+        threshold = values.mean() + std_ratio * values.std()
+        inlier_mask = values <= threshold
+    else:
+        values[index.order] = query_all(index_dir, count, "radius", radius, max_workers)
+        inlier_mask = values >= min_neighbors
+
+    write_ply_vertices(output_path, select_vertices(fields, kinds, inlier_mask))
+    kept = int(inlier_mask.sum())
+    logger.info(f"Outlier removal ({mode}): kept {kept} of {count} points, wrote {output_path}")
+    return {
+        "mode": mode,
+        "input_points": count,
+        "output_points": kept,
+        "removed_points": count - kept,
+        "output_file": str(output_path),
+        "inlier_mask": inlier_mask,
+    }
+
+
 class Open3DProcessor:
     def get_point_cloud_stats(self, path): return {"error": "Open3D not available"}
     def select_point_info(self, path, idx): return {"error": "Open3D not available"}
     def apply_colormap(self, path, cmap): return path
-    def downsample_point_cloud(self, path, voxel): return path
+
+    def downsample_point_cloud(self, path, voxel, output_path: Optional[Path] = None):
+        """Voxel-grid downsample a PLY; writes {stem}_voxel_{voxel}.ply next to it by default"""
+        path = Path(path)
+        if output_path is None:
+            output_path = path.with_name(f"{path.stem}_voxel_{voxel:g}.ply")
+        return voxel_downsample(path, Path(output_path), float(voxel))["output_file"]
+
     def estimate_normals(self, path, radius, max_nn): return path
-    def remove_outliers(self, path, nb_neighbors, std_ratio): return path
+
+    def remove_outliers(self, path, nb_neighbors, std_ratio, output_path: Optional[Path] = None, **options) -> Dict:
+        """
+        Statistical outlier removal; writes {stem}_filtered.ply by default
+        Pass mode="radius", radius=..., min_neighbors=... for radius filtering.
+        """
+        path = Path(path)
+        if output_path is None:
+            output_path = path.with_name(f"{path.stem}_filtered.ply")
+        return remove_outliers(path, Path(output_path), nb_neighbors=int(nb_neighbors), std_ratio=float(std_ratio), **options)
+
     def create_mesh(self, path, method): return path
     def render_to_image(self, path, width, height, camera_params): return ""
     def get_camera_parameters(self): return {"front": [0,0,1], "lookat": [0,0,0], "up": [0,1,0], "zoom": 0.8}
 
-open3d_processor = Open3DProcessor()
\ No newline at end of file
+open3d_processor = Open3DProcessor()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Keyset Pagination and Field Projection for Listing Queries
+Project and scan listings are ordered most recently updated first on
+(updated_at, id). A page ends with an opaque cursor holding the last
+row's (updated_at, id), and the next page continues strictly after it:
+a range SEARCH on the (..., updated_at, id) indexes (migration 3), so a
+deep page costs the same as the first one, where LIMIT/OFFSET would read
+and discard every row before it. id breaks ties between rows updated in
+the same second.
+
+Paging is opt-in: a request without limit or cursor gets the whole
+listing in the same order (next_cursor None), which is what existing
+clients expect. `fields=` selects a comma-separated subset of the
+table's columns; the key columns are always included so every page can
+produce its cursor.
+"""
+
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))          # Rows per page for a cursor without limit
+MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "500"))  # Upper bound for ?limit=
+
+KEY_COLUMNS = ("updated_at", "id")
+
+
+def encode_cursor(row: Dict) -> str:
+    payload = json.dumps([row[column] for column in KEY_COLUMNS], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """(updated_at, id) of the row a page continues after; ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return updated_at, row_id
+
+
+def projection(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """Columns to select for a fields= value (None/empty: all); ValueError on unknown names"""
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys([*KEY_COLUMNS, *requested]))
+
+
+def clamp_limit(limit: Optional[int], cursor: Optional[str] = None) -> Optional[int]:
+    """Page size for a request; None (unpaged) when neither limit nor cursor was sent"""
+    if limit is None and not cursor:
+        return None
+    return min(max(limit or PAGE_SIZE, 1), MAX_PAGE_SIZE)
+
+
+def page_query(table: str, columns: Sequence[str], filters: Dict[str, Any],
+               cursor: Optional[str], limit: Optional[int]) -> Tuple[str, List]:
+    """
+    SELECT for one page: equality filters, then the keyset condition.
+    Fetches limit + 1 rows; the extra row only tells whether a next page
+    exists. limit None selects every matching row.
+    """
+    conditions = [f"{column} = ?" for column in filters]
+    params: List[Any] = list(filters.values())
+    if cursor:
+        conditions.append("(updated_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY updated_at DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params
+
+
+def page_result(rows: List[Dict], limit: Optional[int], key: str) -> Dict:
+    """{key: rows, "next_cursor": cursor or None} from the limit + 1 rows fetched"""
+    if limit is None:
+        return {key: rows, "next_cursor": None}
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return {key: items, "next_cursor": next_cursor}
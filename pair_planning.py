@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Retrieval-based Match Pair Planning
+Chooses which image pairs COLMAP should match, so matching costs O(n * k)
+instead of the exhaustive matcher's O(n^2):
+
+1. A global descriptor per image: VLAD over RootSIFT, aggregated from the
+   features already in database.db (vocabulary: k-means on a sample)
+2. Pairs = every frame with its TEMPORAL_WINDOW successors (video order)
+   + each frame's RETRIEVAL_K most similar frames outside that window,
+   which keeps loop closures when a walk-through revisits a place
+
+The pair list is written in `colmap matches_importer` format (match_type=pairs).
+"""
+
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VOCABULARY_SIZE = 32           # VLAD visual words (descriptor size = 32 * 128)
+VOCABULARY_SAMPLES = 50_000    # Max. descriptors used to train the vocabulary
+VOCABULARY_ITERATIONS = 15     # k-means (Lloyd) iterations
+TEMPORAL_WINDOW = 10           # Frames matched with their next N frames (as sequential overlap)
+RETRIEVAL_K = 10               # Most similar frames added per frame
+SIMILARITY_BLOCK_ROWS = 1024   # Similarity rows computed at once
+
+
+def read_descriptors(database_path: Path) -> Tuple[List[str], List[np.ndarray]]:
+    """Image names (sorted) and their SIFT descriptors (rows x 128, uint8) from a COLMAP database"""
+    conn = sqlite3.connect(database_path)
+    try:
+        rows = conn.execute(
+            """SELECT i.name, d.rows, d.cols, d.data
+               FROM images i LEFT JOIN descriptors d ON d.image_id = i.image_id
+               ORDER BY i.name"""
+        ).fetchall()
+    finally:
+        conn.close()
+    names, descriptors = [], []
+    for name, count, cols, data in rows:
+        names.append(name)
+        if count and data:
+            descriptors.append(np.frombuffer(data, dtype=np.uint8).reshape(count, cols))
+        else:
+            descriptors.append(np.empty((0, 128), dtype=np.uint8))
+    return names, descriptors
+
+
+def root_sift(descriptors: np.ndarray) -> np.ndarray:
+    """RootSIFT: L1-normalise, then square root (Hellinger kernel as a dot product)"""
+    values = descriptors.astype(np.float32)
+    values /= np.maximum(values.sum(axis=1, keepdims=True), 1e-12)
+    return np.sqrt(values)
+
+
+def train_vocabulary(descriptors: List[np.ndarray], size: int = VOCABULARY_SIZE) -> np.ndarray:
+    """k-means centres on an evenly spread sample of all images' RootSIFT descriptors"""
+    total = sum(len(d) for d in descriptors)
+    if total == 0:
+        return np.zeros((0, 128), dtype=np.float32)
+    fraction = min(1.0, VOCABULARY_SAMPLES / total)
+    rng = np.random.default_rng(0)
+    sample = []
+    for d in descriptors:
+        take = min(len(d), int(np.ceil(len(d) * fraction)))
+        if take:
+            sample.append(d[rng.choice(len(d), take, replace=False)])
+    sample = root_sift(np.concatenate(sample))
+    size = min(size, len(sample))
+
+    # Lloyd iterations with matmul distances (much faster than cv2.kmeans at this size)
+    centers = sample[rng.choice(len(sample), size, replace=False)].copy()
+    for _ in range(VOCABULARY_ITERATIONS):
+        words = _nearest(sample, centers)
+        counts = np.bincount(words, minlength=size)
+        sums = np.zeros_like(centers)
+        _sum_rows(sums, words, sample)
+        moved = counts > 0
+        centers[moved] = sums[moved] / counts[moved, None]
+    return centers
+
+
+def _nearest(values: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Index of the nearest centre per row (|c|^2 - 2 v.c; |v|^2 is constant per row)"""
+    return ((centers * centers).sum(axis=1) - 2.0 * values @ centers.T).argmin(axis=1)
+
+
+def _sum_rows(sums: np.ndarray, words: np.ndarray, values: np.ndarray):
+    """sums[w] += values rows assigned to word w (one-hot matmul: BLAS instead of np.add.at)"""
+    assignment = np.zeros((len(words), len(sums)), dtype=values.dtype)
+    assignment[np.arange(len(words)), words] = 1.0
+    sums += assignment.T @ values
+
+
+def vlad(descriptors: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    VLAD vector: per-word sum of residuals to the nearest centre, intra-
+    normalised per word, power-normalised and L2-normalised
+    """
+    result = np.zeros(centers.shape, dtype=np.float32)
+    if len(descriptors) and len(centers):
+        values = root_sift(descriptors)
+        words = _nearest(values, centers)
+        _sum_rows(result, words, values - centers[words])
+        norms = np.linalg.norm(result, axis=1, keepdims=True)
+        result /= np.maximum(norms, 1e-12)
+    result = result.ravel()
+    result = np.sign(result) * np.sqrt(np.abs(result))
+    return result / max(float(np.linalg.norm(result)), 1e-12)
+
+
+def plan_pairs(embeddings: np.ndarray, window: int = TEMPORAL_WINDOW,
+               k: int = RETRIEVAL_K) -> List[Tuple[int, int]]:
+    """
+    Index pairs (i < j): temporal neighbours within window, plus each
+    frame's k most similar frames outside the window (cosine similarity)
+    """
+    count = len(embeddings)
+    pairs = {(i, j) for i in range(count) for j in range(i + 1, min(i + window + 1, count))}
+    k = min(k, max(count - 2 * window - 1, 0))
+    if k > 0:
+        for start in range(0, count, SIMILARITY_BLOCK_ROWS):
+            end = min(start + SIMILARITY_BLOCK_ROWS, count)
+            similarity = embeddings[start:end] @ embeddings.T
+            rows = np.arange(start, end)
+            # Exclude the frame itself and its temporal window (already paired)
+            offsets = np.arange(-window, window + 1)
+            columns = rows[:, None] + offsets
+            valid = (columns >= 0) & (columns < count)
+            similarity[np.nonzero(valid)[0], columns[valid]] = -np.inf
+            nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            for i, neighbours in zip(rows.tolist(), nearest.tolist()):
+                for j in neighbours:
+                    pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
+
+
+def write_match_list(database_path: Path, output_file: Path,
+                     window: int = TEMPORAL_WINDOW, k: int = RETRIEVAL_K) -> Dict:
+    """Plan pairs for every image in the database and write them as "name1 name2" lines"""
+    names, descriptors = read_descriptors(database_path)
+    centers = train_vocabulary(descriptors)
+    embeddings = np.stack([vlad(d, centers) for d in descriptors]) if names else np.zeros((0, 1), np.float32)
+    pairs = plan_pairs(embeddings, window, k)
+
+    with open(output_file, "w") as f:
+        f.writelines(f"{names[i]} {names[j]}\n" for i, j in pairs)
+
+    exhaustive = len(names) * (len(names) - 1) // 2
+    logger.info(f"Planned {len(pairs)} match pairs for {len(names)} images "
+                f"(exhaustive: {exhaustive}, window {window}, top-{k} retrieval)")
+    return {"num_images": len(names), "planned_pairs": len(pairs), "exhaustive_pairs": exhaustive}
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Octree Level-of-Detail Tiles for Point Clouds
+Splits a reconstruction PLY into a hierarchy of small PLY tiles so the
+viewer can draw a coarse cloud immediately and refine it by loading only
+the nodes the camera needs.
+
+Layout (Potree-style node naming):
+- Node "r" is the root covering the cubic bounding box of the cloud;
+  child i of node "rXY" is "rXYi" (octant bits: x=4, y=2, z=1).
+- Every node holds at most max_points points, sampled on a regular grid
+  inside its cube (about one point per cell), so each level is a uniformly
+  thinned version of the cloud. Points not kept by a node go to its children.
+- Each node's points are stored once: the full cloud is the union of all tiles.
+
+Output directory:
+    hierarchy.json   bounds, per-node metadata and the source PLY fingerprint
+    r.ply, r0.ply…   one binary PLY (x, y, z, red, green, blue) per node
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from colmap_export import write_ply_vertices
+
+logger = logging.getLogger(__name__)
+
+TILES_VERSION = 1
+TILE_MAX_POINTS = 50000        # Upper bound of points per tile
+MAX_DEPTH = 12                 # Nodes at this depth keep all remaining points
+HIERARCHY_FILE = "hierarchy.json"
+NODE_ID_PATTERN = re.compile(r"^r[0-7]{0,%d}$" % MAX_DEPTH)
+
+TILE_DTYPE = np.dtype([
+    ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+    ("red", "u1"), ("green", "u1"), ("blue", "u1"),
+])
+
+# PLY property type -> NumPy type
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+_FLOAT_TYPES = ("float", "float32", "double", "float64")
+_COLOR_NAMES = (("red", "green", "blue"), ("r", "g", "b"), ("diffuse_red", "diffuse_green", "diffuse_blue"))
+
+
+def open_ply_vertices(path: Path) -> Tuple[Any, Dict[str, str], int]:
+    """
+    Vertex data of an ascii or binary PLY without copying it
+
+    Returns (fields, property types, vertex count); fields[name] gives one
+    property column and binary files are memory-mapped, so slicing fields
+    reads only the requested rows.
+    """
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        fmt = None
+        elements: List[Tuple[str, int, List[Tuple[str, str]]]] = []
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{path}: PLY header has no end_header")
+            tokens = line.decode("ascii", errors="replace").split()
+            if not tokens or tokens[0] in ("comment", "obj_info"):
+                continue
+            if tokens[0] == "end_header":
+                break
+            if tokens[0] == "format":
+                fmt = tokens[1]
+            elif tokens[0] == "element":
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == "property":
+                if tokens[1] == "list":
+                    elements[-1][2].append((tokens[-1], "list"))
+                else:
+                    elements[-1][2].append((tokens[2], tokens[1]))
+        data_offset = f.tell()
+
+    if fmt not in ("ascii", "binary_little_endian", "binary_big_endian"):
+        raise ValueError(f"{path}: unsupported PLY format {fmt}")
+
+    # Only elements before "vertex" need skipping; they must be fixed-size in binary files
+    skip = 0
+    vertex = None
+    for name, count, properties in elements:
+        if name == "vertex":
+            vertex = (count, properties)
+            break
+        if fmt != "ascii":
+            if any(kind == "list" for _, kind in properties):
+                raise ValueError(f"{path}: variable-size element {name} before vertex is not supported")
+            skip += count * sum(np.dtype(_PLY_TYPES[kind]).itemsize for _, kind in properties)
+        else:
+            skip += count
+    if vertex is None:
+        raise ValueError(f"{path}: PLY has no vertex element")
+    count, properties = vertex
+    if any(kind == "list" for _, kind in properties):
+        raise ValueError(f"{path}: list properties on vertices are not supported")
+
+    if fmt == "ascii":
+        columns = [name for name, _ in properties]
+        with open(path, "rb") as f:
+            f.seek(data_offset)
+            for _ in range(skip):
+                f.readline()
+            table = np.loadtxt(f, max_rows=count, ndmin=2) if count else np.empty((0, len(columns)))
+        fields = {name: table[:, i] for i, name in enumerate(columns)}
+    else:
+        order = "<" if fmt == "binary_little_endian" else ">"
+        dtype = np.dtype([(name, order + _PLY_TYPES[kind]) for name, kind in properties])
+        if count:
+            fields = np.memmap(path, dtype=dtype, mode="r", offset=data_offset + skip, shape=(count,))
+        else:
+            fields = np.empty(0, dtype=dtype)
+
+    return fields, dict(properties), count
+
+
+def select_vertices(fields: Any, kinds: Dict[str, str], mask: np.ndarray) -> np.ndarray:
+    """Rows of the vertex element where mask is set, as a little-endian structured array"""
+    dtype = np.dtype([(name, "<" + _PLY_TYPES[kind]) for name, kind in kinds.items()])
+    if isinstance(fields, dict):
+        selected = np.empty(int(mask.sum()), dtype=dtype)
+        for name in kinds:
+            selected[name] = fields[name][mask]
+        return selected
+    return np.asarray(fields[mask]).astype(dtype)
+
+
+def vertex_colors(kinds: Dict[str, str]) -> Optional[Tuple[str, str, str]]:
+    """Names of the color properties of a PLY vertex element (None if uncolored)"""
+    for names in _COLOR_NAMES:
+        if all(name in kinds for name in names):
+            return names
+    return None
+
+
+def to_uint8_colors(values: np.ndarray, kind: str) -> np.ndarray:
+    """Color column as uint8 (float colors are in 0..1)"""
+    if kind in _FLOAT_TYPES:
+        values = np.clip(values * 255.0 + 0.5, 0, 255)
+    return values.astype(np.uint8)
+
+
+def read_ply(path: Path) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Read vertex positions (float64, (N, 3)) and colors (uint8, (N, 3) or
+    None) from an ascii or binary PLY
+    """
+    fields, kinds, count = open_ply_vertices(path)
+
+    xyz = np.empty((count, 3), dtype=np.float64)
+    for i, axis in enumerate("xyz"):
+        if axis not in kinds:
+            raise ValueError(f"{path}: vertex element has no {axis} property")
+        xyz[:, i] = fields[axis]
+
+    rgb = None
+    color_names = vertex_colors(kinds)
+    if color_names:
+        rgb = np.empty((count, 3), dtype=np.uint8)
+        for i, name in enumerate(color_names):
+            rgb[:, i] = to_uint8_colors(np.asarray(fields[name]), kinds[name])
+
+    return xyz, rgb
+
+
+def _source_fingerprint(ply_path: Path) -> Dict:
+    st = Path(ply_path).stat()
+    return {"file": Path(ply_path).name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_hierarchy(output_dir: Path) -> Optional[Dict]:
+    """The hierarchy manifest of a tile directory (None if missing/unreadable)"""
+    try:
+        with open(Path(output_dir) / HIERARCHY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_up_to_date(output_dir: Path, ply_path: Path, max_points: int = TILE_MAX_POINTS) -> bool:
+    """True if the tiles were built from this exact PLY with the same settings"""
+    hierarchy = load_hierarchy(output_dir)
+    return bool(
+        hierarchy
+        and hierarchy.get("version") == TILES_VERSION
+        and hierarchy.get("max_points_per_tile") == max_points
+        and hierarchy.get("source") == _source_fingerprint(ply_path)
+    )
+
+
+def tile_path(output_dir: Path, node_id: str) -> Path:
+    """Path of a node's tile; raises ValueError for malformed node ids"""
+    if not NODE_ID_PATTERN.match(node_id):
+        raise ValueError(f"Invalid tile node id: {node_id}")
+    return Path(output_dir) / f"{node_id}.ply"
+
+
+def _grid_sample(xyz: np.ndarray, origin: np.ndarray, size: float, grid: int, max_points: int) -> np.ndarray:
+    """
+    Positions (into xyz) of at most max_points points, one per occupied grid
+    cell. Input order is pre-shuffled, so the first point of a cell is random.
+    """
+    cells = np.floor((xyz - origin) * (grid / size)).astype(np.int64)
+    np.clip(cells, 0, grid - 1, out=cells)
+    keys = (cells[:, 0] * grid + cells[:, 1]) * grid + cells[:, 2]
+    _, first = np.unique(keys, return_index=True)
+    # Sorting by input position keeps the subset random when it is cut to max_points
+    first.sort()
+    return first[:max_points]
+
+
+def build_tiles(ply_path: Path, output_dir: Path, max_points: int = TILE_MAX_POINTS) -> Dict:
+    """
+    Build the octree tiles of a PLY into output_dir (replaced atomically)
+
+    Returns a summary: num_points, num_nodes, depth, hierarchy file.
+    """
+    ply_path = Path(ply_path)
+    output_dir = Path(output_dir)
+    xyz, rgb = read_ply(ply_path)
+    num_points = len(xyz)
+
+    # Shuffle once (deterministically) so grid sampling picks random points per cell
+    order = np.random.default_rng(0).permutation(num_points)
+    xyz = xyz[order]
+    rgb = rgb[order] if rgb is not None else np.full((num_points, 3), 255, dtype=np.uint8)
+
+    if num_points:
+        lower = xyz.min(axis=0)
+        size = float((xyz.max(axis=0) - lower).max()) or 1.0
+    else:
+        lower, size = np.zeros(3), 1.0
+    # Roughly max_points cells are occupied when the points lie on surfaces
+    grid = max(int(np.sqrt(max_points)), 1)
+
+    work_dir = output_dir.with_name(output_dir.name + ".tmp")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+
+    nodes: Dict[str, Dict] = {}
+    # Breadth-first, so nodes appear level by level in the manifest
+    queue = [("r", np.arange(num_points), lower, size)]
+    while queue:
+        next_queue = []
+        for node_id, members, origin, node_size in queue:
+            depth = len(node_id) - 1
+            if len(members) <= max_points or depth >= MAX_DEPTH:
+                kept = np.arange(len(members))
+            else:
+                kept = _grid_sample(xyz[members], origin, node_size, grid, max_points)
+
+            selected = members[kept]
+            vertices = np.empty(len(selected), dtype=TILE_DTYPE)
+            vertices["x"], vertices["y"], vertices["z"] = xyz[selected].T
+            vertices["red"], vertices["green"], vertices["blue"] = rgb[selected].T
+            write_ply_vertices(work_dir / f"{node_id}.ply", vertices)
+
+            remaining = np.delete(members, kept)
+            children = []
+            if len(remaining):
+                half = node_size / 2
+                upper = (xyz[remaining] >= origin + half).astype(np.int64)
+                octants = upper[:, 0] * 4 + upper[:, 1] * 2 + upper[:, 2]
+                grouped = np.argsort(octants, kind="stable")
+                counts = np.bincount(octants, minlength=8)
+                for octant, group in enumerate(np.split(remaining[grouped], np.cumsum(counts)[:-1])):
+                    if len(group) == 0:
+                        continue
+                    child_id = f"{node_id}{octant}"
+                    offset = np.array([(octant >> 2) & 1, (octant >> 1) & 1, octant & 1]) * half
+                    next_queue.append((child_id, group, origin + offset, half))
+                    children.append(child_id)
+
+            nodes[node_id] = {
+                "level": depth,
+                "bounds": {"min": origin.tolist(), "max": (origin + node_size).tolist()},
+                "spacing": node_size / grid,
+                "num_points": int(len(selected)),
+                "children": children,
+            }
+        queue = next_queue
+
+    hierarchy = {
+        "version": TILES_VERSION,
+        "source": _source_fingerprint(ply_path),
+        "num_points": int(num_points),
+        "max_points_per_tile": max_points,
+        "bounds": {"min": lower.tolist(), "max": (lower + size).tolist()},
+        "depth": max(node["level"] for node in nodes.values()),
+        "nodes": nodes,
+    }
+    with open(work_dir / HIERARCHY_FILE, "w") as f:
+        json.dump(hierarchy, f)
+
+    # Swap the finished directory in, so tiles are never served half-written
+    if output_dir.exists():
+        old_dir = output_dir.with_name(output_dir.name + ".old")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(output_dir, old_dir)
+        os.replace(work_dir, output_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.replace(work_dir, output_dir)
+
+    logger.info(f"Built {len(nodes)} tiles ({num_points} points, depth {hierarchy['depth']}) in {output_dir}")
+    return {
+        "num_points": int(num_points),
+        "num_nodes": len(nodes),
+        "depth": hierarchy["depth"],
+        "hierarchy_file": str(output_dir / HIERARCHY_FILE),
+    }
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Resource-aware Thread Planner
+Decides how many threads (and parallel processes) each COLMAP/ffmpeg
+invocation gets, from what this node can actually run and how many
+pipelines are sharing it right now:
+
+- CPUs: the affinity mask, bounded by the cgroup CPU quota (v2 cpu.max or
+  v1 cfs_quota_us) and colmap.num_threads / COLMAP_NUM_THREADS
+- Memory: MemAvailable, bounded by the cgroup memory limit and
+  performance.max_memory_gb / MAX_MEMORY_GB
+- Running pipelines: each one holds an flock on a file in JOB_SLOT_DIR
+  (see job_slot), so the count is node-wide and survives crashes
+
+Budgets are computed per invocation, so a job running alone uses every
+core, and stages started after a second job arrives get half of them.
+"""
+
+import fcntl
+import logging
+import math
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from gpu_config import get_max_concurrent_jobs, get_max_memory_bytes, get_num_threads
+
+logger = logging.getLogger(__name__)
+
+JOB_SLOT_DIR = Path(os.getenv("JOB_SLOT_DIR", "/tmp/colmap-job-slots"))
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs allowed by the cgroup quota (v2, then v1), None when unlimited"""
+    value = _read(CGROUP_ROOT / "cpu.max")
+    if value:
+        quota, _, period = value.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(CGROUP_ROOT / "cpu" / "cpu.cfs_quota_us"), _read(CGROUP_ROOT / "cpu" / "cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory_available() -> Optional[int]:
+    """Bytes left under the cgroup memory limit (v2, then v1), None when unlimited"""
+    for limit_file, usage_file in (("memory.max", "memory.current"),
+                                   ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes")):
+        limit, usage = _read(CGROUP_ROOT / limit_file), _read(CGROUP_ROOT / usage_file)
+        # v1 reports "no limit" as a huge page-aligned number
+        if limit and limit != "max" and int(limit) < 1 << 60:
+            return max(0, int(limit) - int(usage or 0))
+    return None
+
+
+def usable_cpus() -> int:
+    """CPUs this process may run on (affinity, cgroup quota, configured bound)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    configured = get_num_threads()
+    if configured:
+        cpus = min(cpus, configured)
+    return max(1, cpus)
+
+
+def available_memory() -> int:
+    """Bytes of memory available to new work (MemAvailable, cgroup limit, configured bound)"""
+    available = None
+    meminfo = _read(Path("/proc/meminfo")) or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemAvailable:"):
+            available = int(line.split()[1]) * 1024
+    limits = [value for value in (available, cgroup_memory_available(), get_max_memory_bytes() or None) if value]
+    return min(limits) if limits else 0
+
+
+def running_jobs() -> int:
+    """Pipelines currently holding a slot on this node (at least 1: the caller)"""
+    count = 0
+    for slot in JOB_SLOT_DIR.glob("*.lock"):
+        try:
+            with open(slot) as f:
+                fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(f, fcntl.LOCK_UN)
+            slot.unlink(missing_ok=True)  # Nobody holds it: the owner exited
+        except BlockingIOError:
+            count += 1
+        except OSError:
+            continue
+    return max(1, count)
+
+
+@contextmanager
+def job_slot(job_id: str):
+    """Count this pipeline as running on the node for as long as the block runs"""
+    JOB_SLOT_DIR.mkdir(parents=True, exist_ok=True)
+    slot = JOB_SLOT_DIR / f"{job_id}.{os.getpid()}.lock"
+    while True:
+        f = open(slot, "w")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # running_jobs may have locked and unlinked the file between open and
+        # flock; a lock on the unlinked inode would not be counted, so retry
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(slot)):
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+    with f:
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            slot.unlink(missing_ok=True)
+
+
+def thread_budget(memory_per_thread: int = 0) -> int:
+    """
+    Threads one invocation may use: this job's share of the usable CPUs,
+    reduced so memory_per_thread (bytes, if given) fits this job's share
+    of the available memory
+    """
+    jobs = running_jobs()
+    threads = max(1, usable_cpus() // jobs)
+    if memory_per_thread > 0:
+        threads = max(1, min(threads, available_memory() // jobs // memory_per_thread))
+    return threads
+
+
+def plan() -> Dict:
+    """Current resources and budgets (for logs and the status API)"""
+    return {
+        "usable_cpus": usable_cpus(),
+        "cgroup_cpu_limit": cgroup_cpu_limit(),
+        "available_memory_bytes": available_memory(),
+        "running_jobs": running_jobs(),
+        "max_concurrent_jobs": get_max_concurrent_jobs(),
+        "thread_budget": thread_budget(),
+    }
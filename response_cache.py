@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+In-Process Response Cache for Polled Read Endpoints
+The frontend polls /api/status and the project/scan listings. Their
+serialized bodies are kept per route + query string together with the
+database's data version (the data_version row, bumped by triggers on
+every write to users, projects, scans and scan_technical_details; see
+migrations.py). A poll then costs one single-row SELECT while nothing
+changed, and a write from any process (API, job workers) invalidates
+every entry by moving the version on.
+
+Entries carry a strong ETag (hash of the exact body bytes): a client
+sending it back in If-None-Match gets 304 Not Modified and no body.
+Entries can also expire after max_age seconds, for responses that
+include data not stored in the database (resource usage in /api/status).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))  # LRU bound (route + query string)
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: int
+    expires: Optional[float]
+    body: bytes
+    etag: str
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+class ResponseCache:
+    """LRU of rendered responses, valid while the data version they were built at is current"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max(max_entries, 1)
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple, version: int) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or (entry.expires and entry.expires < time.monotonic()):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Tuple, version: int, body: bytes, max_age: Optional[float] = None) -> CachedResponse:
+        entry = CachedResponse(version, time.monotonic() + max_age if max_age else None, body, strong_etag(body))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
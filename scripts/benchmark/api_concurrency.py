@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+API concurrency benchmark: read-endpoint latency while exports run
+Polls the read endpoints the frontend uses from several threads, first
+on an idle server and then while export requests run continuously, and
+reports p50/p95/p99 latency per endpoint for both phases. Any blocking
+work on the event loop shows up as a p99 close to the export time.
+
+Usage (against a running backend with a finished reconstruction):
+    python scripts/benchmark/api_concurrency.py --url http://localhost:8000
+        --job-id <job_id> [--export-format NVM] [--exporters 2] [--readers 8]
+        [--seconds 20] [--etag]
+
+With --etag readers poll like a caching client: each sends back the ETag
+it last got for an endpoint in If-None-Match (304 while unchanged).
+
+NVM exports run `colmap model_converter`; PLY/TXT exports are skipped
+once they are up to date, so they only load the server the first time.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+READ_ENDPOINTS = ["/health", "/api/status", "/api/projects"]
+
+
+def request(url: str, method: str = "GET", headers: Optional[Dict[str, str]] = None) -> Tuple[float, Optional[str]]:
+    """Latency (seconds) and ETag of one request; HTTP errors (and 304) count, the body is read in full"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method, headers=headers or {}),
+                                    timeout=300) as response:
+            response.read()
+            etag = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        e.read()
+        etag = e.headers.get("ETag")
+    return time.perf_counter() - started, etag
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_phase(base_url: str, readers: int, seconds: float, exporters: int = 0,
+              export_url: str = "", use_etags: bool = False) -> Dict:
+    """Readers poll READ_ENDPOINTS round-robin while `exporters` threads export in a loop"""
+    stop = threading.Event()
+    latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in READ_ENDPOINTS}
+    exports: List[float] = []
+    lock = threading.Lock()
+
+    def reader(offset: int):
+        i = offset
+        etags: Dict[str, str] = {}
+        while not stop.is_set():
+            endpoint = READ_ENDPOINTS[i % len(READ_ENDPOINTS)]
+            headers = {"If-None-Match": etags[endpoint]} if use_etags and endpoint in etags else None
+            latency, etag = request(base_url + endpoint, headers=headers)
+            if etag:
+                etags[endpoint] = etag
+            with lock:
+                latencies[endpoint].append(latency)
+            i += 1
+
+    def exporter():
+        while not stop.is_set():
+            latency, _ = request(export_url, method="POST")
+            with lock:
+                exports.append(latency)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=exporter) for _ in range(exporters)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    result = {}
+    for endpoint, values in latencies.items():
+        if values:
+            result[endpoint] = {
+                "requests": len(values),
+                "p50_ms": round(statistics.median(values) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            }
+    if exports:
+        result["exports"] = {"completed": len(exports), "mean_s": round(statistics.mean(exports), 2)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read latency under concurrent exports")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--job-id", required=True, help="Job with a finished sparse model")
+    parser.add_argument("--export-format", default="NVM")
+    parser.add_argument("--exporters", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--etag", action="store_true", help="Send If-None-Match with the last ETag")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    export_url = f"{base_url}/api/reconstruction/{args.job_id}/export?format={args.export_format}"
+    results = {
+        "idle": run_phase(base_url, args.readers, args.seconds, use_etags=args.etag),
+        "during_exports": run_phase(base_url, args.readers, args.seconds, args.exporters, export_url, args.etag),
+    }
+
+    for phase, endpoints in results.items():
+        print(f"\n{phase}")
+        for endpoint, stats in endpoints.items():
+            print(f"  {endpoint:<16} {json.dumps(stats)}")
+
+
+if __name__ == "__main__":
+    main()
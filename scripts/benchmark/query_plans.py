@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Query plan benchmark: app listing/queue queries before and after indexes
+Seeds a database at schema version 1 (tables only, see migrations.py)
+with users, projects, scans and processing jobs, records each query's
+plan and latency, migrates to the latest version (secondary indexes) and
+measures again. Index use shows as SEARCH ... USING INDEX instead of a
+SCAN, or as a sort that is no longer needed (USE TEMP B-TREE).
+
+At the latest version it also times keyset pages (pagination.py) of
+the project listing: the first page and one 90% of the way down should
+cost the same.
+
+Usage:
+    python scripts/benchmark/query_plans.py [--scans 1000000] [--projects 10000]
+        [--users 1000] [--db /tmp/query_plans.db] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from migrations import LATEST_VERSION, migrate  # noqa: E402
+from pagination import encode_cursor, page_query  # noqa: E402
+
+BATCH = 50_000
+
+# (name, sql, parameter picker) for the queries the API and job queue run
+QUERIES = [
+    ("get_project_scans", '''
+        SELECT s.*, std.point_count, std.processing_time_seconds, std.file_size_bytes
+        FROM scans s LEFT JOIN scan_technical_details std ON s.id = std.scan_id
+        WHERE s.project_id = ? ORDER BY s.created_at DESC''', "project"),
+    ("api_project_scans", "SELECT * FROM scans WHERE project_id = ?", "project"),
+    ("get_user_projects", '''
+        SELECT p.*, COUNT(s.id) as scan_count
+        FROM projects p LEFT JOIN scans s ON p.id = s.project_id
+        WHERE p.user_id = ? GROUP BY p.id ORDER BY p.updated_at DESC''', "user"),
+    ("claim_next_job", "SELECT * FROM processing_jobs WHERE status = 'queued' ORDER BY rowid LIMIT 1", None),
+    ("scan_latest_job", "SELECT job_id FROM processing_jobs WHERE scan_id = ? ORDER BY rowid DESC LIMIT 1", "scan"),
+    ("get_all_jobs_page", "SELECT * FROM processing_jobs ORDER BY started_at DESC LIMIT 50", None),
+]
+
+
+def seed(conn: sqlite3.Connection, users: int, projects: int, scans: int):
+    base = datetime(2024, 1, 1)
+    rng = random.Random(0)
+
+    def stamp(seconds: int) -> str:
+        return (base + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn.executemany("INSERT INTO users (id, email, name, created_at) VALUES (?, ?, ?, ?)",
+                     ((f"u{i}", f"user{i}@example.com", f"User {i}", stamp(i)) for i in range(users)))
+    conn.executemany(
+        "INSERT INTO projects (id, user_id, name, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        ((f"p{i}", f"u{rng.randrange(users)}", f"Project {i}", stamp(i * 60), stamp(i * 60 + rng.randrange(10 ** 7)))
+         for i in range(projects)))
+    for start in range(0, scans, BATCH):
+        rows = range(start, min(start + BATCH, scans))
+        conn.executemany(
+            "INSERT INTO scans (id, project_id, name, status, video_filename, video_size, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((f"s{i}", f"p{rng.randrange(projects)}", f"Scan {i}", "completed", f"scan{i}.mp4",
+              rng.randrange(10 ** 9), stamp(i * 30), stamp(i * 30)) for i in rows))
+        # One job per scan; a handful still queued
+        conn.executemany(
+            "INSERT INTO processing_jobs (job_id, scan_id, status, progress, started_at) VALUES (?, ?, ?, ?, ?)",
+            ((f"j{i}", f"s{i}", "queued" if i % 100_000 == 99_999 else "completed", 100, stamp(i * 30))
+             for i in rows))
+        conn.commit()
+
+
+def plan(conn: sqlite3.Connection, sql: str, params: tuple) -> str:
+    return "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def measure(conn: sqlite3.Connection, counts: dict, runs: int) -> dict:
+    rng = random.Random(1)
+    pickers = {
+        "project": lambda: (f"p{rng.randrange(counts['projects'])}",),
+        "user": lambda: (f"u{rng.randrange(counts['users'])}",),
+        "scan": lambda: (f"s{rng.randrange(counts['scans'])}",),
+        None: lambda: (),
+    }
+    results = {}
+    for name, sql, picker in QUERIES:
+        timings = []
+        for _ in range(runs):
+            params = pickers[picker]()
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+        results[name] = {"plan": plan(conn, sql, pickers[picker]()),
+                         "median_ms": round(statistics.median(timings) * 1000, 2)}
+    return results
+
+
+def measure_pages(conn: sqlite3.Connection, runs: int) -> dict:
+    """First page vs. a page 90% down the project listing, by cursor"""
+    conn.row_factory = sqlite3.Row
+    total = conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+    deep = conn.execute("SELECT updated_at, id FROM projects ORDER BY updated_at DESC, id DESC LIMIT 1 OFFSET ?",
+                        (int(total * 0.9),)).fetchone()
+    results = {}
+    for name, cursor in (("first_page", None), ("deep_page", encode_cursor(dict(deep)))):
+        sql, params = page_query("projects", ["*"], {}, cursor, 100)
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+        results[name] = {"plan": plan(conn, sql, params),
+                         "median_ms": round(statistics.median(timings) * 1000, 2)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query plans and latency before/after the index migration")
+    parser.add_argument("--scans", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--db", default="/tmp/query_plans.db")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{args.db}{suffix}").unlink(missing_ok=True)
+    conn = sqlite3.connect(args.db)
+    migrate(conn, target=1)
+    started = time.perf_counter()
+    seed(conn, args.users, args.projects, args.scans)
+    print(f"Seeded {args.scans} scans, {args.projects} projects, {args.users} users "
+          f"in {time.perf_counter() - started:.1f}s ({os.path.getsize(args.db) / 1024 ** 2:.0f} MB)")
+
+    counts = {"scans": args.scans, "projects": args.projects, "users": args.users}
+    before = measure(conn, counts, args.runs)
+    started = time.perf_counter()
+    migrate(conn)
+    print(f"Migrated to schema version {LATEST_VERSION} in {time.perf_counter() - started:.1f}s")
+    after = measure(conn, counts, args.runs)
+    pages = measure_pages(conn, args.runs)
+    conn.close()
+
+    for name, _, _ in QUERIES:
+        print(f"\n{name}: {before[name]['median_ms']} ms -> {after[name]['median_ms']} ms")
+        print(f"  before: {before[name]['plan']}")
+        print(f"  after:  {after[name]['plan']}")
+    print("\nGET /api/projects pages (limit 100)")
+    for name, result in pages.items():
+        print(f"  {name}: {result['median_ms']} ms  {result['plan']}")
+
+
+if __name__ == "__main__":
+    main()
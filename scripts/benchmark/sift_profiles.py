@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+SIFT profile benchmark: speed vs. reconstruction quality
+Runs feature extraction, matching and (optionally) mapping on the same
+frames with the GPU profile and the CPU profile (see
+COLMAPProcessor.extract_features) and reports time and quality per stage:
+
+- features per image (extraction), verified pairs (matching)
+- registered images, 3D points, mean track length (mapping)
+
+Usage:
+    python scripts/benchmark/sift_profiles.py --images /workspace/<job>/images
+        [--quality medium] [--profiles cpu,gpu] [--map] [--output results.json]
+
+The GPU profile is skipped when no GPU is available. The feature cache is
+disabled so every run extracts from scratch.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ["FEATURE_CACHE_MAX_GB"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from colmap_processor import COLMAPProcessor  # noqa: E402
+from gpu_config import gpu_available  # noqa: E402
+
+
+def run_profile(images: Path, quality: str, use_gpu: bool, map_model: bool, work_dir: Path) -> dict:
+    """One profile on a fresh job directory (frames symlinked, not copied)"""
+    job_path = work_dir / ("gpu" if use_gpu else "cpu")
+    processor = COLMAPProcessor(str(job_path))
+    for frame in sorted(images.glob("*.jpg")):
+        (processor.images_path / frame.name).symlink_to(frame.resolve())
+
+    result = {"profile": "gpu" if use_gpu else "cpu", "quality": quality}
+    started = time.monotonic()
+    features = processor.extract_features(quality=quality, use_gpu=use_gpu)
+    result["extraction_seconds"] = round(time.monotonic() - started, 2)
+    result["num_images"] = features.get("num_images", 0)
+    result["avg_features_per_image"] = features.get("avg_features_per_image", 0)
+
+    started = time.monotonic()
+    matches = processor.match_features(matching_type="sequential", use_gpu=use_gpu, quality=quality)
+    result["matching_seconds"] = round(time.monotonic() - started, 2)
+    result["verified_pairs"] = matches.get("verified_pairs", 0)
+
+    if map_model:
+        started = time.monotonic()
+        reconstruction = processor.sparse_reconstruction(quality=quality)
+        result["mapping_seconds"] = round(time.monotonic() - started, 2)
+        stats = reconstruction["stats"]
+        result["registered_images"] = stats.get("registered_images", 0)
+        result["points_3d"] = reconstruction["best_model_points"]
+        result["mean_track_length"] = stats.get("mean_track_length")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the GPU and CPU SIFT profiles")
+    parser.add_argument("--images", required=True, type=Path, help="Directory of extracted frames (*.jpg)")
+    parser.add_argument("--quality", default="medium", choices=["low", "medium", "high"])
+    parser.add_argument("--profiles", default="cpu,gpu", help="Comma-separated: cpu, gpu")
+    parser.add_argument("--map", action="store_true", help="Also run sparse reconstruction")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    if "gpu" in profiles and not gpu_available():
+        print("No usable GPU, skipping the gpu profile")
+        profiles.remove("gpu")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="sift-profiles-"))
+    try:
+        results = [run_profile(args.images, args.quality, p == "gpu", args.map, work_dir) for p in profiles]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    columns = [key for key in results[0] if key not in ("profile", "quality")] if results else []
+    print(f"{'profile':<8}" + "".join(f"{c:>24}" for c in columns))
+    for result in results:
+        print(f"{result['profile']:<8}" + "".join(f"{str(result.get(c)):>24}" for c in columns))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
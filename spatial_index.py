@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Uniform Grid Spatial Index for Point Clouds
+Points are bucketed into cubic cells and stored sorted by cell, with a CSR
+table (cell key -> first point) for lookups. Neighbour queries scan the
+cells around each query point, fully vectorized over a batch of queries.
+
+The index is built once per point cloud and cached next to the PLY in
+{name}.gridindex/ as .npy files. Worker processes memory-map those files
+instead of receiving the arrays through pickling, so a process pool can
+answer batches of queries in parallel.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from resource_planner import thread_budget
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+TARGET_POINTS_PER_CELL = 8     # Cell size is tuned towards this occupancy
+QUERY_BATCH_POINTS = 65536     # Query points per pool task
+MAX_BATCH_CELLS = 2_000_000    # (query, cell) lookups held in memory at once
+MAX_TABLE_ENTRIES = 4_000_000  # Distances held per block of cells
+INDEX_ARRAYS = ("points", "order", "cell_keys", "cell_starts")
+
+_OPEN_INDEXES: Dict[str, "GridIndex"] = {}   # Per-process cache used by pool workers
+
+
+def _source_fingerprint(source: Path) -> Dict:
+    st = Path(source).stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _cell_size_for(xyz: np.ndarray) -> float:
+    """
+    Cell edge giving roughly TARGET_POINTS_PER_CELL points per occupied cell
+    Starts from a volumetric guess and corrects it from the measured
+    occupancy (reconstructions are mostly surfaces, so occupancy ~ size^2).
+    """
+    extent = float((xyz.max(axis=0) - xyz.min(axis=0)).max()) or 1.0
+    cell_size = extent / max(len(xyz) / TARGET_POINTS_PER_CELL, 1.0) ** (1 / 3)
+    for _ in range(3):
+        cells = np.floor((xyz - xyz.min(axis=0)) / cell_size).astype(np.int64)
+        dims = cells.max(axis=0) + 1
+        occupied = len(np.unique((cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]))
+        per_cell = len(xyz) / occupied
+        if 0.5 * TARGET_POINTS_PER_CELL <= per_cell <= 2 * TARGET_POINTS_PER_CELL:
+            break
+        cell_size *= (TARGET_POINTS_PER_CELL / per_cell) ** 0.5
+    return cell_size
+
+
+class GridIndex:
+    """
+    Grid index over N points
+
+    points: (N, 3) float64 sorted by cell; order[i] is the original index
+    of points[i]; cell_keys (sorted) / cell_starts give each occupied cell's
+    slice of points.
+    """
+
+    def __init__(self, meta: Dict, arrays: Dict[str, np.ndarray]):
+        self.meta = meta
+        self.cell_size = meta["cell_size"]
+        self.origin = np.array(meta["origin"])
+        self.dims = np.array(meta["dims"], dtype=np.int64)
+        self.points = arrays["points"]
+        self.order = arrays["order"]
+        self.cell_keys = arrays["cell_keys"]
+        self.cell_starts = arrays["cell_starts"]
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @classmethod
+    def build(cls, xyz: np.ndarray, cell_size: Optional[float] = None) -> "GridIndex":
+        xyz = np.asarray(xyz, dtype=np.float64)
+        if len(xyz) == 0:
+            raise ValueError("Cannot index an empty point cloud")
+        cell_size = cell_size or _cell_size_for(xyz)
+        origin = xyz.min(axis=0)
+        dims = np.floor((xyz.max(axis=0) - origin) / cell_size).astype(np.int64) + 1
+        if float(dims[0]) * float(dims[1]) * float(dims[2]) >= 2 ** 62:
+            raise ValueError(f"Cell size {cell_size} is too small for this point cloud")
+        meta = {"version": INDEX_VERSION, "cell_size": cell_size, "origin": origin.tolist(), "dims": dims.tolist()}
+
+        index = cls(meta, {"points": xyz, "order": None, "cell_keys": None, "cell_starts": None})
+        keys = index.cell_key(index.cell_of(xyz))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        cell_keys, cell_starts = np.unique(sorted_keys, return_index=True)
+
+        index.points = xyz[order]
+        index.order = order
+        index.cell_keys = cell_keys
+        index.cell_starts = np.append(cell_starts, len(xyz)).astype(np.int64)
+        meta["num_points"] = len(xyz)
+        meta["num_cells"] = len(cell_keys)
+        return index
+
+    def cell_of(self, xyz: np.ndarray) -> np.ndarray:
+        cells = np.floor((xyz - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.dims - 1)
+
+    def cell_key(self, cells: np.ndarray) -> np.ndarray:
+        return (cells[..., 0] * self.dims[1] + cells[..., 1]) * self.dims[2] + cells[..., 2]
+
+    # Cache on disk
+
+    def save(self, index_dir: Path, source: Path):
+        """Write the index into index_dir (replaced atomically)"""
+        index_dir = Path(index_dir)
+        work_dir = index_dir.with_name(index_dir.name + ".tmp")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        for name in INDEX_ARRAYS:
+            np.save(work_dir / f"{name}.npy", getattr(self, name))
+        with open(work_dir / "meta.json", "w") as f:
+            json.dump({**self.meta, "source": _source_fingerprint(source)}, f)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(work_dir, index_dir)
+
+    @classmethod
+    def load(cls, index_dir: Path, source: Optional[Path] = None) -> Optional["GridIndex"]:
+        """Memory-map a cached index (None if missing, stale or unreadable)"""
+        index_dir = Path(index_dir)
+        try:
+            with open(index_dir / "meta.json") as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION:
+                return None
+            if source is not None and meta.get("source") != _source_fingerprint(source):
+                return None
+            arrays = {name: np.load(index_dir / f"{name}.npy", mmap_mode="r") for name in INDEX_ARRAYS}
+        except (OSError, ValueError):
+            return None
+        return cls(meta, arrays)
+
+    # Queries
+
+    def _candidates(self, cells: np.ndarray, ring: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (owner, point index) pairs for every point in the (2 * ring + 1)^3
+        cells around each of the given integer cell coordinates, grouped by owner
+        """
+        span = np.arange(-ring, ring + 1)
+        offsets = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+        neighbours = cells[:, None, :] + offsets
+        valid = np.all((neighbours >= 0) & (neighbours < self.dims), axis=-1)
+        keys = self.cell_key(neighbours)
+
+        slots = np.searchsorted(self.cell_keys, keys)
+        slots = np.minimum(slots, len(self.cell_keys) - 1)
+        found = valid & (self.cell_keys[slots] == keys)
+        starts = np.where(found, self.cell_starts[slots], 0).ravel()
+        counts = np.where(found, self.cell_starts[slots + 1] - self.cell_starts[slots], 0).ravel()
+
+        owners = np.repeat(np.repeat(np.arange(len(cells)), len(offsets)), counts)
+        return owners, _expand_runs(starts, counts)
+
+    def _own_cell_offsets(self, cells: np.ndarray, ring: int) -> np.ndarray:
+        """Position of each cell's own points within its _candidates list"""
+        span = np.arange(-ring, ring + 1)
+        offsets = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+        before = offsets[:len(offsets) // 2]   # Offsets ordered before (0, 0, 0)
+        neighbours = cells[:, None, :] + before
+        valid = np.all((neighbours >= 0) & (neighbours < self.dims), axis=-1)
+        keys = self.cell_key(neighbours)
+        slots = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = valid & (self.cell_keys[slots] == keys)
+        return np.where(found, self.cell_starts[slots + 1] - self.cell_starts[slots], 0).sum(axis=1)
+
+    def _batches(self, count: int, ring: int) -> List[slice]:
+        size = max(1, MAX_BATCH_CELLS // (2 * ring + 1) ** 3)
+        return [slice(start, min(start + size, count)) for start in range(0, count, size)]
+
+    def _blocks(self, ids: np.ndarray, ring: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Distances from query points to their candidates, one block of cells at a time
+
+        Queries in the same cell share one candidate list, so each block is
+        a dense (cells, queries per cell, candidates per cell) distance
+        array computed with a batched matmul. Cells are grouped by size to
+        keep padding small. Yields (positions, d2): positions index into ids
+        (-1 = padding); d2 is inf for padding and for the query point itself.
+        """
+        cell_of_id = np.searchsorted(self.cell_starts, ids, side="right") - 1
+        by_cell = np.argsort(cell_of_id, kind="stable")
+        cells, first, sizes = np.unique(cell_of_id[by_cell], return_index=True, return_counts=True)
+        keys = self.cell_keys[cells]
+        coords = np.stack([keys // (self.dims[1] * self.dims[2]), keys // self.dims[2] % self.dims[1], keys % self.dims[2]], axis=1)
+        owners, candidates = self._candidates(coords, ring)
+        own_offsets = self._own_cell_offsets(coords, ring)
+        candidate_counts = np.bincount(owners, minlength=len(cells))
+        candidate_first = np.cumsum(candidate_counts) - candidate_counts
+
+        order = np.lexsort((candidate_counts, sizes))
+        start = 0
+        while start < len(order):
+            # Largest run of cells whose padded block fits in MAX_TABLE_ENTRIES
+            rest = order[start:]
+            width = np.maximum.accumulate(candidate_counts[rest]) * sizes[rest]
+            stop = start + max(1, int(np.searchsorted(width * np.arange(1, len(rest) + 1), MAX_TABLE_ENTRIES, side="right")))
+            block = order[start:stop]
+            start = stop
+
+            rows = np.repeat(np.arange(len(block)), sizes[block])
+            positions = np.full((len(block), int(sizes[block].max())), -1, dtype=np.int64)
+            positions[rows, _expand_runs(np.zeros(len(block), dtype=np.int64), sizes[block])] = \
+                by_cell[_expand_runs(first[block], sizes[block])]
+            rows = np.repeat(np.arange(len(block)), candidate_counts[block])
+            neighbours = np.full((len(block), max(int(candidate_counts[block].max()), 1)), -1, dtype=np.int64)
+            neighbours[rows, _expand_runs(np.zeros(len(block), dtype=np.int64), candidate_counts[block])] = \
+                candidates[_expand_runs(candidate_first[block], candidate_counts[block])]
+
+            real = positions >= 0
+            query_ids = np.where(real, ids[np.maximum(positions, 0)], 0)
+            # |q - c|^2 = |q|^2 + |c|^2 - 2 q.c on coordinates relative to the
+            # cell corner (small values keep the expansion precise)
+            corner = self.origin + coords[block] * self.cell_size
+            q = self.points.take(query_ids, axis=0) - corner[:, None, :]
+            c = self.points.take(np.maximum(neighbours, 0), axis=0) - corner[:, None, :]
+            c_norms = np.einsum("bij,bij->bi", c, c)
+            c_norms[neighbours < 0] = np.inf   # Padding columns
+            d2 = np.matmul(q, c.transpose(0, 2, 1) * -2)
+            d2 += np.einsum("bij,bij->bi", q, q)[:, :, None]
+            d2 += c_norms[:, None, :]
+            # Each query's own column: its cell's run in the list + its rank in the cell
+            self_column = own_offsets[block][:, None] + query_ids - self.cell_starts[cells[block]][:, None]
+            rows, columns = np.nonzero(real)
+            d2[rows, columns, self_column[rows, columns]] = np.inf
+            yield positions, d2
+
+    def knn_mean_distance(self, query_ids: np.ndarray, k: int) -> np.ndarray:
+        """
+        Mean distance from each indexed point (positions into self.points)
+        to its k nearest other points
+
+        The search ring grows until the k-th neighbour is provably inside
+        it (k-th distance <= ring * cell_size), so results are exact.
+        """
+        k = min(k, len(self) - 1)
+        result = np.zeros(len(query_ids))
+        if k <= 0:
+            return result
+        pending = np.arange(len(query_ids))
+        ring = 1
+        max_ring = int(self.dims.max())
+        while len(pending):
+            unresolved = []
+            for batch in self._batches(len(pending), ring):
+                batch_positions = pending[batch]
+                for positions, d2 in self._blocks(query_ids[batch_positions], ring):
+                    if d2.shape[2] < k:
+                        d2 = np.concatenate([d2, np.full(d2.shape[:2] + (k - d2.shape[2],), np.inf)], axis=2)
+                    nearest = np.partition(d2, k - 1, axis=2)[:, :, :k]
+                    real = positions >= 0
+                    nearest, positions = nearest[real], batch_positions[positions[real]]
+
+                    kth = nearest.max(axis=1)
+                    resolved = (kth <= (ring * self.cell_size) ** 2) | (ring >= max_ring)
+                    finite = np.isfinite(nearest)
+                    distances = np.sqrt(np.where(finite, np.maximum(nearest, 0), 0)).sum(axis=1)
+                    result[positions[resolved]] = distances[resolved] / np.maximum(finite.sum(axis=1), 1)[resolved]
+                    unresolved.append(positions[~resolved])
+            pending = np.concatenate(unresolved)
+            ring = min(ring * 2, max_ring)
+        return result
+
+    def radius_count(self, query_ids: np.ndarray, radius: float) -> np.ndarray:
+        """Number of other indexed points within radius of each query point"""
+        ring = max(1, int(np.ceil(radius / self.cell_size)))
+        result = np.zeros(len(query_ids), dtype=np.int64)
+        for batch in self._batches(len(query_ids), ring):
+            for positions, d2 in self._blocks(query_ids[batch], ring):
+                real = positions >= 0
+                result[batch.start + positions[real]] = (d2 <= radius * radius).sum(axis=2)[real]
+        return result
+
+
+def _expand_runs(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of the ranges [start, start + count)"""
+    run_offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - run_offsets, counts) + np.arange(int(counts.sum()))
+
+
+def load_or_build_index(source: Path, xyz: np.ndarray) -> Tuple[GridIndex, Path]:
+    """Cached index of a point cloud file (rebuilt when the file changed)"""
+    source = Path(source)
+    index_dir = source.with_name(source.name + ".gridindex")
+    index = GridIndex.load(index_dir, source)
+    if index is None:
+        index = GridIndex.build(xyz)
+        index.save(index_dir, source)
+        logger.info(f"Built grid index for {source} ({len(index)} points, {index.meta['num_cells']} cells, "
+                    f"cell size {index.cell_size:.4g})")
+        # Reopen memory-mapped so pool workers and this process share the page cache
+        index = GridIndex.load(index_dir)
+    return index, index_dir
+
+
+def _query_worker(index_dir: str, mode: str, start: int, end: int, param: float) -> np.ndarray:
+    """Pool task: answer one contiguous range of indexed points"""
+    index = _OPEN_INDEXES.get(index_dir)
+    if index is None:
+        index = _OPEN_INDEXES[index_dir] = GridIndex.load(Path(index_dir))
+    query_ids = np.arange(start, end)
+    if mode == "knn":
+        return index.knn_mean_distance(query_ids, int(param))
+    return index.radius_count(query_ids, param)
+
+
+def query_all(index_dir: Path, num_points: int, mode: str, param: float,
+              max_workers: Optional[int] = None) -> np.ndarray:
+    """
+    Run a query ("knn": mean k-NN distance, "radius": neighbour count) for
+    every indexed point across a process pool (sized by the resource
+    planner's thread budget by default); results are in index order
+    """
+    ranges = [(start, min(start + QUERY_BATCH_POINTS, num_points)) for start in range(0, num_points, QUERY_BATCH_POINTS)]
+    max_workers = min(max_workers or thread_budget(), len(ranges) or 1)
+    if max_workers == 1 or len(ranges) <= 1:
+        return np.concatenate([_query_worker(str(index_dir), mode, start, end, param) for start, end in ranges] or [np.empty(0)])
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_query_worker, str(index_dir), mode, start, end, param) for start, end in ranges]
+        return np.concatenate([future.result() for future in futures])
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Pooled SQLite Access for the Application Database
+main.py and database.py borrow connections from one pool per database
+file instead of opening a new connection per call. Pooled connections
+are long-lived and tuned once:
+
+- journal_mode=WAL: readers (status polling) never wait for a writer
+  (job progress updates), and a writer never waits for readers
+- synchronous=NORMAL: WAL is only fsynced at checkpoints; durable
+  across application crashes, at most the last commits lost on power loss
+- cache_size / mmap_size: hot pages stay in memory across requests
+- busy_timeout: writers queue for the lock instead of failing at once
+
+Callers keep the usual sqlite3 pattern: conn.close() returns the
+connection to the pool (rolling back anything left uncommitted).
+
+AsyncConnectionPool is the same for the FastAPI event loop: aiosqlite
+connections (each runs its queries on its own thread), so request
+handlers await database access instead of blocking the loop.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "4"))                     # Idle connections kept per database
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_MB", "32")) * 1024          # Page cache per connection
+MMAP_SIZE_BYTES = int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 ** 2   # Memory-mapped I/O window
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))     # Wait for locks this long
+
+
+# Per-connection settings (journal_mode=WAL persists in the file once set)
+PRAGMAS = [
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    f"cache_size=-{CACHE_SIZE_KB}",
+    f"mmap_size={MMAP_SIZE_BYTES}",
+    f"busy_timeout={BUSY_TIMEOUT_MS}",
+    "temp_store=MEMORY",
+]
+
+
+def configure(conn: sqlite3.Connection):
+    for pragma in PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+
+
+class PooledConnection:
+    """sqlite3.Connection proxy whose close() hands the connection back to its pool"""
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        # Same semantics as sqlite3.Connection: commit on success, rollback on error
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __del__(self):
+        # A caller that never closed still returns the connection
+        self.close()
+
+
+class ConnectionPool:
+    """Up to `size` idle connections to one database file, shared by all threads"""
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE):
+        self.db_path = str(db_path)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=max(size, 1))
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        configure(conn)
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """An idle connection, or a new one when all are in use"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # Never hand out a connection in the middle of someone's transaction
+            conn.row_factory = sqlite3.Row
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools: Dict[Tuple[int, str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """The pool for a database file in this process (worker processes get their own)"""
+    key = (os.getpid(), str(Path(db_path).resolve()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+
+def connect(db_path: str) -> PooledConnection:
+    """Borrow a configured connection; close() returns it"""
+    return get_pool(db_path).acquire()
+
+
+class AsyncConnectionPool:
+    """Up to `size` aiosqlite connections to one database file, for one event loop"""
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE):
+        self.db_path = str(db_path)
+        self.size = max(size, 1)
+        self._idle: "asyncio.LifoQueue[aiosqlite.Connection]" = asyncio.LifoQueue()
+        self._opened = 0
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            await conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Borrow a connection (opened on demand up to size, then waited for)
+        A transaction still open when the block exits is rolled back.
+        """
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                conn = await self._connect()
+            except BaseException:
+                self._opened -= 1
+                raise
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction:
+                    await conn.rollback()
+                self._idle.put_nowait(conn)
+            except sqlite3.Error:
+                self._opened -= 1
+                await conn.close()
+
+    async def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> List[Dict]:
+        # execute_fetchall: one round trip to the connection thread instead of three
+        async with self.connection() as conn:
+            return [dict(row) for row in await conn.execute_fetchall(sql, params)]
+
+    async def fetch_one(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict]:
+        rows = await self.fetch_all(sql, params)
+        return rows[0] if rows else None
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Run one write statement in its own transaction; returns the rowcount"""
+        async with self.connection() as conn:
+            cursor = await conn.execute(sql, params)
+            await conn.commit()
+            return cursor.rowcount
+
+    async def close_all(self):
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+            self._opened -= 1
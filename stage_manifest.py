@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Per-job Pipeline Stage Manifest
+Checkpoints each pipeline stage in {job_path}/stages.json so a rerun
+resumes from the first stage that is missing, failed or out of date.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageManifest:
+    """
+    Records, per stage:
+    - input_hash: parameters + the upstream stage's output_hash
+    - outputs / output_hash: artifacts relative to the job directory and
+      their size/mtime fingerprint when the stage completed (or the
+      stage's own fingerprint, for outputs a later stage also writes)
+    - status, timings and the stage's result dict
+
+    Because each input_hash includes the upstream output_hash, rerunning
+    any stage automatically invalidates everything downstream of it.
+    """
+
+    FILENAME = "stages.json"
+
+    def __init__(self, job_path: str):
+        self.job_path = Path(job_path)
+        self.path = self.job_path / self.FILENAME
+        self.stages: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("stages", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable stage manifest {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """Write the manifest atomically (temp file + rename)"""
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"stages": self.stages}, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    def input_hash(self, params: Dict, upstream: Optional[str] = None) -> str:
+        """Hash of a stage's parameters and its upstream stage's artifacts"""
+        upstream_hash = self.stages.get(upstream, {}).get("output_hash") if upstream else None
+        payload = json.dumps({"params": params, "upstream": upstream_hash}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def fingerprint(self, outputs: List[str]) -> str:
+        """Cheap fingerprint of output files/directories (path, size, mtime)"""
+        sha256 = hashlib.sha256()
+        for output in sorted(outputs):
+            path = self.job_path / output
+            files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+            for file_path in files:
+                if not file_path.exists():
+                    continue
+                st = file_path.stat()
+                sha256.update(f"{file_path.relative_to(self.job_path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        return sha256.hexdigest()
+
+    def is_valid(self, stage: str, input_hash: str, fingerprint: Optional[Callable[[], str]] = None) -> bool:
+        """
+        True if the stage completed with these inputs and its outputs are
+        unchanged since (fingerprint(), by default the outputs' files)
+        """
+        entry = self.stages.get(stage)
+        if not entry or entry.get("status") != "completed" or entry.get("input_hash") != input_hash:
+            return False
+        outputs = entry.get("outputs", [])
+        if not all((self.job_path / output).exists() for output in outputs):
+            return False
+        current = fingerprint() if fingerprint else self.fingerprint(outputs)
+        return current == entry.get("output_hash")
+
+    def result(self, stage: str) -> Dict:
+        """Result dict recorded when the stage completed"""
+        return self.stages.get(stage, {}).get("result", {})
+
+    def mark_started(self, stage: str, input_hash: str):
+        self.stages[stage] = {
+            "status": "running",
+            "input_hash": input_hash,
+            "started_at": time.time()
+        }
+        self.save()
+
+    def mark_completed(self, stage: str, input_hash: str, outputs: List[str], result: Dict,
+                       fingerprint: Optional[Callable[[], str]] = None):
+        entry = self.stages.get(stage, {})
+        completed_at = time.time()
+        entry.update({
+            "status": "completed",
+            "input_hash": input_hash,
+            "outputs": outputs,
+            "output_hash": fingerprint() if fingerprint else self.fingerprint(outputs),
+            "result": result,
+            "completed_at": completed_at,
+            "duration_seconds": round(completed_at - entry.get("started_at", completed_at), 3)
+        })
+        self.stages[stage] = entry
+        self.save()
+
+    def mark_failed(self, stage: str, input_hash: str, error: str):
+        entry = self.stages.get(stage, {})
+        entry.update({
+            "status": "failed",
+            "input_hash": input_hash,
+            "error": error,
+            "failed_at": time.time()
+        })
+        entry.pop("output_hash", None)
+        self.stages[stage] = entry
+        self.save()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Video Metadata Probe
+One ffprobe call per upload: duration, frame rate, frame count, rotation
+and resolution. The result is cached next to the video ({video}.probe.json)
+and reused as long as the file's size and mtime are unchanged.
+"""
+
+import json
+import logging
+import os
+import subprocess
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROBE_VERSION = 1
+PROBE_SUFFIX = ".probe.json"
+
+
+def _rate(value: Optional[str]) -> float:
+    """ffprobe rational ("30000/1001") as float; 0.0 if missing or invalid"""
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+    return float(rate) if rate > 0 else 0.0
+
+
+def _rotation(stream: Dict) -> int:
+    """Display rotation in degrees (0, 90, 180, 270) from the display matrix or rotate tag"""
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(round(-float(side_data["rotation"]))) % 360
+    try:
+        return int(stream.get("tags", {}).get("rotate", 0)) % 360
+    except ValueError:
+        return 0
+
+
+def _run_ffprobe(video_path: str) -> Dict:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries",
+         "stream=width,height,codec_name,r_frame_rate,avg_frame_rate,nb_frames,duration"
+         ":stream_tags=rotate:stream_side_data=rotation:format=duration",
+         "-of", "json", video_path],
+        capture_output=True, text=True, check=True
+    )
+    info = json.loads(result.stdout)
+    if not info.get("streams"):
+        raise ValueError(f"{video_path} has no video stream")
+    stream = info["streams"][0]
+
+    fps = _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate"))
+    duration = float(info.get("format", {}).get("duration") or stream.get("duration") or 0.0)
+    try:
+        frame_count = int(stream.get("nb_frames") or 0)
+    except ValueError:
+        frame_count = 0
+    if not frame_count and duration and fps:
+        frame_count = int(round(duration * fps))
+    if not duration and frame_count and fps:
+        duration = frame_count / fps
+
+    rotation = _rotation(stream)
+    coded_width, coded_height = int(stream["width"]), int(stream["height"])
+    # ffmpeg auto-rotates decoded frames, so width/height are the displayed size
+    width, height = (coded_height, coded_width) if rotation in (90, 270) else (coded_width, coded_height)
+    return {
+        "width": width,
+        "height": height,
+        "coded_width": coded_width,
+        "coded_height": coded_height,
+        "rotation": rotation,
+        "duration": duration,
+        "fps": round(fps, 6),
+        "frame_count": frame_count,
+        "codec": stream.get("codec_name"),
+    }
+
+
+def probe_video(video_path: str, use_cache: bool = True) -> Dict:
+    """
+    Metadata of the first video stream (see module docstring)
+    Returns width/height (as displayed), coded_width/coded_height, rotation,
+    duration (s), fps, frame_count and codec.
+    """
+    stat = os.stat(video_path)
+    fingerprint = {"version": PROBE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    cache_path = Path(f"{video_path}{PROBE_SUFFIX}")
+
+    if use_cache:
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get("source") == fingerprint:
+                return cached["info"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    info = _run_ffprobe(video_path)
+    try:
+        tmp_path = Path(f"{cache_path}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"source": fingerprint, "info": info}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache probe result for {video_path}: {e}")
+    logger.info(f"Probed {video_path}: {info['width']}x{info['height']}, {info['duration']:.2f}s "
+                f"at {info['fps']} fps, rotation {info['rotation']}")
+    return info